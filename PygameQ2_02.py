@@ -1,19 +1,48 @@
 import pygame
-import sys
+import argparse
+import os
 import random
-
-# Initialize Pygame and the mixer for sound
-pygame.init()
-pygame.mixer.init()
-
-# Load the background music
-pygame.mixer.music.load('/Users/alesa/Desktop/Assignments3_Q2/assets/background_music.mp3') 
-pygame.mixer.music.play(-1)  # Play the music indefinitely
+import time
+
+import collision
+from assets import AssetManager
+from scenes import MenuScene, PauseScene, Scene, SceneManager, TransitionScene
+from enemy_system import BEHAVIOURS, BOSS, EnemySprite, EnemySystem
+from frame_profiler import FrameProfiler
+from hud import Hud
+from input_log import InputLog
+from levels import LevelStream
+import projectiles
+import rendering
+
+# Assets are found next to this file, in the unpacked Assignments3_Q2 folder or in Assignments3_Q2.zip,
+# see assets.py
+GAME_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKGROUND_IMAGE = "background.png"
+BACKGROUND_MUSIC = "assets/background_music.mp3"
+assets = AssetManager(GAME_DIR)
+# the levels in the order they are played, see levels.py for the file format
+LEVEL_DIR = os.path.join(GAME_DIR, "levels")
+LEVEL_FILES = [os.path.join(LEVEL_DIR, f"level{level}.level") for level in (1, 2, 3)]
 
 # Constants
 SCREEN_WIDTH = 800
 SCREEN_HEIGHT = 600
 FPS = 60
+# The simulation runs in fixed ticks of TICK_MS, independent of the frame rate: every frame runs the ticks
+# that are due (at most MAX_CATCH_UP_TICKS, a longer backlog is dropped and the game slows down instead of
+# freezing) and draws the sprites between their last two positions. Speeds, gravity and tick counts are
+# given for BASE_TICK_RATE and scaled by set_tick_rate, so a lower tick rate (e.g. 30 on weak hardware)
+# keeps the speed of the game. Positions are kept with sub-pixel precision and only rounded into the rects,
+# jumps follow the same arc at every rate and durations carry the fraction of a tick they were cut short.
+BASE_TICK_RATE = 60
+TICK_RATE = BASE_TICK_RATE
+TICK_MS = 1000 / TICK_RATE
+# movement per tick relative to BASE_TICK_RATE
+TICK_SCALE = 1.0
+MAX_CATCH_UP_TICKS = 5
+# a longer frame (e.g. the window was dragged) counts as this long
+MAX_FRAME_MS = 250
 
 # Colors
 WHITE = (255, 255, 255)
@@ -22,17 +51,88 @@ RED = (255, 0, 0)
 GREEN = (0, 255, 0)
 BLUE = (0, 0, 255)
 
-# Set up the display
-screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-pygame.display.set_caption("Side-Scrolling Game")
-clock = pygame.time.Clock()
-
-# Fonts
-font = pygame.font.SysFont('comicsans', 30)
-
-# Load the background image
-background_image = pygame.image.load("/Users/alesa/Desktop/Assignments3_Q2/background.png").convert()
-background_width = background_image.get_width()
+# damage to the player when an enemy or the boss touches it, and the ticks without damage after a hit
+ENEMY_CONTACT_DAMAGE = 10
+BOSS_CONTACT_DAMAGE = 20
+INVULNERABLE_TICKS = 30
+
+# Display, clock, font and background are created by init_game, not at import time,
+# so the game can be imported and run headless (see game_bench.py)
+screen = None
+renderer = None
+clock = None
+font = None
+# score, lives and level panel, health bars and the cached text of all scenes, see hud.py
+hud = None
+# frame time overlay (F3) and trace export (F4), see frame_profiler.py
+profiler = None
+background_image = None
+background_width = SCREEN_WIDTH * 2
+# the streamed chunks of the current level and its width in pixels
+level_stream = None
+level_width = SCREEN_WIDTH * 2
+# drives the scenes (play, transitions, menu, pause) when the game runs in a window, see scenes.py.
+# Without it (headless benchmarks) levels change at once and game_completed is set after the last level.
+scene_manager = None
+game_completed = False
+# every random decision of the game comes from rng, seeded by new_game, so a session can be replayed
+rng = random.Random()
+game_seed = None
+# with a path, the input of every game is recorded to this file (see input_log.py and replay.py)
+RECORD_PATH = None
+input_log = None
+# how long the transition messages are shown, in milliseconds
+LEVEL_START_MS = 2000
+LEVEL_COMPLETE_MS = 3000
+
+# Initialize Pygame, the display and the assets. With headless=True the SDL dummy video and audio
+# drivers are used, so no window, display or sound card is needed.
+def init_game(headless=False):
+    global screen, renderer, clock, font, hud, profiler, background_image, background_width
+    if screen is not None:
+        return
+    if headless:
+        os.environ["SDL_VIDEODRIVER"] = "dummy"
+        os.environ["SDL_AUDIODRIVER"] = "dummy"
+    pygame.init()
+
+    # Set up the display
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    pygame.display.set_caption("Side-Scrolling Game")
+    clock = pygame.time.Clock()
+
+    # Fonts
+    font = pygame.font.SysFont('comicsans', 30)
+    hud = Hud(screen, font)
+    profiler = FrameProfiler(pygame.font.SysFont('monospace', 16))
+
+    # Load the background image (from the on-disk cache after the first launch),
+    # a plain two-screen-wide background is used if the file is missing
+    try:
+        background_image = assets.background(BACKGROUND_IMAGE)
+    except FileNotFoundError:
+        background_image = pygame.Surface((SCREEN_WIDTH * 2, SCREEN_HEIGHT)).convert()
+        background_image.fill((40, 40, 80))
+    background_width = background_image.get_width()
+
+    # draws through the camera and only redraws what changed while the camera stands still, see rendering.py
+    renderer = rendering.Renderer(screen, background_image)
+
+    # Initialize the mixer and play the background music indefinitely, the game also runs without it
+    if not headless:
+        try:
+            pygame.mixer.init()
+            pygame.mixer.music.load(assets.music(BACKGROUND_MUSIC), "mp3")
+            pygame.mixer.music.play(-1)
+        except (pygame.error, FileNotFoundError) as error:
+            print(f"Background music disabled: {error}")
+
+# Run the simulation at rate ticks per second, call before new_game
+def set_tick_rate(rate):
+    global TICK_RATE, TICK_MS, TICK_SCALE
+    TICK_RATE = rate
+    TICK_MS = 1000 / rate
+    TICK_SCALE = BASE_TICK_RATE / rate
 
 # Camera class for dynamic camera
 class Camera:
@@ -53,16 +153,23 @@ class Camera:
         y = max(-(self.height - SCREEN_HEIGHT), y)  # Bottom boundary
         self.camera = pygame.Rect(x, y, self.width, self.height)
 
+    # the part of the level that is on the screen
+    def view(self):
+        return pygame.Rect(-self.camera.x, -self.camera.y, SCREEN_WIDTH, SCREEN_HEIGHT)
+
 # Player class
 class Player(pygame.sprite.Sprite):
     def __init__(self):
         super().__init__()
-        self.image = pygame.Surface((50, 50))
-        self.image.fill(GREEN)
+        # sprites of one kind share their surface, see assets.py
+        self.image = assets.solid_surface((50, 50), GREEN)
         self.rect = self.image.get_rect()
-        self.rect.x = 100
-        self.rect.y = SCREEN_HEIGHT - 150
-        self.speed = 5
+        # the position with sub-pixel precision, the rect is the rounded position
+        self.pos_x = 100.0
+        self.pos_y = SCREEN_HEIGHT - 150.0
+        self.rect.topleft = (round(self.pos_x), round(self.pos_y))
+        self.speed = 5 * TICK_SCALE
+        # jump speed, gravity and velocity_y are in pixels per BASE_TICK_RATE tick
         self.jump_speed = 15
         self.gravity = 0.8
         self.velocity_y = 0
@@ -70,10 +177,13 @@ class Player(pygame.sprite.Sprite):
         self.health = 100
         self.lives = 3
         self.score = 0
+        # BASE_TICK_RATE ticks left without damage
+        self.invulnerable_ticks = 0
 
     def move(self, dx, dy):
-        self.rect.x += dx
-        self.rect.y += dy
+        self.pos_x += dx
+        self.pos_y += dy
+        self.rect.topleft = (round(self.pos_x), round(self.pos_y))
 
     def jump(self):
         if not self.is_jumping:
@@ -81,48 +191,43 @@ class Player(pygame.sprite.Sprite):
             self.velocity_y = -self.jump_speed
 
     def update(self):
-        self.velocity_y += self.gravity
-        self.rect.y += self.velocity_y
-        if self.rect.y >= SCREEN_HEIGHT - 150:
-            self.rect.y = SCREEN_HEIGHT - 150
+        # the arc of v += gravity; y += v per BASE_TICK_RATE tick, integrated exactly over TICK_SCALE of them,
+        # so every tick rate samples the same jump
+        dt = TICK_SCALE
+        self.pos_y += self.velocity_y * dt + self.gravity * dt * (dt + 1) / 2
+        self.velocity_y += self.gravity * dt
+        if self.pos_y >= SCREEN_HEIGHT - 150:
+            self.pos_y = SCREEN_HEIGHT - 150.0
             self.velocity_y = 0
             self.is_jumping = False
+        self.rect.y = round(self.pos_y)
 
         if self.health <= 0:
             self.lives -= 1
             self.health = 100
 
-    def shoot(self):
-        bullet = Projectile(self.rect.centerx, self.rect.y, RED, 10)
-        bullets.add(bullet)
+        if self.invulnerable_ticks > 0:
+            self.invulnerable_ticks = max(0, self.invulnerable_ticks - TICK_SCALE)
 
-    def draw_health_bar(self):
-        pygame.draw.rect(screen, RED, (self.rect.x, self.rect.y - 10, 50, 10))
-        pygame.draw.rect(screen, GREEN, (self.rect.x, self.rect.y - 10, 50 * (self.health / 100), 10))
+    # damage from touching an enemy, ignored for a short time after the last hit
+    def take_damage(self, damage):
+        if self.invulnerable_ticks == 0:
+            self.health -= damage
+            self.invulnerable_ticks = INVULNERABLE_TICKS
 
-# Projectile class
-class Projectile(pygame.sprite.Sprite):
-    def __init__(self, x, y, color, damage):
-        super().__init__()
-        self.image = pygame.Surface((10, 5))
-        self.image.fill(color)
-        self.rect = self.image.get_rect()
-        self.rect.x = x
-        self.rect.y = y
-        self.speed = 10
-        self.damage = damage
+    # bullets are slots in the projectile manager, see projectiles.py; holding SPACE fires at the cooldown rate
+    def shoot(self):
+        bullets.fire(self.rect.centerx, self.rect.y, 10)
 
-    def update(self):
-        self.rect.x += self.speed
-        if self.rect.x > SCREEN_WIDTH:
-            self.kill()
+    # (width, filled width) of the health bar, the HUD draws the bars from cached surfaces, see hud.py
+    def health_bar(self):
+        return 50, int(50 * (self.health / 100))
 
 # Collectible class
 class Collectible(pygame.sprite.Sprite):
     def __init__(self, x, y, type):
         super().__init__()
-        self.image = pygame.Surface((30, 30))
-        self.image.fill(BLUE)
+        self.image = assets.solid_surface((30, 30), BLUE)
         self.rect = self.image.get_rect()
         self.rect.x = x
         self.rect.y = y
@@ -137,37 +242,20 @@ class Collectible(pygame.sprite.Sprite):
             player.lives += 1
         self.kill()
 
-# Enemy class
-class Enemy(pygame.sprite.Sprite):
-    def __init__(self, x, y):
+# Enemy class. Position, speed, direction and health live in the enemy system (see enemy_system.py),
+# which moves all enemies at once; the sprite is used for collisions and drawing.
+# movement_type is "patrol" or "follow" (random if None), a patrolling enemy walks within patrol_range.
+class Enemy(EnemySprite):
+    def __init__(self, x, y, movement_type=None, patrol_range=None):
         super().__init__()
-        self.image = pygame.Surface((50, 50))
-        self.image.fill(RED)
+        self.image = assets.solid_surface((50, 50), RED)
         self.rect = self.image.get_rect()
         self.rect.x = x
         self.rect.y = y
-        self.speed = 2
-        self.health = 150  # Increased health to make enemies harder to defeat
-        self.movement_type = random.choice(["patrol", "follow"])
-        self.direction = 1
-
-    def take_damage(self, damage):
-        self.health -= damage
-        if self.health <= 0:
-            player.score += 100
-            self.kill()
-
-    def move(self, player):
-        if self.movement_type == "patrol":
-            self.rect.x += self.speed * self.direction
-            if self.rect.x >= SCREEN_WIDTH - 50 or self.rect.x <= 0:
-                self.direction *= -1
-        elif self.movement_type == "follow":
-            if abs(self.rect.x - player.rect.x) < 200:
-                if player.rect.x > self.rect.x:
-                    self.rect.x += self.speed
-                elif player.rect.x < self.rect.x:
-                    self.rect.x -= self.speed
+        self.movement_type = movement_type or rng.choice(["patrol", "follow"])
+        # Increased health to make enemies harder to defeat
+        enemy_system.add(self, BEHAVIOURS[self.movement_type], speed=2 * TICK_SCALE, health=150,
+                         patrol_range=patrol_range)
 
     def take_damage(self, damage):
         self.health -= damage
@@ -175,30 +263,18 @@ class Enemy(pygame.sprite.Sprite):
             player.score += 100
             self.kill()
 
-    def update(self, player):
-        self.move(player)
+    def health_bar(self):
+        return 50, int(50 * (self.health / 50))
 
-    def draw_health_bar(self):
-        pygame.draw.rect(screen, RED, (self.rect.x, self.rect.y - 10, 50, 10))
-        pygame.draw.rect(screen, GREEN, (self.rect.x, self.rect.y - 10, 50 * (self.health / 50), 10))
-
-# BossEnemy class
-class BossEnemy(pygame.sprite.Sprite):
+# BossEnemy class, always walks towards the player
+class BossEnemy(EnemySprite):
     def __init__(self, x, y):
         super().__init__()
-        self.image = pygame.Surface((100, 100))
-        self.image.fill((255, 215, 0))  # Gold color for boss
+        self.image = assets.solid_surface((100, 100), (255, 215, 0))  # Gold color for boss
         self.rect = self.image.get_rect()
         self.rect.x = x
         self.rect.y = y
-        self.health = 300
-        self.speed = 3
-
-    def move(self, player):
-        if self.rect.x < player.rect.x:
-            self.rect.x += self.speed
-        else:
-            self.rect.x -= self.speed
+        enemy_system.add(self, BOSS, speed=3 * TICK_SCALE, health=300)
 
     def take_damage(self, damage):
         self.health -= damage
@@ -206,193 +282,470 @@ class BossEnemy(pygame.sprite.Sprite):
             player.score += 500
             self.kill()
 
-    def update(self, player):
-        self.move(player)
-
-    def draw_health_bar(self):
-        pygame.draw.rect(screen, RED, (self.rect.x, self.rect.y - 10, 100, 10))
-        pygame.draw.rect(screen, GREEN, (self.rect.x, self.rect.y - 10, 100 * (self.health / 300), 10))
-
-# Function to display a transition message
-def level_transition_message(screen, message, font):
-    screen.fill(BLACK)
-    text = font.render(message, True, WHITE)
-    screen.blit(text, (SCREEN_WIDTH // 2 - text.get_width() // 2, SCREEN_HEIGHT // 2 - text.get_height() // 2))
-    pygame.display.flip()
-    pygame.time.delay(2000)
-
-# Setup level function with boss creation
-def setup_level(level):
-    # Show level start message
-    level_transition_message(screen, f"Level {level} Start", font)
-
-    enemies.empty()
-    collectibles.empty()
-    all_sprites.empty()
-
-    if level == 1:
-        for i in range(3):
-            enemy = Enemy(random.randint(400, 800), SCREEN_HEIGHT - 150)
-            enemies.add(enemy)
-            all_sprites.add(enemy)
-        collectible = Collectible(500, SCREEN_HEIGHT - 100, 'health')
-        collectibles.add(collectible)
-        all_sprites.add(collectible)
-
-    elif level == 2:
-        for i in range(5):
-            enemy = Enemy(random.randint(400, 800), SCREEN_HEIGHT - 150)
-            enemies.add(enemy)
-            all_sprites.add(enemy)
-        collectible = Collectible(300, SCREEN_HEIGHT - 100, 'life')
+    def health_bar(self):
+        return 100, int(100 * (self.health / 300))
+
+# Add a regular enemy to the sprite groups and the collision world
+def add_enemy(enemy):
+    enemies.add(enemy)
+    all_sprites.add(enemy)
+    collision_world.add(enemy, collision.ENEMY)
+
+# Create the entity of a level record (see levels.py) and return its sprite, patrolling enemies stay
+# within patrol_range
+def spawn_entity(record, patrol_range):
+    kind, x, y = record[:3]
+    if isinstance(x, list):
+        x = rng.randint(*x)
+    if kind == "enemy":
+        left, right = patrol_range
+        enemy = Enemy(x, y, record[3] if len(record) > 3 else None, (left, right - 50))
+        if len(record) > 4:
+            enemy.health = record[4]
+        add_enemy(enemy)
+        return enemy
+    if kind == "collectible":
+        collectible = Collectible(x, y, record[3] if len(record) > 3 else "health")
         collectibles.add(collectible)
         all_sprites.add(collectible)
-
-    elif level == 3:
-        # Create the boss and add it to all_sprites
+        collision_world.add(collectible, collision.COLLECTIBLE)
+        return collectible
+    if kind == "boss":
         global boss
-        boss = BossEnemy(600, SCREEN_HEIGHT - 150)  # Set the starting position of the boss
-        all_sprites.add(boss)  # Add the boss to the all_sprites group
-        # Optionally, add some regular enemies in level 3
-        for i in range(2):
-            enemy = Enemy(random.randint(400, 800), SCREEN_HEIGHT - 150)
-            enemies.add(enemy)
-            all_sprites.add(enemy)
+        boss = BossEnemy(x, y)
+        all_sprites.add(boss)
+        collision_world.add(boss, collision.BOSS)
+        return boss
+    raise ValueError(f"Unknown entity kind in level: {kind}")
+
+# The record of an entity that leaves the streamed chunks, with its current position and health.
+# The boss chases the player and stays active.
+def entity_record(sprite):
+    if isinstance(sprite, Enemy):
+        x, y = enemy_system.position(sprite)
+        return ["enemy", x, y, sprite.movement_type, sprite.health]
+    if isinstance(sprite, Collectible):
+        return ["collectible", sprite.rect.x, sprite.rect.y, sprite.type]
+    return None
+
+def despawn_entity(sprite):
+    sprite.kill()
+    collision_world.remove(sprite)
+
+# The background segments of a level: images by name, or plain colors
+def level_background(segments):
+    if not segments:
+        return background_image
+    resolved = []
+    for start_x, source in segments:
+        if isinstance(source, str):
+            try:
+                image = assets.background(source)
+            except FileNotFoundError:
+                image = background_image
+        else:
+            image = assets.solid_surface((SCREEN_WIDTH, SCREEN_HEIGHT), source)
+        resolved.append((start_x, image))
+    return resolved
+
+# Build a level from its file in LEVEL_FILES. Only the chunks around the camera are spawned, the stream
+# spawns and despawns the others while the camera moves. This is a generator that yields after every
+# sprite, so a transition scene can build the level a few milliseconds per frame while its message is shown.
+def build_level(level):
+    global level_stream, level_width, boss
+    enemies.empty()
+    collectibles.empty()
+    all_sprites.empty()
+    enemy_system.clear()
+    boss = None
+    if level_stream is not None:
+        level_stream.close()
+
+    level_stream = LevelStream(LEVEL_FILES[level - 1], spawn_entity, entity_record, despawn_entity)
+    level_width = level_stream.width
+    camera.width = level_width
+    if renderer is not None:
+        renderer.set_background(level_background(level_stream.background))
+    yield from level_stream.load(camera.view())
 
     all_sprites.add(player)  # Always add the player to all_sprites
+    collision_world.sync()  # drop the sprites of the previous level
+
+# Build a level at once
+def setup_level(level):
+    for _ in build_level(level):
+        pass
 
 def complete_level(level):
-    # Show the "Level Complete" message
-    level_transition_message(screen, f"Level {level} Complete", font)
-    pygame.time.delay(1000)
+    global current_level, game_completed
+    if scene_manager is None:
+        # headless: no messages, the next level starts in the same tick and the run ends after the last one
+        if level < len(LEVEL_FILES):
+            current_level += 1
+            setup_level(current_level)
+        else:
+            game_completed = True
+        return
 
-    # Move to the next level, or show the game end menu if all levels are completed
-    if level < 3:
-        global current_level
+    # Show the "Level Complete" and "Level Start" messages while the next level is built,
+    # or show the game end menu if all levels are completed
+    if level < len(LEVEL_FILES):
         current_level += 1  # Move to the next level
-        setup_level(current_level)
+        pages = [(f"Level {level} Complete", LEVEL_COMPLETE_MS), (f"Level {current_level} Start", LEVEL_START_MS)]
+        scene_manager.switch(TransitionScene(screen, hud.text, pages, build_level(current_level), on_done=play))
     else:
-        game_end_menu()  # Show the end menu instead of exiting the game
-
-def game_won_message():
-    # Display the "You Win!" message when the final level is completed
-    screen.fill(BLACK)
-    text = font.render("You Win! Game Complete!", True, WHITE)
-    screen.blit(text, (SCREEN_WIDTH // 2 - text.get_width() // 2, SCREEN_HEIGHT // 2 - text.get_height() // 2))
-    pygame.display.flip()
-    pygame.time.delay(3000)  # Display the message for 3 seconds
-    pygame.quit()
-    sys.exit()
-
-# In the main game loop, update enemies in every level
-def main():
+        game_completed = True
+        save_recording()
+        scene_manager.switch(end_menu_scene())
+
+# Start a new game: create the player, the sprite groups, the camera and (if build is True) the first level.
+# Everything of the previous game is replaced, so nothing is kept alive across replays. The random
+# generator is seeded with seed, or with a new random seed that is kept in game_seed.
+def new_game(build=True, seed=None):
+    global game_seed
+    game_seed = random.randrange(2 ** 32) if seed is None else seed
+    rng.seed(game_seed)
+    # every sprite is registered in the collision world with its layer, see collision.py
+    global collision_world
+    collision_world = collision.SpatialHash()
+    # moves all enemies at once, patrolling enemies turn around at the right edge of the first screen
+    global enemy_system
+    enemy_system = EnemySystem(patrol_max_x=SCREEN_WIDTH - 50)
     global player
     player = Player()
+    collision_world.add(player, collision.PLAYER)
     global bullets
-    bullets = pygame.sprite.Group()
+    bullets = projectiles.ProjectileManager(cooldown=projectiles.FIRE_COOLDOWN_TICKS / TICK_SCALE,
+                                            speed=projectiles.BULLET_SPEED * TICK_SCALE)
     global enemies
     enemies = pygame.sprite.Group()
     global collectibles
     collectibles = pygame.sprite.Group()
     global all_sprites
     all_sprites = pygame.sprite.Group()
+    global boss
+    boss = None
+    global game_completed
+    game_completed = False
+
+    global camera
+    camera = Camera(level_width, SCREEN_HEIGHT)
 
     global current_level
     current_level = 1
-    setup_level(current_level)
-
-    camera = Camera(background_width, SCREEN_HEIGHT)
-
-    run = True
-    while run:
-        clock.tick(FPS)
-
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                run = False
+    global previous_camera, render_alpha
+    previous_positions.clear()
+    previous_camera = None
+    render_alpha = 1.0
+    if build:
+        setup_level(current_level)
 
-        keys = pygame.key.get_pressed()
-        if keys[pygame.K_LEFT]:
-            player.move(-player.speed, 0)
-        if keys[pygame.K_RIGHT]:
-            player.move(player.speed, 0)
-        if keys[pygame.K_SPACE]:
-            player.shoot()
-        if keys[pygame.K_UP]:
-            player.jump()
-
-        # Update player and bullets
-        player.update()
-        camera.update(player)
-        bullets.update()
-
-        # Update all enemies
-        enemies.update(player)
-
-        # Update the boss if it's level 3
-        if current_level == 3 and 'boss' in globals():
-            boss.update(player)
-
-        # Collision detection: check if bullets hit enemies
-        bullet_enemy_collisions = pygame.sprite.groupcollide(bullets, enemies, True, False)
-        for bullet, hit_enemies in bullet_enemy_collisions.items():
-            for enemy in hit_enemies:
-                enemy.take_damage(bullet.damage)
-
-        # Collision detection: check if bullets hit the boss
-        if current_level == 3 and 'boss' in globals():
-            bullet_boss_collisions = pygame.sprite.spritecollide(boss, bullets, True)
-            for bullet in bullet_boss_collisions:
-                boss.take_damage(bullet.damage)
-
-        # Check if all enemies are defeated or boss in level 3
-        if current_level == 3 and 'boss' in globals() and boss.health <= 0:
+# the keys the game reads, an input log records only these
+INPUT_KEYS = (pygame.K_LEFT, pygame.K_RIGHT, pygame.K_SPACE, pygame.K_UP)
+
+# The phases of one game tick. keys is anything indexed like pygame.key.get_pressed(),
+# e.g. a scripted KeyState in headless mode.
+def handle_input(keys):
+    if keys[pygame.K_LEFT]:
+        player.move(-player.speed, 0)
+    if keys[pygame.K_RIGHT]:
+        player.move(player.speed, 0)
+    if keys[pygame.K_SPACE]:
+        player.shoot()
+    if keys[pygame.K_UP]:
+        player.jump()
+
+def update_player():
+    # Update player and bullets
+    player.update()
+    camera.update(player)
+    # bullets outside the camera view or the level are returned to the pool
+    view_left = -camera.camera.x
+    bullets.update(view_left, view_left + SCREEN_WIDTH, level_width)
+
+def update_level_stream():
+    # spawn the chunks the camera approaches and despawn the ones it left, see levels.py
+    level_stream.update(camera.view())
+
+def update_enemies():
+    # Update all enemies and the boss in one pass, only the sprites near the camera view are moved
+    enemy_system.update(player.rect.x, camera.view())
+
+def resolve_collisions():
+    # move the sprites that changed cells in the spatial hash: only the player and the enemies
+    # the enemy system moved this frame can have moved
+    collision_world.sync([player] + enemy_system.synced)
+
+    # Collision detection: check if bullets hit enemies or the boss. The spatial hash finds the sprites
+    # near the bullets, the projectile manager checks them against all bullets at once.
+    if bullets.live:
+        area = bullets.bounding_rect()
+        targets = collision_world.query(area, collision.ENEMY) + collision_world.query(area, collision.BOSS)
+        for target, damage in bullets.collide(targets).items():
+            target.take_damage(damage)
+
+    # The player picks up collectibles and is hurt by touching enemies or the boss
+    for collectible in collision_world.query(player.rect, collision.COLLECTIBLE):
+        collectible.apply_effect(player)
+    if collision_world.query(player.rect, collision.ENEMY):
+        player.take_damage(ENEMY_CONTACT_DAMAGE)
+    if collision_world.query(player.rect, collision.BOSS):
+        player.take_damage(BOSS_CONTACT_DAMAGE)
+
+def check_level_progress():
+    # Check if the boss is defeated in a boss level, or all enemies in the other levels
+    if level_stream.goal == "boss":
+        if boss is not None and boss.health <= 0:
             complete_level(current_level)
-        elif len(enemies) == 0 and current_level != 3:  # If no enemies remain in the level (except boss level)
-            complete_level(current_level)
-
-        # Draw the background and all sprites
-        rel_x = camera.camera.x % background_width
-        screen.blit(background_image, (rel_x - background_width, 0))
-        if rel_x < SCREEN_WIDTH:
-            screen.blit(background_image, (rel_x, 0))
-
-        all_sprites.draw(screen)
-        bullets.draw(screen)
-        collectibles.draw(screen)
-
-        player.draw_health_bar()
-
-        for enemy in enemies:
-            enemy.draw_health_bar()
+    elif len(enemies) == 0 and level_stream.cleared():  # no enemy is left, also none outside the streamed chunks
+        complete_level(current_level)
+
+# names and functions of the simulation phases after the input, in the order they run;
+# drawing is not part of the simulation
+SIMULATION_PHASES = (
+    ("player", update_player),
+    ("streaming", update_level_stream),
+    ("enemies", update_enemies),
+    ("collisions", resolve_collisions),
+    ("level", check_level_progress),
+)
+
+# Run (name, function) phases in order. If phase_times is a dict, the seconds spent in every phase
+# are added to it.
+def run_phases(phases, phase_times=None):
+    if phase_times is None:
+        for _, phase in phases:
+            phase()
+        return
+    for name, phase in phases:
+        start_time = time.perf_counter()
+        phase()
+        phase_times[name] = phase_times.get(name, 0.0) + time.perf_counter() - start_time
+
+# One fixed simulation step of the game. If phase_times is a dict, the seconds spent in every phase
+# are added to it.
+def simulate_tick(keys, phase_times=None):
+    if phase_times is None:
+        handle_input(keys)
+    else:
+        start_time = time.perf_counter()
+        handle_input(keys)
+        phase_times["input"] = phase_times.get("input", 0.0) + time.perf_counter() - start_time
+    run_phases(SIMULATION_PHASES, phase_times)
+
+# Pressed keys in the format of pygame.key.get_pressed(), for scripted input without a keyboard
+class KeyState:
+    def __init__(self, pressed=()):
+        self.pressed = frozenset(pressed)
+
+    def __getitem__(self, key):
+        return key in self.pressed
+
+# Scripted input: a list of (ticks, keys) steps, e.g. [(60, [pygame.K_RIGHT]), (30, [pygame.K_SPACE])],
+# played in order and repeated from the start when it runs out
+class ScriptedInput:
+    def __init__(self, steps):
+        self.steps = [(ticks, KeyState(keys)) for ticks, keys in steps]
+        self.length = sum(ticks for ticks, _ in self.steps)
+
+    def keys_for_tick(self, tick):
+        tick %= self.length
+        for ticks, keys in self.steps:
+            if tick < ticks:
+                return keys
+            tick -= ticks
+        return KeyState()
+
+# Render interpolation: the positions of the moving sprites and the camera before the last tick, and how
+# far the frame is between that tick and the next one (1.0 draws the current positions)
+previous_positions = {}
+previous_camera = None
+render_alpha = 1.0
+
+# Keep the positions before a tick. Only the player and the enemies synced in the last tick have up to date
+# rects, the other sprites are drawn at their current position.
+def remember_positions():
+    global previous_camera
+    previous_positions.clear()
+    previous_positions[player] = player.rect.topleft
+    for sprite in enemy_system.synced:
+        previous_positions[sprite] = sprite.rect.topleft
+    previous_camera = camera.camera.topleft
+
+# {sprite: rect between its previous and current position} of the sprites that moved, None at alpha 1.0
+def interpolated_rects(sprites):
+    if render_alpha >= 1.0:
+        return None
+    lag = 1.0 - render_alpha
+    rects = {}
+    for sprite in sprites:
+        previous = previous_positions.get(sprite)
+        if previous is not None:
+            rect = sprite.rect
+            rects[sprite] = rect.move(round((previous[0] - rect.x) * lag), round((previous[1] - rect.y) * lag))
+    return rects
+
+def interpolated_camera_offset():
+    x, y = camera.camera.topleft
+    if render_alpha >= 1.0 or previous_camera is None:
+        return x, y
+    lag = 1.0 - render_alpha
+    return x + round((previous_camera[0] - x) * lag), y + round((previous_camera[1] - y) * lag)
+
+# The draw phases of a frame. Only the sprites in the viewport are drawn, the spatial hash finds them
+# without looking at the rest of the level.
+# the player and the enemies on the screen and their interpolated rects, their health bars are drawn by draw_hud
+visible_fighters = []
+fighter_rects = None
+
+def draw_background():
+    renderer.begin_frame(camera, interpolated_camera_offset())
+
+def draw_sprites():
+    global visible_fighters, fighter_rects
+    view = renderer.view
+    visible_enemies = collision_world.query(view, collision.ENEMY)
+    visible_bosses = collision_world.query(view, collision.BOSS)
+    # the sprites with a health bar
+    visible_fighters = [player] + visible_enemies + visible_bosses
+    fighter_rects = interpolated_rects(visible_fighters)
+    renderer.draw_sprites(collision_world.query(view, collision.COLLECTIBLE))
+    renderer.draw_sprites(visible_enemies, fighter_rects)
+    renderer.draw_sprites(visible_bosses, fighter_rects)
+    renderer.draw_sprites([player], fighter_rects)
+    renderer.add_rects(bullets.draw(screen, renderer.offset, 1.0 - render_alpha))
+
+def draw_hud():
+    renderer.add_rects(hud.draw_health_bars(visible_fighters, renderer.offset, fighter_rects))
+    renderer.add_rects([hud.draw(score=player.score, lives=player.lives, level=current_level)])
+
+DRAW_PHASES = (
+    ("background", draw_background),
+    ("sprites", draw_sprites),
+    ("hud", draw_hud),
+)
+
+# Draw the visible part of the level through the camera, renderer.present() shows the frame.
+# If phase_times is a dict, the seconds of every draw phase are added to it.
+def draw_frame(phase_times=None):
+    run_phases(DRAW_PHASES, phase_times)
+
+# entity and surface counts for the frame profiler
+def profile_counts():
+    return {"enemies": len(enemy_system), "streamed": len(level_stream.active), "bullets": bullets.live,
+            "cells": collision_world.stats()["cells"],
+            "surfaces": len(assets.images) + len(assets.surfaces) + len(hud.bars) + len(hud.text.texts)}
+
+# The game itself: the simulation ticks that are due and one frame, P or ESC pauses,
+# F3 shows the frame profiler and F4 starts or stops a frame trace
+class PlayScene(Scene):
+    def __init__(self):
+        # milliseconds of game time the simulation is behind
+        self.accumulator_ms = 0.0
 
-        if current_level == 3 and 'boss' in globals():
-            boss.draw_health_bar()
+    def enter(self):
+        renderer.invalidate()  # another scene covered the screen, the next frame is drawn completely
+        profiler.skip_interval()
 
-        pygame.display.flip()
+    def handle_event(self, event):
+        if event.type == pygame.KEYDOWN and event.key in (pygame.K_p, pygame.K_ESCAPE):
+            self.manager.switch(PauseScene(screen, hud.text, self))
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+            profiler.toggle_overlay()
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_F4:
+            profiler.toggle_trace()
 
+    def update(self):
+        global render_alpha
+        keys = pygame.key.get_pressed()
+        phase_times = profiler.begin_frame()
+        self.accumulator_ms += min(self.manager.frame_ms, MAX_FRAME_MS)
+        ticks = 0
+        while self.accumulator_ms >= TICK_MS:
+            if ticks == MAX_CATCH_UP_TICKS:
+                # too slow to catch up: drop the backlog
+                self.accumulator_ms %= TICK_MS
+                break
+            remember_positions()
+            if input_log is not None:
+                input_log.record(keys)
+            simulate_tick(keys, phase_times)
+            self.accumulator_ms -= TICK_MS
+            ticks += 1
+            if self.manager.scene is not self:
+                # the level is over
+                return
+        render_alpha = self.accumulator_ms / TICK_MS
+
+    def draw(self):
+        draw_frame(profiler.phase_times)
+        if profiler.overlay:
+            renderer.add_rects([profiler.draw(screen)])
+
+    def present(self):
+        if profiler.phase_times is None:
+            renderer.present()
+            return
+        start_time = time.perf_counter()
+        renderer.present()
+        profiler.phase_times["present"] = time.perf_counter() - start_time
+        profiler.end_frame(profile_counts())
+
+def play():
+    scene_manager.switch(PlayScene())
+
+# The state a replay of the session must end in
+def game_state():
+    return {"score": player.score, "lives": player.lives, "level": current_level, "completed": game_completed,
+            "player_x": player.rect.x}
+
+# write the input log of the current game to RECORD_PATH (the last game of a run is kept)
+def save_recording():
+    if input_log is not None:
+        input_log.finish(game_state())
+        input_log.save(RECORD_PATH)
+
+# New game: the first level is built while its start message is shown
+def start_game():
+    new_game(build=False)
+    if RECORD_PATH:
+        global input_log
+        input_log = InputLog(game_seed, INPUT_KEYS, TICK_RATE)
+    scene_manager.switch(TransitionScene(screen, hud.text, [(f"Level {current_level} Start", LEVEL_START_MS)],
+                                         build_level(current_level), on_done=play))
+
+def end_menu_scene():
+    return MenuScene(screen, hud.text, ["Congratulations! You've completed the game!", "Press R to Replay or Q to Quit"],
+                     {pygame.K_r: start_game, pygame.K_q: scene_manager.quit})
+
+# In the main game loop, the scene manager runs the scenes until the game is quit.
+# With record_path the input of the game is recorded for replay.py, with trace_path the frames are traced
+# from the start, profile shows the frame profiler. tick_rate is the simulation rate in ticks per second.
+def main(record_path=None, trace_path=None, profile=False, tick_rate=BASE_TICK_RATE):
+    global scene_manager, RECORD_PATH
+    RECORD_PATH = record_path
+    set_tick_rate(tick_rate)
+    init_game()
+    if profile:
+        profiler.toggle_overlay()
+    if trace_path:
+        profiler.toggle_trace(trace_path)
+    scene_manager = SceneManager()
+    start_game()
+    scene_manager.run(clock, FPS)
+    save_recording()
+    if profiler.trace_path is not None:
+        profiler.toggle_trace()
     pygame.quit()
 
-def game_end_menu():
-    screen.fill(BLACK)
-    end_text = font.render("Congratulations! You've completed the game!", True, WHITE)
-    replay_text = font.render("Press R to Replay or Q to Quit", True, WHITE)
-    screen.blit(end_text, (SCREEN_WIDTH // 2 - end_text.get_width() // 2, SCREEN_HEIGHT // 2 - 50))
-    screen.blit(replay_text, (SCREEN_WIDTH // 2 - replay_text.get_width() // 2, SCREEN_HEIGHT // 2 + 10))
-    pygame.display.flip()
-
-    waiting = True
-    while waiting:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_r:
-                    main()  # Restart the game
-                if event.key == pygame.K_q:
-                    pygame.quit()
-                    sys.exit()
-
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Side-scrolling game")
+    parser.add_argument("--record", default=None, metavar="PATH",
+                        help="record the input of the game to PATH, replay it with replay.py")
+    parser.add_argument("--trace", default=None, metavar="PATH",
+                        help="write the phase times of every frame to PATH (Chrome trace JSON, or CSV for .csv)")
+    parser.add_argument("--profile", action="store_true", help="show the frame profiler (toggle with F3)")
+    parser.add_argument("--tick-rate", type=int, default=BASE_TICK_RATE,
+                        help="simulation ticks per second, independent of the frame rate (e.g. 30 on weak hardware)")
+    args = parser.parse_args()
+    main(args.record, args.trace, args.profile, args.tick_rate)
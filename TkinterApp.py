@@ -1,24 +1,58 @@
+import time
+
+# Startup timing breakdown in seconds, filled while the application starts and printed by report_startup_times.
+# ultralytics (and torch with it) is not imported here, it is imported by the background model loader,
+# so the window can appear before the model is available.
+startup_times = {}
+process_start_time = time.perf_counter()
+
 from tkinter import *
 from tkinter import filedialog
-from ultralytics import YOLO
+from tkinter import ttk
 import cv2
 from PIL import Image, ImageTk
-import time
+import os
+import argparse
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from inference_backends import (AIModelBase, BACKENDS, CONFIDENCE_THRESHOLD, IOU_THRESHOLD, create_backend,
+                                default_weights, draw_detections)
+# the detection core shared with the headless detect_cli.py
+from detector import (BATCH_SIZE, DECODE_WORKERS, DEFAULT_BACKEND, CachedDetection, DetectionCache, Detector,
+                      list_images, read_image, summarize_detections)
+# sliced inference for very large images, see tiling.py
+from tiling import TILE_OVERLAP, TILE_SIZE, needs_slicing, preview_scale, scale_detections, sliced_predict
+# previews of the canvases at a few resolutions, see preview_pyramid.py
+from preview_pyramid import PreviewPyramid, build_pyramid, load_preview
+# timing of every stage, see metrics.py (it replaces the old log_execution_time prints)
+from metrics import METRICS, ProfileCapture, span, timed
 
-# Decorator to log execution time of methods
-def log_execution_time(func):
-    def wrapper(*args, **kwargs):
-        start_time = time.time()
-        result = func(*args, **kwargs)
-        end_time = time.time()
-        print(f"Execution time for {func.__name__}: {end_time - start_time:.2f} seconds")
-        return result
-    return wrapper
-
-# Base class to implement polymorphism
-class AIModelBase:
-    def process_image(self, image):
-        raise NotImplementedError("Subclasses should implement this!")
+# Settings of the model (CONFIDENCE_THRESHOLD and IOU_THRESHOLD), they are also part of the detection cache key,
+# the backend is chosen with --backend at startup, see inference_backends.py
+
+# run one inference on a blank image right after loading so that the first real detection is not slowed down
+# by lazy initialisation inside torch
+MODEL_WARMUP = True
+# how often (in milliseconds) the Tk main loop checks whether the background model loader is done
+MODEL_POLL_MS = 100
+
+# memory limit of the detection cache, least recently used results are dropped above it
+DETECTION_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Settings of the redraw scheduler used when the window is resized
+# a burst of <Configure> events is merged into one redraw REDRAW_DELAY_MS after the last event,
+# but while the user keeps dragging there is at least one redraw every REDRAW_MAX_WAIT_MS
+REDRAW_DELAY_MS = 40
+REDRAW_MAX_WAIT_MS = 150
+
+# how often (in milliseconds) the Tk main loop checks whether the image being loaded has been decoded
+IMAGE_POLL_MS = 15
+
+# Settings of the "Detect Folder" mode (BATCH_SIZE and DECODE_WORKERS come from detector.py)
+# how often (in milliseconds) the Tk main loop collects finished results from the background worker
+BATCH_POLL_MS = 50
 
 # Mixin class for additional functionalities (Multiple Inheritance)
 class ImageProcessingMixin:
@@ -26,9 +60,192 @@ class ImageProcessingMixin:
         # Example preprocessing function
         return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
 
+# Settings of the video / webcam streaming mode
+# index of the local capture device used by the "Detect Webcam" button
+WEBCAM_INDEX = 0
+# capacity of the queues between the capture, inference and display stages,
+# with one slot every stage works on the newest frame and stale frames are dropped instead of queued
+STREAM_QUEUE_SIZE = 1
+# how often (in milliseconds) the Tk main loop looks for a new detected frame
+STREAM_POLL_MS = 15
+# number of frames used for the rolling latency and FPS figures
+STREAM_STATS_WINDOW = 60
+STREAM_STAGES = ("capture", "wait", "inference", "display", "end-to-end")
+
+# Print the startup timing breakdown, e.g. "imports 0.35 s, window 0.12 s, ultralytics import 2.10 s, ..."
+def report_startup_times():
+    print("Startup times: " + ", ".join(f"{step} {seconds:.2f} s" for step, seconds in startup_times.items()))
+
+# Put item into a bounded queue, the oldest frames are thrown away when it is full.
+# Returns how many frames were dropped.
+def put_latest(stage_queue, item):
+    dropped = 0
+    while True:
+        try:
+            stage_queue.put_nowait(item)
+            return dropped
+        except queue.Full:
+            try:
+                stage_queue.get_nowait()
+                dropped += 1
+            except queue.Empty:
+                pass
+
+# One frame travelling through the stream pipeline together with its timestamps
+class StreamFrame:
+    def __init__(self, index, image, captured_at):
+        self.index = index
+        self.image = image
+        self.captured_at = captured_at
+        self.annotated_rgb = None
+
+# Rolling latency of every stage, end-to-end FPS and drop counts of a stream.
+# The capture and inference threads and the Tk main loop all write to it, so it is locked.
+class StreamStats:
+    def __init__(self, window=STREAM_STATS_WINDOW):
+        self.lock = threading.Lock()
+        self.latencies = {stage: deque(maxlen=window) for stage in STREAM_STAGES}
+        self.display_times = deque(maxlen=window)
+        self.captured = 0
+        self.displayed = 0
+        # frames dropped because the inference stage (or the display stage) was still busy
+        self.dropped = {"inference": 0, "display": 0}
+
+    def add_latency(self, stage, seconds):
+        with self.lock:
+            self.latencies[stage].append(seconds)
+
+    def add_captured(self, dropped):
+        with self.lock:
+            self.captured += 1
+            self.dropped["inference"] += dropped
+
+    def add_dropped(self, stage, dropped):
+        with self.lock:
+            self.dropped[stage] += dropped
+
+    def add_displayed(self, frame, display_start, display_end):
+        with self.lock:
+            self.displayed += 1
+            self.display_times.append(display_end)
+            self.latencies["display"].append(display_end - display_start)
+            self.latencies["end-to-end"].append(display_end - frame.captured_at)
+
+    def fps(self):
+        with self.lock:
+            if len(self.display_times) < 2:
+                return 0.0
+            return (len(self.display_times) - 1) / (self.display_times[-1] - self.display_times[0])
+
+    # average latency of every stage in milliseconds
+    def mean_latencies_ms(self):
+        with self.lock:
+            return {stage: (sum(values) / len(values) * 1000 if values else 0.0)
+                    for stage, values in self.latencies.items()}
+
+    def summary(self):
+        latencies = self.mean_latencies_ms()
+        stages = ", ".join(f"{stage} {latencies[stage]:.0f} ms" for stage in STREAM_STAGES)
+        return (f"{self.fps():.1f} FPS | {stages} | "
+                f"dropped {self.dropped['inference']} before inference, {self.dropped['display']} before display")
+
+# Capture -> inference -> display pipeline for a video file or a capture device.
+# Capture and inference run on their own threads, the display stage is latest_frame(),
+# called from the Tk main loop. The stages are connected by queues with STREAM_QUEUE_SIZE slots,
+# so when inference cannot keep up old frames are dropped and latency does not build up.
+class StreamPipeline:
+    # source is a video file path or a device index, detect turns a BGR frame into an annotated RGB frame,
+    # with realtime=True a video file is read at its own frame rate, like a live camera
+    def __init__(self, source, detect, realtime=True):
+        self.source = source
+        self.detect = detect
+        self.realtime = realtime
+        self.capture_queue = queue.Queue(maxsize=STREAM_QUEUE_SIZE)
+        self.display_queue = queue.Queue(maxsize=STREAM_QUEUE_SIZE)
+        self.stop_event = threading.Event()
+        # set when the inference stage has handled the last frame of the source
+        self.finished = threading.Event()
+        self.stats = StreamStats()
+
+    def start(self):
+        self.capture = cv2.VideoCapture(self.source)
+        if not self.capture.isOpened():
+            raise IOError(f"Cannot open video source {self.source}")
+        for stage in (self.capture_loop, self.inference_loop):
+            threading.Thread(target=stage, daemon=True).start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def capture_loop(self):
+        frame_rate = self.capture.get(cv2.CAP_PROP_FPS) if self.realtime else 0
+        frame_interval = 1.0 / frame_rate if frame_rate and frame_rate > 0 else 0.0
+        next_frame_time = time.perf_counter()
+        index = 0
+        try:
+            while not self.stop_event.is_set():
+                start_time = time.perf_counter()
+                ok, image = self.capture.read()
+                if not ok:
+                    break
+                captured_at = time.perf_counter()
+                self.stats.add_latency("capture", captured_at - start_time)
+                self.stats.add_captured(put_latest(self.capture_queue, StreamFrame(index, image, captured_at)))
+                index += 1
+                if frame_interval:
+                    next_frame_time += frame_interval
+                    delay = next_frame_time - time.perf_counter()
+                    if delay > 0:
+                        self.stop_event.wait(delay)
+                    else:
+                        # reading fell behind, do not try to catch up with a burst of frames
+                        next_frame_time = time.perf_counter()
+        finally:
+            self.capture.release()
+            # None marks the end of the source, it must not replace a frame that is still waiting
+            while not self.stop_event.is_set():
+                try:
+                    self.capture_queue.put(None, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+
+    def inference_loop(self):
+        try:
+            while True:
+                try:
+                    frame = self.capture_queue.get(timeout=0.1)
+                except queue.Empty:
+                    if self.stop_event.is_set():
+                        break
+                    continue
+                if frame is None:
+                    break
+                inference_start = time.perf_counter()
+                self.stats.add_latency("wait", inference_start - frame.captured_at)
+                frame.annotated_rgb = self.detect(frame.image)
+                # the raw frame is not needed any more, do not keep it alive in the display queue
+                frame.image = None
+                self.stats.add_latency("inference", time.perf_counter() - inference_start)
+                self.stats.add_dropped("display", put_latest(self.display_queue, frame))
+        except Exception as error:
+            print(f"Stream detection failed: {error}")
+        finally:
+            self.finished.set()
+
+    # display stage: the newest detected frame, or None if there is no new one
+    def latest_frame(self):
+        try:
+            return self.display_queue.get_nowait()
+        except queue.Empty:
+            return None
+
+    def done(self):
+        return self.finished.is_set() and self.display_queue.empty()
+
 # YOLOv8 class with multiple inheritance and method overriding
 class YOLOv8App(AIModelBase, ImageProcessingMixin):
-    def __init__(self, master, title_of_windows):
+    def __init__(self, master, title_of_windows, backend_name=DEFAULT_BACKEND, weights=None):
         self.master = master
         self.frame = Frame(master)
         #use fill=BOTH and expand=True to enlarge the image to fit the window when user maximizes the app window 
@@ -37,7 +254,19 @@ class YOLOv8App(AIModelBase, ImageProcessingMixin):
         master.title(title_of_windows)
 
         # Encapsulation: Private model attribute
-        self.__model = YOLO('yolov8n.pt')
+        # the model is an inference backend loaded by load_model on a background thread, get_model waits for it
+        self.backend_name = backend_name
+        self.weights = weights or default_weights(backend_name)
+        # backend and weights identify the model in the detection cache key
+        self.model_name = f"{backend_name}:{self.weights}"
+        self.__model = None
+        self.model_error = None
+        self.model_ready = threading.Event()
+        # the model is used from the Tk thread, the folder worker and the stream inference thread,
+        # the YOLO predictor is not thread-safe, so every call holds model_lock
+        self.model_lock = threading.Lock()
+        # detections and annotated images already computed, see DetectionCache
+        self.detection_cache = DetectionCache(DETECTION_CACHE_MAX_BYTES)
 
         # Create left and right frames, 
         # Left frame is used to show original image, right frame is used to show detected image
@@ -69,7 +298,8 @@ class YOLOv8App(AIModelBase, ImageProcessingMixin):
         # btn_detect_img is the right button in the first line to detect objects from original image,
         self.btn_detect_img = Button(
             self.right_frame, 
-            text="Click here to Detect Objects", 
+            # until the background loader is done the button shows that the model is warming up
+            text="Model warming...", 
             width=20, 
             command=self.detect_objects,
             # bg="red", 
@@ -83,58 +313,309 @@ class YOLOv8App(AIModelBase, ImageProcessingMixin):
         self.canvas_detected_img = Canvas(self.right_frame, width=400, height=600)
         self.canvas_detected_img.pack(fill=BOTH, expand=True)
 
+        # Bottom frame contents for the "Detect Folder" mode
+        # the bottom frame holds the folder button, the progress label and the results table
+        # both are packed before self.frame so that the canvases cannot push them out of the window
+        self.batch_frame = Frame(master)
+        self.batch_frame.pack(side=BOTTOM, fill=X, before=self.frame)
+        self.btn_detect_folder = Button(
+            self.batch_frame,
+            text="Detect Folder",
+            width=20,
+            command=self.detect_folder,
+            font=("Times New Roman", 14, "bold"),
+            borderwidth=4,
+            )
+        self.btn_detect_folder.pack(side=LEFT, padx=10, pady=5)
+        # buttons of the streaming mode, the button of a running stream turns into its "Stop" button
+        self.btn_detect_video = Button(
+            self.batch_frame,
+            text="Detect Video",
+            width=12,
+            command=self.detect_video,
+            font=("Times New Roman", 14, "bold"),
+            borderwidth=4,
+            )
+        self.btn_detect_video.pack(side=LEFT, padx=10, pady=5)
+        self.btn_detect_webcam = Button(
+            self.batch_frame,
+            text="Detect Webcam",
+            width=12,
+            command=self.detect_webcam,
+            font=("Times New Roman", 14, "bold"),
+            borderwidth=4,
+            )
+        self.btn_detect_webcam.pack(side=LEFT, padx=10, pady=5)
+        # batch_progress shows how many images are done and the throughput in images/sec
+        self.batch_progress = Label(self.batch_frame, text="", font=("Times New Roman", 12))
+        self.batch_progress.pack(side=LEFT, padx=10)
+        # redraw_status shows how many redraws happened and how many items live on the canvases,
+        # the number of items must stay at one per canvas however often the window is resized
+        self.redraw_status = Label(self.batch_frame, text="", font=("Times New Roman", 10))
+        self.redraw_status.pack(side=RIGHT, padx=10)
+        # stream_status shows FPS, latency of every stage and drop counts of the running stream
+        self.stream_status = Label(master, text="", font=("Times New Roman", 10), anchor=W)
+        self.stream_status.pack(side=BOTTOM, fill=X, before=self.frame)
+        # results_table lists one row per image as soon as its batch has finished
+        self.results_table = ttk.Treeview(
+            master,
+            columns=("file", "objects", "labels", "time"),
+            show="headings",
+            height=6)
+        for column, heading, width in (("file", "File", 200), ("objects", "Objects", 70),
+                                       ("labels", "Labels", 400), ("time", "ms / image", 90)):
+            self.results_table.heading(column, text=heading)
+            self.results_table.column(column, width=width, stretch=(column == "labels"))
+        self.results_table.pack(side=BOTTOM, fill=X, before=self.frame)
+
+        # the model runs on a single background thread (the YOLO predictor is not thread-safe),
+        # images are decoded on a separate pool so that decoding overlaps with inference
+        self.batch_executor = ThreadPoolExecutor(max_workers=1)
+        self.decode_executor = ThreadPoolExecutor(max_workers=DECODE_WORKERS)
+        # the worker thread never touches Tk widgets, it puts results in batch_results
+        # and the Tk main loop picks them up in poll_batch_results
+        self.batch_results = queue.Queue()
+        self.batch_cancel = threading.Event()
+        self.batch_running = False
+        # the running StreamPipeline, None when no video or webcam is streamed
+        self.stream = None
+        # the tiled image source of a very large image (see tiling.py), None for normal images
+        self.image_source = None
+        # counts the loaded images, the decode results of an image that was replaced by another are dropped
+        self.image_load_id = 0
+        master.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        # State of the redraw scheduler
+        # canvas_items keeps the one image item of each canvas, it is moved and updated instead of created again
+        self.canvas_items = {}
+        self.redraw_after_id = None
+        self.redraw_burst_start = 0.0
+        self.redraw_count = 0
+        # canvas sizes of the last redraw, a <Configure> event that does not change them is ignored
+        self.last_redraw_sizes = None
+
+        # start loading the model only now, all widgets exist and the window can be drawn meanwhile
+        threading.Thread(target=self.load_model, daemon=True).start()
+        self.master.after(MODEL_POLL_MS, self.poll_model_ready)
+
         # Bind the configure event to update_canvases when window changes
         # when window changes, <Configure> will get new size from window and function update_canvas_size will update new size of images
         self.master.bind('<Configure>', self.update_canvas_size)
 
-    @log_execution_time
+    # runs on a background thread: import the runtime of the backend, load the weights
+    # and optionally warm the model up
+    def load_model(self):
+        try:
+            start_time = time.perf_counter()
+            model = create_backend(self.backend_name, self.weights,
+                                   confidence=CONFIDENCE_THRESHOLD, iou=IOU_THRESHOLD)
+            startup_times["model load"] = time.perf_counter() - start_time
+
+            if MODEL_WARMUP:
+                start_time = time.perf_counter()
+                model.warmup()
+                startup_times["first inference"] = time.perf_counter() - start_time
+            self.__model = model
+        except Exception as error:
+            self.model_error = error
+        finally:
+            self.model_ready.set()
+
+    # runs on the Tk main loop until the model is ready, then enables the Detect button
+    def poll_model_ready(self):
+        if not self.model_ready.is_set():
+            self.master.after(MODEL_POLL_MS, self.poll_model_ready)
+            return
+        if self.model_error is not None:
+            print(f"Model {self.model_name} could not be loaded: {self.model_error}")
+            self.btn_detect_img.config(text="Model not available")
+            return
+        self.btn_detect_img.config(text="Click here to Detect Objects")
+        if hasattr(self, 'original_image'):
+            self.btn_detect_img.config(state=NORMAL)
+        startup_times["model ready"] = time.perf_counter() - process_start_time
+        report_startup_times()
+
+    # the model, when it is still loading this waits for the background loader (first use)
+    def get_model(self):
+        self.model_ready.wait()
+        if self.__model is None:
+            raise RuntimeError(f"Model {self.model_name} could not be loaded: {self.model_error}")
+        return self.__model
+
+    # the decode is timed on the worker as the load_preview stage, here only the file dialog would be measured
     def load_image(self):
         img_path = filedialog.askopenfilename() # a dialog box will appear and the user need to select an image to get image path from local directory
         if img_path:
-            self.original_image = cv2.imread(img_path)  # use opencv to read image
-            self.display_original_image()  # display original image in the left frame
-            self.btn_detect_img.config(state=NORMAL)  # after user loads image, detect button is enabled 
+            # the image is decoded on a decode worker, the window stays responsive while a large photo is read.
+            # First the preview pyramid is made from the reduced-resolution decode and shown, then the full
+            # image is decoded for the detection. Very large images are never decoded at full resolution,
+            # original_image becomes their preview and detection runs tile by tile on image_source
+            self.image_load_id += 1
+            if hasattr(self, 'original_image'):
+                del self.original_image
+            self.btn_detect_img.config(state=DISABLED)
+            future = self.decode_executor.submit(load_preview, img_path)
+            self.master.after(IMAGE_POLL_MS, self.poll_image_preview, future, img_path, self.image_load_id)
+
+    # runs on the Tk main loop until the preview of the image is decoded, then displays it
+    def poll_image_preview(self, future, img_path, load_id):
+        if load_id != self.image_load_id:
+            # another image was chosen meanwhile
+            return
+        if not future.done():
+            self.master.after(IMAGE_POLL_MS, self.poll_image_preview, future, img_path, load_id)
+            return
+        try:
+            source, preview, pyramid = future.result()
+        except Exception as error:
+            print(f"Image {img_path} could not be loaded: {error}")
+            return
+        self.original_pyramid = pyramid
+        self.display_original_image()  # display original image in the left frame
+        if source is not None and needs_slicing(source):
+            self.image_source = source
+            self.set_original_image(preview)
+            return
+        self.image_source = None
+        if preview.shape[1::-1] == pyramid.full_size:
+            # the preview is the image at full resolution already
+            self.set_original_image(preview)
+            return
+        if source is not None:
+            # the image source reads the whole image, cv2.imread cannot read a memory-mapped .npy file
+            future = self.decode_executor.submit(source.read_tile, 0, 0, source.width, source.height)
+        else:
+            future = self.decode_executor.submit(read_image, img_path)  # use opencv to read image
+        self.master.after(IMAGE_POLL_MS, self.poll_full_image, future, img_path, load_id)
+
+    # runs on the Tk main loop until the full-resolution image is decoded for the detection
+    def poll_full_image(self, future, img_path, load_id):
+        if load_id != self.image_load_id:
+            return
+        if not future.done():
+            self.master.after(IMAGE_POLL_MS, self.poll_full_image, future, img_path, load_id)
+            return
+        try:
+            image = future.result()
+        except Exception as error:
+            print(f"Image {img_path} could not be loaded: {error}")
+            return
+        if image is None:
+            print(f"Image {img_path} could not be loaded")
+            return
+        self.set_original_image(image)
+
+    # the BGR image the detection runs on, the detect button is enabled once it is there (and the model is ready)
+    def set_original_image(self, image):
+        self.original_image = image
+        if self.__model is not None:
+            self.btn_detect_img.config(state=NORMAL)
 
     def display_original_image(self):
-        # Convert OpenCV BGR image to RGB, image_in_rgb is a numpy array because the return of cv2.cvtcolor is a numpy array
-        image_in_rgb = cv2.cvtColor(self.original_image, cv2.COLOR_BGR2RGB)
-        
-        # image_in_rgb is a numpy array, thus, we should convert numpy array to PIL Image to display in the frame
-        image_pil = Image.fromarray(image_in_rgb)
-        
+        # original_pyramid holds the RGB previews of original_image made on the decode worker
         # Resize and display image
-        self.display_image(image_pil, self.canvas_original_img)
+        self.display_image(self.original_pyramid, self.canvas_original_img)
     
-    @log_execution_time
+    @timed()
     def detect_objects(self):  
         try:      #to check that the original image has been loaded before using the detection object. 
             self.original_image
-            # detect original image by model Yolov8 and return annotated image
-            annotated_image = self.process_image(self.original_image)
+            if self.image_source is not None:
+                # a very large image is detected tile by tile on the background thread
+                self.detect_sliced()
+                return
+            # the same pixels with the same model settings always give the same result, so look in the cache first
+            cache_key = self.detection_cache.make_key(self.original_image, self.model_name)
+            cached = self.detection_cache.get(cache_key)
+            if cached is None or cached.annotated_rgb is None:
+                # detect original image by model Yolov8 and return annotated image
+                annotated_image = self.process_image(self.original_image)
+                
+                # Convert OpenCV BGR image to RGB
+                with span("color convert"):
+                    annotated_image_rgb = cv2.cvtColor(annotated_image, cv2.COLOR_BGR2RGB)
+                summary = cached.summary if cached is not None else None
+                self.detection_cache.put(cache_key, CachedDetection(annotated_image_rgb, summary))
+            else:
+                annotated_image_rgb = cached.annotated_rgb
             
-            # Convert OpenCV BGR image to RGB
-            annotated_image_rgb = cv2.cvtColor(annotated_image, cv2.COLOR_BGR2RGB)
-            
-            # Convert to PIL Image
-            image_pil = Image.fromarray(annotated_image_rgb)
+            # the pyramid is kept so that a resize only has to scale one of its small levels again
+            self.detected_pyramid = build_pyramid(annotated_image_rgb)
             
             # Resize and display image
-            self.display_image(image_pil, self.canvas_detected_img)
+            self.display_detected_image()
         except AttributeError:
             print("No image loaded")
+
+    # Sliced detection of the very large image behind the preview in original_image
+    def detect_sliced(self):
+        # the preview hash plus the tiling settings identify the result in the cache
+        cache_key = self.detection_cache.make_key(self.original_image,
+                                                  f"{self.model_name}:sliced:{TILE_SIZE}:{TILE_OVERLAP}")
+        cached = self.detection_cache.get(cache_key)
+        if cached is not None and cached.annotated_rgb is not None:
+            self.detected_pyramid = build_pyramid(cached.annotated_rgb)
+            self.display_detected_image()
+            return
+        self.btn_detect_img.config(state=DISABLED, text="Detecting tiles...")
+        future = self.batch_executor.submit(self.run_sliced_detection, self.image_source, self.original_image)
+        self.master.after(BATCH_POLL_MS, self.poll_sliced_detection, future, cache_key, self.image_load_id)
+
+    # runs on the background thread: detect all tiles and draw the boxes on the preview
+    def run_sliced_detection(self, source, preview):
+        model = self.get_model()
+        with self.model_lock:
+            detections = sliced_predict(model, source)
+        annotated = draw_detections(preview, scale_detections(detections, preview_scale(source, preview)),
+                                    model.names)
+        with span("color convert"):
+            return cv2.cvtColor(annotated, cv2.COLOR_BGR2RGB), summarize_detections(detections, model.names)
+
+    # runs on the Tk main loop until the sliced detection is done
+    def poll_sliced_detection(self, future, cache_key, load_id):
+        if not future.done():
+            self.master.after(BATCH_POLL_MS, self.poll_sliced_detection, future, cache_key, load_id)
+            return
+        if load_id != self.image_load_id:
+            # another image was chosen meanwhile, its load enables the button (see set_original_image)
+            # and the boxes of the old image are not drawn over it, they only go to the cache
+            self.btn_detect_img.config(text="Click here to Detect Objects")
+        else:
+            self.btn_detect_img.config(state=NORMAL, text="Click here to Detect Objects")
+        try:
+            annotated_rgb, summary = future.result()
+        except Exception as error:
+            print(f"Sliced detection failed: {error}")
+            return
+        self.detection_cache.put(cache_key, CachedDetection(annotated_rgb, summary))
+        if load_id != self.image_load_id:
+            return
+        self.detected_pyramid = build_pyramid(annotated_rgb)
+        self.display_detected_image()
+
+    # display the last detected image
+    def display_detected_image(self):
+        self.display_image(self.detected_pyramid, self.canvas_detected_img)
     
-    def display_image(self, image_pil, canvas):
+    def display_image(self, pyramid, canvas):
         # use the following two methods to get width and height of canvas 
         canvas_width = canvas.winfo_width()
         canvas_height = canvas.winfo_height()
         
-        # when canvas changes, use thumbnail to resize image in original ratio of width and height to fit canvas, 
-        # the image is changed in place.
-        image_pil.thumbnail((canvas_width, canvas_height))
-        # image_pil = image_pil.resize((canvas_width, canvas_height))
+        # when canvas changes, resize image in original ratio of width and height to fit canvas,
+        # only the smallest pyramid level that covers the canvas is resized, never the full-resolution image.
+        # like thumbnail the image is never enlarged, but unlike thumbnail the cached level is not changed
+        image_pil = pyramid.level_for(canvas_width, canvas_height)
+        scale = min(canvas_width / image_pil.width, canvas_height / image_pil.height, 1.0)
+        size = (max(1, round(image_pil.width * scale)), max(1, round(image_pil.height * scale)))
+        if size != image_pil.size:
+            with span("resize"):
+                image_pil = image_pil.resize(size, Image.BICUBIC, reducing_gap=2.0)
         
-        # Convert a PIL image to a PhotoImage which can be used in Tkinter.
-        image_tkinter_mode = ImageTk.PhotoImage(image_pil)
+        # Convert a PIL image to a PhotoImage which can be used in Tkinter, this copies the pixels into Tk.
+        with span("tk upload"):
+            image_tkinter_mode = ImageTk.PhotoImage(image_pil)
         
         # image_tkinter_mode will be deleted from window due to garbage collection
         # use variable tk_image_original or tk_image_detected to store a reference to prevent garbage collection 
@@ -146,34 +627,266 @@ class YOLOv8App(AIModelBase, ImageProcessingMixin):
             #if it is the canvas for the detected image, store image_tkinter_mode in the tk_image_detected
             self.tk_image_detected = image_tkinter_mode
 
-        # use tkinter function create_image to display the image in the canvas
-        canvas.create_image(canvas_width//2, 
-                            canvas_height//2, 
-                            anchor=CENTER, 
-                            image=image_tkinter_mode)
+        # use tkinter function create_image to display the image in the canvas,
+        # the item is created only once per canvas and afterwards moved and given the new image
+        item = self.canvas_items.get(canvas)
+        if item is None:
+            self.canvas_items[canvas] = canvas.create_image(canvas_width//2,
+                                                            canvas_height//2,
+                                                            anchor=CENTER,
+                                                            image=image_tkinter_mode)
+        else:
+            canvas.coords(item, canvas_width//2, canvas_height//2)
+            canvas.itemconfig(item, image=image_tkinter_mode)
 
     # update images to fit new canvas size when window changes
     # when window changes, the event will change with new canvas width and height
     # and this method will be called
     def update_canvas_size(self, event=None ): 
-        if hasattr(self, 'original_image'):
+        # the binding on master also receives the <Configure> events of every child widget,
+        # only the window itself and the two canvases change the size of the images
+        if event is not None and event.widget not in (self.master, self.canvas_original_img, self.canvas_detected_img):
+            return
+        self.schedule_redraw()
+
+    # merge a burst of <Configure> events into one redraw (debounce),
+    # but do not wait longer than REDRAW_MAX_WAIT_MS while the burst goes on (throttle)
+    def schedule_redraw(self):
+        now = time.perf_counter()
+        if self.redraw_after_id is not None:
+            if (now - self.redraw_burst_start) * 1000 >= REDRAW_MAX_WAIT_MS:
+                # the pending redraw is due soon enough, keep it
+                return
+            self.master.after_cancel(self.redraw_after_id)
+        else:
+            self.redraw_burst_start = now
+        self.redraw_after_id = self.master.after(REDRAW_DELAY_MS, self.redraw_canvases)
+
+    def redraw_canvases(self):
+        self.redraw_after_id = None
+        sizes = tuple((canvas.winfo_width(), canvas.winfo_height())
+                      for canvas in (self.canvas_original_img, self.canvas_detected_img))
+        # moving the window also sends <Configure>, nothing has to be drawn if the canvases kept their size
+        if sizes == self.last_redraw_sizes:
+            return
+        self.last_redraw_sizes = sizes
+        if hasattr(self, 'original_pyramid'):
             # display the original image again with new canvas size
             self.display_original_image()  
-        if hasattr(self, 'tk_image_detected'):
-            # display the detected image again with new canvas size
-            self.detect_objects()
-        
+        if hasattr(self, 'detected_pyramid'):
+            # display the detected image again with new canvas size, the model is not run again
+            self.display_detected_image()
+        self.redraw_count += 1
+        self.redraw_status.config(text=f"redraws: {self.redraw_count}, canvas items: {self.canvas_items_alive()}")
+
+    # number of items on both canvases, it stays at one per canvas with an image
+    def canvas_items_alive(self):
+        return len(self.canvas_original_img.find_all()) + len(self.canvas_detected_img.find_all())
+
+    # "Detect Folder" button: run detection on every image of a directory without blocking the window,
+    # clicking the button again while a folder is running stops it
+    def detect_folder(self):
+        if self.batch_running:
+            self.batch_cancel.set()
+            return
+        folder = filedialog.askdirectory()
+        if not folder:
+            return
+        image_paths = list_images(folder)
+        if not image_paths:
+            print(f"No images found in {folder}")
+            return
+
+        # clear the rows of the previous run
+        self.results_table.delete(*self.results_table.get_children())
+        self.batch_total = len(image_paths)
+        self.batch_done = 0
+        self.batch_start_time = time.perf_counter()
+        self.batch_running = True
+        self.batch_cancel.clear()
+        self.btn_detect_folder.config(text="Stop")
+        self.batch_executor.submit(self.run_folder_detection, image_paths)
+        self.master.after(BATCH_POLL_MS, self.poll_batch_results)
+
+    # runs on the background thread: decode and detect images batch by batch, see Detector.detect_file_batches
+    def run_folder_detection(self, image_paths):
+        try:
+            # the detector shares the loaded model, its lock and the cache with the rest of the app
+            detector = Detector(self.backend_name, self.weights, backend=self.get_model(), lock=self.model_lock)
+            for results, seconds in detector.detect_file_batches(image_paths, BATCH_SIZE, cache=self.detection_cache,
+                                                                 decode_executor=self.decode_executor):
+                detected = [result for result in results if result.image is not None and result.cached is None]
+                seconds_per_image = seconds / len(detected) if detected else 0.0
+                for result in results:
+                    # files that OpenCV cannot decode are reported in the table and skipped,
+                    # images that were detected before come from the cache and take no model time
+                    if result.image is None:
+                        self.batch_results.put((result.path, None, (0, "could not read image"), 0.0))
+                        continue
+                    summary = summarize_detections(result.detections, detector.names)
+                    if result.cached is not None:
+                        self.batch_results.put((result.path, None, summary, 0.0))
+                        continue
+                    # only the last image of a batch is drawn, it is the one shown on the canvas
+                    annotated_rgb = None
+                    if result is detected[-1]:
+                        annotated = detector.annotate(result.image, result.detections)
+                        with span("color convert"):
+                            annotated_rgb = cv2.cvtColor(annotated, cv2.COLOR_BGR2RGB)
+                        self.detection_cache.put(result.cache_key,
+                                                 CachedDetection(annotated_rgb, summary, result.detections))
+                    self.batch_results.put((result.path, annotated_rgb, summary, seconds_per_image))
+                if self.batch_cancel.is_set():
+                    break
+        except Exception as error:
+            print(f"Folder detection failed: {error}")
+        finally:
+            # None tells poll_batch_results that the run is over
+            self.batch_results.put(None)
+
+    # runs on the Tk main loop: move finished results to the table, canvas and progress label
+    def poll_batch_results(self):
+        latest_annotated = None
+        finished = False
+        while True:
+            try:
+                item = self.batch_results.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                finished = True
+                break
+            path, annotated_rgb, (object_count, labels), seconds = item
+            self.batch_done += 1
+            self.results_table.insert("", END, values=(os.path.basename(path), object_count, labels,
+                                                       f"{seconds * 1000:.1f}"))
+            if annotated_rgb is not None:
+                latest_annotated = annotated_rgb
+
+        # only the newest annotated image is shown, older ones would be replaced immediately
+        if latest_annotated is not None:
+            # a new result replaces the image soon, it is shown without a pyramid
+            with span("pil convert"):
+                self.detected_pyramid = PreviewPyramid([Image.fromarray(latest_annotated)])
+            self.display_detected_image()
+            self.results_table.yview_moveto(1)
+
+        elapsed = time.perf_counter() - self.batch_start_time
+        throughput = self.batch_done / elapsed if elapsed > 0 else 0.0
+        self.batch_progress.config(text=f"{self.batch_done}/{self.batch_total} images, {throughput:.1f} images/sec")
+
+        if finished:
+            self.batch_running = False
+            self.btn_detect_folder.config(text="Detect Folder")
+            if self.batch_cancel.is_set():
+                self.batch_progress.config(text=self.batch_progress.cget("text") + " (stopped)")
+        else:
+            self.master.after(BATCH_POLL_MS, self.poll_batch_results)
+
+    # "Detect Video" button: stream a recorded video file through the detector
+    def detect_video(self):
+        if self.stream is not None:
+            self.stop_stream()
+            return
+        video_path = filedialog.askopenfilename(
+            filetypes=[("Video files", "*.mp4 *.avi *.mov *.mkv *.webm"), ("All files", "*.*")])
+        if video_path:
+            self.start_stream(video_path, realtime=True, button=self.btn_detect_video)
+
+    # "Detect Webcam" button: stream the local capture device through the detector
+    def detect_webcam(self):
+        if self.stream is not None:
+            self.stop_stream()
+            return
+        self.start_stream(WEBCAM_INDEX, realtime=False, button=self.btn_detect_webcam)
+
+    def start_stream(self, source, realtime, button):
+        stream = StreamPipeline(source, self.detect_frame, realtime=realtime)
+        try:
+            stream.start()
+        except IOError as error:
+            print(error)
+            return
+        self.stream = stream
+        button.config(text="Stop")
+        self.master.after(STREAM_POLL_MS, self.poll_stream)
+
+    def stop_stream(self):
+        self.stream.stop()
+        self.stream = None
+        self.btn_detect_video.config(text="Detect Video")
+        self.btn_detect_webcam.config(text="Detect Webcam")
+
+    # runs on the stream inference thread
+    def detect_frame(self, frame):
+        with self.model_lock:
+            annotated = self.get_model().process_image(frame)
+        with span("color convert"):
+            return cv2.cvtColor(annotated, cv2.COLOR_BGR2RGB)
+
+    # display stage of the stream, runs on the Tk main loop
+    def poll_stream(self):
+        stream = self.stream
+        if stream is None:
+            return
+        frame = stream.latest_frame()
+        if frame is not None:
+            display_start = time.perf_counter()
+            with span("pil convert"):
+                self.detected_pyramid = PreviewPyramid([Image.fromarray(frame.annotated_rgb)])
+            self.display_detected_image()
+            stream.stats.add_displayed(frame, display_start, time.perf_counter())
+            self.stream_status.config(text=stream.stats.summary())
+        if stream.done():
+            self.stop_stream()
+        else:
+            self.master.after(STREAM_POLL_MS, self.poll_stream)
+
+    # stop the background threads before the window is destroyed
+    def on_close(self):
+        if self.stream is not None:
+            self.stop_stream()
+        self.batch_cancel.set()
+        self.batch_executor.shutdown(wait=False, cancel_futures=True)
+        self.decode_executor.shutdown(wait=False, cancel_futures=True)
+        self.master.destroy()
 
     # Method overriding
-    @log_execution_time
+    @timed()
     def process_image(self, image):
-        # Use Yolov8 model to detect objects
-        results = self.__model(image)
-        # to draw bounding boxes, labels and confidence on annotated images
-        return results[0].plot()   
+        # Use Yolov8 model of the selected backend to detect objects,
+        # the backend draws bounding boxes, labels and confidence on the annotated image
+        with self.model_lock:
+            return self.get_model().process_image(image)
 
 # Main app execution
-root = Tk()
-app = YOLOv8App(root, "YOLOv8 Object Detection on Image")
-root.geometry("800x650")  # Set initial window size
-root.mainloop()
\ No newline at end of file
+if __name__ == "__main__":
+    startup_times["imports"] = time.perf_counter() - process_start_time
+    # the inference backend is selected at startup, e.g. python TkinterApp.py --backend onnx
+    parser = argparse.ArgumentParser(description="YOLOv8 Object Detection on Image")
+    parser.add_argument("--backend", choices=list(BACKENDS), default=DEFAULT_BACKEND)
+    parser.add_argument("--weights", default=None, help="model file, defaults to yolov8n exported for the backend")
+    # instrumentation, see metrics.py
+    parser.add_argument("--metrics-json", default=None, help="write the stage timings to this JSON file on exit")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="serve the stage timings as Prometheus text on http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--profile", default=None, metavar="PREFIX",
+                        help="record the whole session with cProfile into PREFIX.prof")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="with --profile, also trace memory allocations into PREFIX.memory.txt")
+    args = parser.parse_args()
+    if args.metrics_port:
+        METRICS.serve(args.metrics_port)
+    profile = ProfileCapture(args.profile, memory=args.profile_memory).start() if args.profile else None
+    window_start_time = time.perf_counter()
+    root = Tk()
+    app = YOLOv8App(root, "YOLOv8 Object Detection on Image", backend_name=args.backend, weights=args.weights)
+    root.geometry("800x650")  # Set initial window size
+    # the first idle callback runs once the window has been drawn
+    root.after_idle(lambda: startup_times.setdefault("window", time.perf_counter() - window_start_time))
+    root.mainloop()
+
+    if profile is not None:
+        print("Profile written to " + ", ".join(profile.stop()))
+    if args.metrics_json:
+        METRICS.export_json(args.metrics_json)
@@ -0,0 +1,170 @@
+# Asset manager of the side-scrolling game.
+# Asset names are relative paths ("background.png", "assets/background_music.mp3") that are looked up next to
+# the game, in the unpacked Assignments3_Q2 folder and finally inside the Assignments3_Q2.zip bundle, so the
+# game runs from wherever it was checked out. Images and sounds are loaded on first use and cached by name,
+# and sprites of the same kind share one surface.
+# The background is stored in display format in an on-disk cache (.asset_cache): the next launch copies the
+# pixels instead of decoding the PNG. A cache file is used while the size and modification time of the
+# source match; if only the time changed (e.g. the zip was extracted again), the SHA-1 of the source decides.
+#
+#   assets = AssetManager(GAME_DIR)
+#   background = assets.background("background.png")
+#   image = assets.solid_surface((50, 50), GREEN)
+#   print(assets.report())
+import hashlib
+import io
+import json
+import os
+import time
+import zipfile
+
+import pygame
+
+BUNDLE_NAME = "Assignments3_Q2.zip"
+# folder of the assets inside the bundle, and the folder the bundle unpacks to
+BUNDLE_FOLDER = "Assignments3_Q2"
+CACHE_FOLDER = ".asset_cache"
+# version of the cache file layout, older files are rebuilt
+CACHE_VERSION = 1
+
+class AssetManager:
+    def __init__(self, base_dir, bundle=BUNDLE_NAME, cache_dir=None):
+        self.roots = [base_dir, os.path.join(base_dir, BUNDLE_FOLDER)]
+        self.bundle_path = os.path.join(base_dir, bundle)
+        self.cache_dir = cache_dir or os.path.join(base_dir, CACHE_FOLDER)
+        self.bundle = None
+        self.images = {}
+        self.sounds = {}
+        self.surfaces = {}
+        # music is streamed by the mixer, so the file object must stay alive
+        self.music_files = {}
+        self.stats = {"hits": 0, "misses": 0, "disk_cache_hits": 0, "disk_cache_misses": 0}
+        # seconds spent loading every asset
+        self.load_times = {}
+
+    # Where an asset is: ("file", path) or ("bundle", member name); raises FileNotFoundError
+    def locate(self, name):
+        for root in self.roots:
+            path = os.path.join(root, name)
+            if os.path.isfile(path):
+                return "file", path
+        if self.bundle is None and os.path.isfile(self.bundle_path):
+            self.bundle = zipfile.ZipFile(self.bundle_path)
+        if self.bundle is not None:
+            member = f"{BUNDLE_FOLDER}/{name}"
+            if member in self.bundle.namelist():
+                return "bundle", member
+        raise FileNotFoundError(f"Asset {name} not found in {', '.join(self.roots)} or {self.bundle_path}")
+
+    def read_bytes(self, location):
+        kind, path = location
+        if kind == "bundle":
+            return self.bundle.read(path)
+        with open(path, "rb") as asset_file:
+            return asset_file.read()
+
+    # (size, modification time) of the source, used to validate cache files without reading the source
+    def source_stamp(self, location):
+        kind, path = location
+        if kind == "bundle":
+            info = self.bundle.getinfo(path)
+            return [info.file_size, list(info.date_time)]
+        status = os.stat(path)
+        return [status.st_size, status.st_mtime_ns]
+
+    def cached(self, cache, name, load):
+        if name in cache:
+            self.stats["hits"] += 1
+            return cache[name]
+        self.stats["misses"] += 1
+        start_time = time.perf_counter()
+        cache[name] = load(name)
+        self.load_times[name] = time.perf_counter() - start_time
+        return cache[name]
+
+    # An image converted to the display format (with alpha if alpha is True), loaded once
+    def image(self, name, alpha=False):
+        def load(name):
+            image = pygame.image.load(io.BytesIO(self.read_bytes(self.locate(name))), name)
+            return image.convert_alpha() if alpha else image.convert()
+        return self.cached(self.images, name, load)
+
+    def sound(self, name):
+        def load(name):
+            return pygame.mixer.Sound(io.BytesIO(self.read_bytes(self.locate(name))))
+        return self.cached(self.sounds, name, load)
+
+    # a file object for pygame.mixer.music.load
+    def music(self, name):
+        return self.cached(self.music_files, name, lambda name: io.BytesIO(self.read_bytes(self.locate(name))))
+
+    # One shared surface filled with color for all sprites of this size and color
+    def solid_surface(self, size, color):
+        key = (tuple(size), tuple(color))
+        surface = self.surfaces.get(key)
+        if surface is None:
+            surface = self.surfaces[key] = pygame.Surface(size)
+            surface.fill(color)
+        return surface
+
+    # The background image in display format, from the on-disk cache when it is still valid
+    def background(self, name):
+        return self.cached(self.images, name, self.load_background)
+
+    def cache_paths(self, name):
+        stem = name.replace("/", "_").replace("\\", "_")
+        return os.path.join(self.cache_dir, stem + ".json"), os.path.join(self.cache_dir, stem + ".pixels")
+
+    def load_background(self, name):
+        location = self.locate(name)
+        header_path, pixels_path = self.cache_paths(name)
+        stamp = self.source_stamp(location)
+        header = None
+        if os.path.exists(header_path) and os.path.exists(pixels_path):
+            with open(header_path) as header_file:
+                header = json.load(header_file)
+            if header.get("version") != CACHE_VERSION:
+                header = None
+        source_data = None
+        if header is not None and header["stamp"] != stamp:
+            # the file was touched or replaced: only a different hash makes the cache invalid
+            source_data = self.read_bytes(location)
+            if hashlib.sha1(source_data).hexdigest() == header["sha1"]:
+                header["stamp"] = stamp
+                self.write_header(header_path, header)
+            else:
+                header = None
+        if header is not None:
+            with open(pixels_path, "rb") as pixels_file:
+                pixels = pixels_file.read()
+            self.stats["disk_cache_hits"] += 1
+            return pygame.image.fromstring(pixels, tuple(header["size"]), "RGBX").convert()
+
+        self.stats["disk_cache_misses"] += 1
+        if source_data is None:
+            source_data = self.read_bytes(location)
+        image = pygame.image.load(io.BytesIO(source_data), name).convert()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # the header is written last, a half-written cache is never used
+        if os.path.exists(header_path):
+            os.remove(header_path)
+        with open(pixels_path, "wb") as pixels_file:
+            pixels_file.write(pygame.image.tostring(image, "RGBX"))
+        self.write_header(header_path, {"version": CACHE_VERSION, "source": name, "stamp": stamp,
+                                        "sha1": hashlib.sha1(source_data).hexdigest(), "size": list(image.get_size())})
+        return image
+
+    def write_header(self, header_path, header):
+        with open(header_path, "w") as header_file:
+            json.dump(header, header_file)
+
+    # bytes of pixel data held by the cached surfaces
+    def memory_bytes(self):
+        surfaces = list(self.images.values()) + list(self.surfaces.values())
+        return sum(surface.get_width() * surface.get_height() * surface.get_bytesize() for surface in surfaces)
+
+    def report(self):
+        loads = ", ".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in self.load_times.items())
+        return (f"assets: {self.stats['hits']} hits, {self.stats['misses']} misses, "
+                f"disk cache {self.stats['disk_cache_hits']} hits/{self.stats['disk_cache_misses']} misses, "
+                f"{len(self.surfaces)} shared surfaces, {self.memory_bytes() / 2 ** 20:.1f} MB cached; loads: {loads}")
@@ -0,0 +1,138 @@
+# Collision detection for the side-scrolling game with a spatial hash broad phase.
+# Every sprite is registered once with a collision layer (player, enemy, boss, collectible) and
+# stored in the cells of a uniform grid that its rect overlaps. sync() moves only the sprites whose cells
+# changed since the last frame and forgets sprites that were killed, so a query only compares the sprites
+# that share a cell with the queried rect instead of every sprite of the layer. Registered sprites keep the
+# size of their rect, only the position may change.
+#
+#   world = SpatialHash()
+#   world.add(enemy, ENEMY)
+#   world.sync()
+#   for collectible in world.query(player.rect, COLLECTIBLE): ...
+#
+# The bullets of projectiles.py are not sprites: query() finds the sprites near them and the projectile
+# manager checks all bullets against those at once.
+
+# cell size in pixels: the 50 px sprites cover one or two cells and seldom move to other cells
+CELL_SIZE = 128
+
+# collision layers
+PLAYER = "player"
+ENEMY = "enemy"
+BOSS = "boss"
+COLLECTIBLE = "collectible"
+LAYERS = (PLAYER, ENEMY, BOSS, COLLECTIBLE)
+
+class SpatialHash:
+    def __init__(self, cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+        # layer -> {(cell x, cell y): {sprite: None}}, dicts keep the insertion order so results are deterministic
+        self.cells = {layer: {} for layer in LAYERS}
+        # sprite -> (layer, (first cell x, first cell y, last cell x, last cell y),
+        #            (min left, max left, min top, max top) of the rect positions that cover the same cells)
+        self.entries = {}
+        # layer -> {sprite: None}, the sprites of every layer
+        self.members = {layer: {} for layer in LAYERS}
+
+    # the cells covered by a rect
+    def cell_range(self, rect):
+        size = self.cell_size
+        return (rect.left // size, rect.top // size,
+                (rect.right - 1) // size, (rect.bottom - 1) // size)
+
+    # the range of rect.left and rect.top that keeps a rect of this size in the same cells
+    def position_bounds(self, rect, cells):
+        size = self.cell_size
+        first_x, first_y, last_x, last_y = cells
+        width, height = rect.size
+        return (max(first_x * size, last_x * size - width + 1),
+                min(first_x * size + size, last_x * size + size - width + 1) - 1,
+                max(first_y * size, last_y * size - height + 1),
+                min(first_y * size + size, last_y * size + size - height + 1) - 1)
+
+    def insert(self, sprite, layer, cells):
+        grid = self.cells[layer]
+        first_x, first_y, last_x, last_y = cells
+        for cell_x in range(first_x, last_x + 1):
+            for cell_y in range(first_y, last_y + 1):
+                bucket = grid.get((cell_x, cell_y))
+                if bucket is None:
+                    bucket = grid[(cell_x, cell_y)] = {}
+                bucket[sprite] = None
+
+    def discard(self, sprite, layer, cells):
+        grid = self.cells[layer]
+        first_x, first_y, last_x, last_y = cells
+        for cell_x in range(first_x, last_x + 1):
+            for cell_y in range(first_y, last_y + 1):
+                bucket = grid.get((cell_x, cell_y))
+                if bucket is not None:
+                    bucket.pop(sprite, None)
+                    if not bucket:
+                        del grid[(cell_x, cell_y)]
+
+    # register a sprite on a layer, a sprite that is already registered moves to the new layer
+    def add(self, sprite, layer):
+        if sprite in self.entries:
+            self.remove(sprite)
+        cells = self.cell_range(sprite.rect)
+        self.entries[sprite] = (layer, cells, self.position_bounds(sprite.rect, cells))
+        self.members[layer][sprite] = None
+        self.insert(sprite, layer, cells)
+
+    def remove(self, sprite):
+        entry = self.entries.pop(sprite, None)
+        if entry is not None:
+            del self.members[entry[0]][sprite]
+            self.discard(sprite, entry[0], entry[1])
+
+    # Update the grid after the sprites moved: only sprites that entered other cells are moved,
+    # sprites that are no longer in any sprite group (killed) are removed.
+    # If the caller knows which sprites can have moved, only those are checked (sprites); killed sprites
+    # that are not checked are removed later by a full sync or when a query finds them.
+    def sync(self, sprites=None):
+        killed, moved = [], []
+        entries = self.entries
+        checked = entries.keys() if sprites is None else [sprite for sprite in sprites if sprite in entries]
+        # this loop can run over every sprite each frame: most sprites stay inside the position bounds of
+        # their cells, which costs two comparisons instead of computing the cells again
+        for sprite in checked:
+            min_left, max_left, min_top, max_top = entries[sprite][2]
+            if not sprite.alive():
+                killed.append(sprite)
+                continue
+            rect = sprite.rect
+            if not (min_left <= rect.x <= max_left and min_top <= rect.y <= max_top):
+                moved.append(sprite)
+        for sprite in killed:
+            self.remove(sprite)
+        for sprite in moved:
+            layer, old_cells, _ = self.entries[sprite]
+            cells = self.cell_range(sprite.rect)
+            self.discard(sprite, layer, old_cells)
+            self.entries[sprite] = (layer, cells, self.position_bounds(sprite.rect, cells))
+            self.insert(sprite, layer, cells)
+
+    # sprites of a layer whose rect overlaps rect, in a stable order
+    def query(self, rect, layer):
+        grid = self.cells[layer]
+        first_x, first_y, last_x, last_y = self.cell_range(rect)
+        found = {}
+        for cell_x in range(first_x, last_x + 1):
+            for cell_y in range(first_y, last_y + 1):
+                bucket = grid.get((cell_x, cell_y))
+                if bucket:
+                    found.update(bucket)
+        hits = []
+        for sprite in found:
+            if not sprite.alive():
+                self.remove(sprite)
+            elif rect.colliderect(sprite.rect):
+                hits.append(sprite)
+        return hits
+
+    # number of registered sprites per layer and number of occupied cells
+    def stats(self):
+        counts = {layer: len(members) for layer, members in self.members.items()}
+        counts["cells"] = sum(len(grid) for grid in self.cells.values())
+        return counts
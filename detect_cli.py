@@ -0,0 +1,213 @@
+# Headless command line interface of the YOLOv8 detector, no display needed.
+#
+# Detect objects in image files and write annotated images plus detections as JSON and/or CSV:
+#   python detect_cli.py detect "images/*.jpg" --output results --backend onnx
+#
+# Benchmark latency (p50/p95/p99) and throughput on a synthetic image set,
+# for every combination of batch size, input resolution and thread count:
+#   python detect_cli.py bench --batch-sizes 1 4 8 --image-sizes 320 640 --threads 1 2 4
+import argparse
+import csv
+import json
+import os
+import time
+from collections import Counter
+
+import cv2
+import numpy as np
+
+from detector import BATCH_SIZE, DEFAULT_BACKEND, Detector, detections_to_records, expand_image_patterns
+from inference_backends import BACKENDS, CONFIDENCE_THRESHOLD, IMAGE_SIZE, IOU_THRESHOLD
+from metrics import METRICS
+from tiling import PREVIEW_MAX_SIDE, TILE_OVERLAP, TILE_SIZE, open_image_source, preview_scale, scale_detections
+
+# the synthetic benchmark images are always the same: fixed seed, size and number of images
+SYNTHETIC_SEED = 2024
+SYNTHETIC_IMAGE_COUNT = 32
+SYNTHETIC_IMAGE_SHAPE = (720, 1280)
+PERCENTILES = (50, 95, 99)
+
+# Synthetic benchmark image set: noisy backgrounds with random rectangles, circles and lines,
+# generated from a fixed seed so that every run (and every machine) measures the same pixels
+def synthetic_images(count=SYNTHETIC_IMAGE_COUNT, shape=SYNTHETIC_IMAGE_SHAPE, seed=SYNTHETIC_SEED):
+    rng = np.random.default_rng(seed)
+    height, width = shape
+    images = []
+    for _ in range(count):
+        image = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+        image = cv2.GaussianBlur(image, (0, 0), 8)
+        for _ in range(int(rng.integers(3, 12))):
+            color = tuple(int(channel) for channel in rng.integers(0, 256, size=3))
+            x, y = int(rng.integers(0, width)), int(rng.integers(0, height))
+            size = int(rng.integers(20, min(height, width) // 3))
+            shape_type = rng.integers(0, 3)
+            if shape_type == 0:
+                cv2.rectangle(image, (x, y), (x + size, y + size // 2), color, -1)
+            elif shape_type == 1:
+                cv2.circle(image, (x, y), size // 2, color, -1)
+            else:
+                cv2.line(image, (x, y), (x + size, y + size), color, 6)
+        images.append(image)
+    return images
+
+# Output file of every input image below the output folder: the path relative to the folder all inputs have in
+# common, without the extension, plus suffix, so a/x.jpg and b/x.jpg become a/x_detected.jpg and b/x_detected.jpg.
+# Inputs that would still map to the same file (x.jpg and x.png) keep their extension, e.g. x_png_detected.jpg.
+def output_paths(paths, output, suffix):
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in paths])
+    stems = [os.path.splitext(os.path.relpath(os.path.abspath(path), root))[0] for path in paths]
+    counts = Counter(stems)
+    names = [f"{stem}_{os.path.splitext(path)[1][1:]}" if counts[stem] > 1 else stem
+             for path, stem in zip(paths, stems)]
+    return {path: os.path.join(output, name + suffix) for path, name in zip(paths, names)}
+
+# Write an annotated image, creating the sub folder it goes into
+def write_image(path, image):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    cv2.imwrite(path, image)
+
+# "detect" subcommand
+def run_detect(args):
+    paths = expand_image_patterns(args.patterns)
+    if not paths:
+        print("No images match " + " ".join(args.patterns))
+        return 1
+    os.makedirs(args.output, exist_ok=True)
+    detector = Detector(args.backend, args.weights, args.conf, args.iou, args.image_size, args.threads)
+
+    records = []
+    start_time = time.perf_counter()
+    if args.slice:
+        output_files = output_paths(paths, args.output, "_detected_preview.jpg")
+        # very large images: detection tile by tile, boxes are drawn on a downscaled preview
+        for path in paths:
+            # an unreadable or unsupported file is skipped like in the normal mode, the batch goes on
+            try:
+                source = open_image_source(path)
+                detections = detector.detect_sliced(source, args.tile_size, args.tile_overlap)
+            except (OSError, ValueError) as error:
+                print(f"Could not read {path}: {error}")
+                continue
+            records.append({"file": path, "detections": detections_to_records(detections, detector.names)})
+            if not args.no_images:
+                preview = source.read_preview(PREVIEW_MAX_SIDE)
+                annotated = detector.annotate(preview, scale_detections(detections, preview_scale(source, preview)))
+                write_image(output_files[path], annotated)
+    else:
+        output_files = output_paths(paths, args.output, "_detected.jpg")
+        for path, image, detections in detector.detect_files(paths, args.batch_size):
+            if image is None:
+                print(f"Could not read {path}")
+                continue
+            records.append({"file": path, "detections": detections_to_records(detections, detector.names)})
+            if not args.no_images:
+                write_image(output_files[path], detector.annotate(image, detections))
+    elapsed = time.perf_counter() - start_time
+
+    if "json" in args.format:
+        with open(os.path.join(args.output, "detections.json"), "w") as json_file:
+            json.dump(records, json_file, indent=2)
+    if "csv" in args.format:
+        with open(os.path.join(args.output, "detections.csv"), "w", newline="") as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(["file", "label", "class_id", "score", "x1", "y1", "x2", "y2"])
+            for record in records:
+                for detection in record["detections"]:
+                    writer.writerow([record["file"], detection["label"], detection["class_id"],
+                                     detection["score"], *detection["box"]])
+    print(f"{len(records)} images in {elapsed:.2f} s ({len(records) / elapsed:.1f} images/sec), "
+          f"results in {args.output}")
+    return 0
+
+# Time `iterations` model calls with batches of batch_size images,
+# returns the latency of every call in seconds and the total time
+def time_batches(detector, images, batch_size, iterations):
+    latencies = []
+    start_time = time.perf_counter()
+    for iteration in range(iterations):
+        first = (iteration * batch_size) % len(images)
+        batch = [images[(first + offset) % len(images)] for offset in range(batch_size)]
+        call_start = time.perf_counter()
+        detector.detect(batch)
+        latencies.append(time.perf_counter() - call_start)
+    return latencies, time.perf_counter() - start_time
+
+# "bench" subcommand
+def run_bench(args):
+    images = synthetic_images(args.images)
+    rows = []
+    print(f"{'backend':<12}{'threads':>8}{'size':>6}{'batch':>6}"
+          + "".join(f"{f'p{p} ms':>10}" for p in PERCENTILES) + f"{'images/sec':>12}")
+    for threads in args.threads:
+        for image_size in args.image_sizes:
+            # the runtime reads the thread count when the model is loaded, so every combination gets its own model
+            detector = Detector(args.backend, args.weights, image_size=image_size, threads=threads)
+            # a model exported with a fixed input size runs at that size whatever was asked for,
+            # the rows show the size that was actually measured
+            effective_size = detector.backend.image_size
+            if effective_size != image_size:
+                print(f"{args.weights or args.backend} has a fixed input size of {effective_size}, "
+                      f"--image-sizes {image_size} is measured at {effective_size}")
+            for batch_size in args.batch_sizes:
+                time_batches(detector, images, batch_size, args.warmup)
+                latencies, total = time_batches(detector, images, batch_size, args.iterations)
+                percentiles = np.percentile(np.array(latencies) * 1000, PERCENTILES)
+                row = {"backend": args.backend, "threads": threads, "image_size": effective_size,
+                       "requested_image_size": image_size,
+                       "batch_size": batch_size, "images_per_sec": batch_size * args.iterations / total}
+                row.update({f"p{p}_ms": float(value) for p, value in zip(PERCENTILES, percentiles)})
+                rows.append(row)
+                print(f"{args.backend:<12}{threads:>8}{effective_size:>6}{batch_size:>6}"
+                      + "".join(f"{value:>10.1f}" for value in percentiles) + f"{row['images_per_sec']:>12.1f}")
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump(rows, json_file, indent=2)
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless YOLOv8 object detection")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    # options shared by both subcommands
+    model_options = argparse.ArgumentParser(add_help=False)
+    model_options.add_argument("--backend", choices=list(BACKENDS), default=DEFAULT_BACKEND)
+    model_options.add_argument("--weights", default=None,
+                               help="model file, defaults to yolov8n exported for the backend")
+    model_options.add_argument("--metrics-json", default=None,
+                               help="write the per-stage timings (decode, preprocess, inference, nms, ...) to this file")
+
+    detect_parser = subcommands.add_parser("detect", parents=[model_options],
+                                           help="detect objects in image files")
+    detect_parser.add_argument("patterns", nargs="+", help="image files, folders or glob patterns")
+    detect_parser.add_argument("--output", default="detections")
+    detect_parser.add_argument("--format", nargs="+", choices=["json", "csv"], default=["json", "csv"])
+    detect_parser.add_argument("--no-images", action="store_true", help="do not write annotated images")
+    detect_parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    detect_parser.add_argument("--conf", type=float, default=CONFIDENCE_THRESHOLD)
+    detect_parser.add_argument("--iou", type=float, default=IOU_THRESHOLD)
+    detect_parser.add_argument("--image-size", type=int, default=IMAGE_SIZE)
+    detect_parser.add_argument("--threads", type=int, default=None)
+    detect_parser.add_argument("--slice", action="store_true",
+                               help="detect very large images tile by tile (see tiling.py)")
+    detect_parser.add_argument("--tile-size", type=int, default=TILE_SIZE)
+    detect_parser.add_argument("--tile-overlap", type=float, default=TILE_OVERLAP)
+
+    bench_parser = subcommands.add_parser("bench", parents=[model_options],
+                                          help="latency and throughput on a synthetic image set")
+    bench_parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8])
+    bench_parser.add_argument("--image-sizes", type=int, nargs="+", default=[320, 640])
+    bench_parser.add_argument("--threads", type=int, nargs="+", default=[os.cpu_count() or 1])
+    bench_parser.add_argument("--images", type=int, default=SYNTHETIC_IMAGE_COUNT,
+                              help="number of synthetic images")
+    bench_parser.add_argument("--iterations", type=int, default=20, help="timed model calls per combination")
+    bench_parser.add_argument("--warmup", type=int, default=3, help="untimed model calls per combination")
+    bench_parser.add_argument("--json", default=None, help="also write the results to this JSON file")
+
+    args = parser.parse_args(argv)
+    status = run_detect(args) if args.command == "detect" else run_bench(args)
+    if args.metrics_json:
+        METRICS.export_json(args.metrics_json)
+    return status
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,303 @@
+# Local detection service: several clients can share a pool of detector processes.
+#
+#   python detection_server.py --workers 4 --backend onnx --port 8000
+#
+# Endpoints (HTTP on 127.0.0.1):
+#   POST /detect    body is an encoded image (JPEG, PNG, ...), answer is JSON with the detections
+#   GET  /health    status, number of workers, queue depth and class names of the model (503 while unhealthy)
+#   GET  /metrics   Prometheus text: request/queue/batch timings and counters
+#
+# Every worker process loads its own model. A micro-batcher thread groups concurrent requests into
+# batches of up to --max-batch images, waiting at most --max-wait-ms for a batch to fill, and only
+# dispatches a batch when a worker is free, so batches grow on their own when the service is busy.
+# At most --max-pending requests wait for a worker; above that the server answers 503 (backpressure).
+# When a worker process dies the pool is broken: the requests of the batches in flight fail with 500 and
+# the batcher starts a new pool; if that fails too, /health reports "unhealthy" and requests fail at once
+# until a new pool starts (tried again every POOL_RESTART_DELAY seconds).
+# The Tk app uses the service with: python TkinterApp.py --backend remote --weights http://127.0.0.1:8000
+import argparse
+import json
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+
+from detector import DEFAULT_BACKEND, Detector, detections_to_records
+from inference_backends import BACKENDS, CONFIDENCE_THRESHOLD, IMAGE_SIZE, IOU_THRESHOLD
+from metrics import MetricsRegistry
+
+DEFAULT_PORT = 8000
+DEFAULT_WORKERS = 2
+MAX_BATCH_SIZE = 8
+MAX_WAIT_MS = 10
+# requests that may wait for a worker before new requests are rejected with 503
+MAX_PENDING = 64
+# a request that has not been answered after this many seconds gets 504
+REQUEST_TIMEOUT = 30.0
+# seconds between two attempts to start a new worker pool after the last attempt failed
+POOL_RESTART_DELAY = 5.0
+
+# the Detector of a worker process, created once by init_worker
+worker_detector = None
+
+def init_worker(backend_name, weights, confidence, iou, image_size, threads):
+    global worker_detector
+    worker_detector = Detector(backend_name, weights, confidence, iou, image_size, threads)
+    worker_detector.warmup()
+
+# decode one encoded image, None if it is not an image, so one bad request does not fail its whole batch
+def decode_image(data):
+    try:
+        return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    except cv2.error:
+        return None
+
+# runs in a worker process: decode and detect one batch of encoded images,
+# returns the detections (or None for undecodable images) and the inference time
+def detect_batch(encoded_images):
+    images = [decode_image(data) for data in encoded_images]
+    readable = [image for image in images if image is not None]
+    start_time = time.perf_counter()
+    results = iter(worker_detector.detect(readable) if readable else [])
+    inference_seconds = time.perf_counter() - start_time
+    return ([detections_to_records(next(results), worker_detector.names) if image is not None else None
+             for image in images], inference_seconds)
+
+# names of the classes of the model, read in a worker so the server process never loads a model
+def worker_names():
+    return list(worker_detector.names)
+
+# One image waiting for detection, the HTTP handler thread waits on its future
+class PendingRequest:
+    __slots__ = ("data", "future", "queued_at")
+
+    def __init__(self, data):
+        self.data = data
+        self.future = Future()
+        self.queued_at = time.perf_counter()
+
+# Pool of worker processes plus the micro-batcher that feeds it
+class DetectionService:
+    def __init__(self, workers, model_settings, max_batch=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS,
+                 max_pending=MAX_PENDING):
+        self.workers = workers
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.pending = queue.Queue(maxsize=max_pending)
+        # one batch in flight per worker, the batcher waits for a free worker before it closes a batch
+        self.free_workers = threading.Semaphore(workers)
+        self.metrics = MetricsRegistry(prefix="detection_server")
+        self.counters = {"requests_total": 0, "rejected_total": 0, "failed_total": 0,
+                         "batches_total": 0, "batched_images_total": 0, "pool_restarts_total": 0}
+        self.counters_lock = threading.Lock()
+        self.model_settings = model_settings
+        self.pool = self.create_pool()
+        self.names = self.pool.submit(worker_names).result()
+        # False while the pool is broken and no new one could be started
+        self.healthy = True
+        self.last_restart = 0.0
+        self.running = True
+        threading.Thread(target=self.batch_loop, daemon=True).start()
+
+    def create_pool(self):
+        # spawn: the workers must not inherit the threads of the server process
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=init_worker, initargs=self.model_settings)
+
+    # A worker process died and the pool takes no more batches: start a new pool. Only the batcher thread
+    # calls this, it is the only thread that submits to the pool.
+    def restart_pool(self):
+        self.last_restart = time.perf_counter()
+        self.count("pool_restarts_total")
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        try:
+            self.pool = self.create_pool()
+            self.pool.submit(worker_names).result()
+            self.healthy = True
+        except Exception as error:
+            print(f"Detection workers could not be restarted: {error}")
+            self.healthy = False
+
+    def fail_batch(self, batch, error):
+        self.count("failed_total", len(batch))
+        for request in batch:
+            request.future.set_exception(error)
+
+    def count(self, name, amount=1):
+        with self.counters_lock:
+            self.counters[name] += amount
+
+    # called by the HTTP handler threads, raises queue.Full when the service is overloaded
+    def submit(self, data):
+        request = PendingRequest(data)
+        self.pending.put_nowait(request)
+        self.count("requests_total")
+        return request.future
+
+    def batch_loop(self):
+        while self.running:
+            self.free_workers.acquire()
+            try:
+                first = self.pending.get(timeout=0.5)
+            except queue.Empty:
+                self.free_workers.release()
+                continue
+            # collect more requests until the batch is full or the oldest request waited max_wait
+            batch = [first]
+            deadline = first.queued_at + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                try:
+                    batch.append(self.pending.get(timeout=remaining) if remaining > 0 else self.pending.get_nowait())
+                except queue.Empty:
+                    break
+            dispatched_at = time.perf_counter()
+            for request in batch:
+                self.metrics.observe("queue wait", dispatched_at - request.queued_at)
+            self.count("batches_total")
+            self.count("batched_images_total", len(batch))
+            if not self.healthy and time.perf_counter() - self.last_restart < POOL_RESTART_DELAY:
+                self.free_workers.release()
+                self.fail_batch(batch, RuntimeError("detection workers are not available"))
+                continue
+            encoded_images = [request.data for request in batch]
+            try:
+                future = self.pool.submit(detect_batch, encoded_images)
+            except BrokenProcessPool:
+                # a worker died during an earlier batch: this batch goes to a new pool
+                self.restart_pool()
+                try:
+                    future = self.pool.submit(detect_batch, encoded_images)
+                except RuntimeError as error:
+                    # no pool could be started (a shut down pool raises RuntimeError, a broken one too)
+                    self.free_workers.release()
+                    self.fail_batch(batch, error)
+                    continue
+            future.add_done_callback(lambda done, batch=batch, start=dispatched_at: self.finish_batch(done, batch, start))
+
+    def finish_batch(self, done, batch, dispatched_at):
+        self.free_workers.release()
+        self.metrics.observe("batch", time.perf_counter() - dispatched_at)
+        try:
+            results, inference_seconds = done.result()
+        except Exception as error:
+            self.fail_batch(batch, error)
+            return
+        self.metrics.observe("inference", inference_seconds)
+        for request, records in zip(batch, results):
+            request.future.set_result(records)
+
+    def health(self):
+        status = "stopping" if not self.running else "ok" if self.healthy else "unhealthy"
+        return {"status": status, "workers": self.workers,
+                "queue": self.pending.qsize(), "max_batch": self.max_batch, "names": self.names}
+
+    def prometheus_text(self):
+        lines = [self.metrics.prometheus_text()]
+        with self.counters_lock:
+            counters = dict(self.counters)
+        for name, value in counters.items():
+            lines.append(f"# TYPE detection_server_{name} counter\ndetection_server_{name} {value}\n")
+        lines.append(f"# TYPE detection_server_queue_depth gauge\ndetection_server_queue_depth {self.pending.qsize()}\n")
+        return "".join(lines)
+
+    def shutdown(self):
+        self.running = False
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+def make_handler(service):
+    class DetectionHandler(BaseHTTPRequestHandler):
+        # HTTP/1.1 keeps connections of the load generator and the Tk client open between requests
+        protocol_version = "HTTP/1.1"
+
+        def send_body(self, status, body, content_type="application/json", headers=()):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def send_json(self, status, data, headers=()):
+            self.send_body(status, json.dumps(data).encode(), headers=headers)
+
+        def do_GET(self):
+            if self.path == "/health":
+                health = service.health()
+                self.send_json(200 if health["status"] == "ok" else 503, health)
+            elif self.path == "/metrics":
+                self.send_body(200, service.prometheus_text().encode(), "text/plain; version=0.0.4")
+            else:
+                self.send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/detect":
+                self.send_json(404, {"error": "not found"})
+                return
+            start_time = time.perf_counter()
+            data = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if not data:
+                self.send_json(400, {"error": "empty body, POST an encoded image"})
+                return
+            try:
+                future = service.submit(data)
+            except queue.Full:
+                service.count("rejected_total")
+                self.send_json(503, {"error": "overloaded"}, headers=[("Retry-After", "1")])
+                return
+            try:
+                records = future.result(timeout=REQUEST_TIMEOUT)
+            except TimeoutError:
+                self.send_json(504, {"error": "timeout"})
+                return
+            except Exception as error:
+                self.send_json(500, {"error": str(error)})
+                return
+            service.metrics.observe("request", time.perf_counter() - start_time)
+            if records is None:
+                self.send_json(400, {"error": "could not decode image"})
+            else:
+                self.send_json(200, {"detections": records})
+
+        def log_message(self, format, *args):
+            pass
+
+    return DetectionHandler
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local YOLOv8 detection service with a pool of worker processes")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--backend", choices=[name for name in BACKENDS if name != "remote"], default=DEFAULT_BACKEND)
+    parser.add_argument("--weights", default=None)
+    parser.add_argument("--conf", type=float, default=CONFIDENCE_THRESHOLD)
+    parser.add_argument("--iou", type=float, default=IOU_THRESHOLD)
+    parser.add_argument("--image-size", type=int, default=IMAGE_SIZE)
+    parser.add_argument("--threads", type=int, default=None, help="CPU threads per worker")
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH_SIZE)
+    parser.add_argument("--max-wait-ms", type=float, default=MAX_WAIT_MS)
+    parser.add_argument("--max-pending", type=int, default=MAX_PENDING)
+    args = parser.parse_args(argv)
+
+    model_settings = (args.backend, args.weights, args.conf, args.iou, args.image_size, args.threads)
+    service = DetectionService(args.workers, model_settings, args.max_batch, args.max_wait_ms, args.max_pending)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(service))
+    server.daemon_threads = True
+    print(f"Detection service with {args.workers} workers on http://127.0.0.1:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+
+if __name__ == "__main__":
+    main()
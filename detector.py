@@ -0,0 +1,207 @@
+# Detection core without any GUI, used by TkinterApp.py and by the headless detect_cli.py.
+# Detector runs an inference backend over images and image files in batches,
+# DetectionCache keeps results so that the same pixels are never detected twice.
+import glob
+import hashlib
+import os
+import threading
+import time
+from collections import Counter, OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from inference_backends import (CONFIDENCE_THRESHOLD, IMAGE_SIZE, IOU_THRESHOLD, create_backend,
+                                 draw_detections)
+from metrics import timed
+from tiling import TILE_BATCH_SIZE, TILE_OVERLAP, TILE_SIZE, sliced_predict
+
+DEFAULT_BACKEND = 'pytorch'
+# file extensions that are picked up when a folder is scanned for images
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp")
+# number of images handed to the model in one call
+BATCH_SIZE = 8
+# number of threads used to decode images while the model is busy with the previous batch
+DECODE_WORKERS = 4
+
+# cv2.imread measured as the decode stage, None if the file cannot be decoded
+@timed("decode")
+def read_image(path):
+    return cv2.imread(path)
+
+# All image files of a folder, sorted by name
+def list_images(folder):
+    return [os.path.join(folder, name) for name in sorted(os.listdir(folder))
+            if name.lower().endswith(IMAGE_EXTENSIONS)]
+
+# Expand glob patterns (and folders) into a sorted list of image files without duplicates
+def expand_image_patterns(patterns):
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            paths.extend(list_images(pattern))
+        else:
+            paths.extend(path for path in glob.glob(pattern, recursive=True)
+                         if path.lower().endswith(IMAGE_EXTENSIONS))
+    return sorted(set(paths))
+
+# Summarize the Detections of one image as (number of objects, "label xcount, ...") for the results table
+def summarize_detections(detections, names):
+    labels = [names[int(class_id)] for class_id in detections.class_ids]
+    counts = Counter(labels)
+    return len(labels), ", ".join(f"{label} x{count}" for label, count in counts.items())
+
+# Detections of one image as a list of plain dicts, for JSON and CSV output
+def detections_to_records(detections, names):
+    return [{"label": names[int(class_id)], "class_id": int(class_id), "score": round(float(score), 4),
+             "box": [round(float(value), 1) for value in box]}
+            for box, score, class_id in zip(detections.boxes, detections.scores, detections.class_ids)]
+
+# One cached detection: the annotated image in RGB (None if it was never drawn), the (number of objects, labels)
+# summary (None if it was never computed) and the Detections themselves (None if they were not kept)
+CachedDetection = namedtuple("CachedDetection", ["annotated_rgb", "summary", "detections"], defaults=[None])
+
+# One image of Detector.detect_file_batches: image and detections are None if the file cannot be decoded,
+# cache_key is None without a cache and cached is the cache entry the detections were taken from, if any
+FileDetection = namedtuple("FileDetection", ["path", "image", "detections", "cache_key", "cached"])
+
+# LRU cache of detection results so that resizing the window or loading the same image again
+# never runs the model a second time. It can be shared between threads, so it is locked.
+class DetectionCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    # the key is a hash of the pixels plus every setting that changes the detections
+    @staticmethod
+    def make_key(image, model_name, confidence=CONFIDENCE_THRESHOLD, iou=IOU_THRESHOLD):
+        digest = hashlib.blake2b(image.data if image.flags.c_contiguous else image.tobytes(), digest_size=16)
+        return (digest.hexdigest(), image.shape, str(image.dtype), model_name, confidence, iou)
+
+    # every entry is counted with a small fixed overhead so that summary-only entries are bounded too
+    @staticmethod
+    def entry_size(entry):
+        size = 256 + (entry.annotated_rgb.nbytes if entry.annotated_rgb is not None else 0)
+        if entry.detections is not None:
+            size += sum(array.nbytes for array in entry.detections)
+        return size
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            # move the entry to the end, the front of the OrderedDict is the least recently used one
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        size = self.entry_size(entry)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            old_entry = self.entries.pop(key, None)
+            if old_entry is not None:
+                self.current_bytes -= self.entry_size(old_entry)
+            self.entries[key] = entry
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.current_bytes -= self.entry_size(evicted)
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.entries), "bytes": self.current_bytes,
+                    "hits": self.hits, "misses": self.misses}
+
+# Headless detector: an inference backend plus batching over images and image files.
+# A backend that is already loaded can be passed in, e.g. the one TkinterApp.py shares between its threads,
+# together with the lock those threads hold for every model call.
+class Detector:
+    def __init__(self, backend_name=DEFAULT_BACKEND, weights=None, confidence=CONFIDENCE_THRESHOLD,
+                 iou=IOU_THRESHOLD, image_size=IMAGE_SIZE, threads=None, backend=None, lock=None):
+        self.backend = backend or create_backend(backend_name, weights, confidence=confidence, iou=iou,
+                                                 image_size=image_size, threads=threads)
+        self.backend_name = backend_name
+        self.lock = lock or threading.Lock()
+        # backend and weights identify the model, e.g. in a DetectionCache key
+        self.model_name = f"{backend_name}:{self.backend.weights}"
+
+    @property
+    def names(self):
+        return self.backend.names
+
+    # one Detections per BGR image, all images in one model call
+    def detect(self, images):
+        with self.lock:
+            return self.backend.predict(images)
+
+    # copy of the BGR image with boxes, labels and confidence drawn on it
+    def annotate(self, image, detections):
+        return draw_detections(image, detections, self.names)
+
+    def warmup(self):
+        self.backend.warmup()
+
+    # Detections of a very large image, read tile by tile from an image source (see tiling.py)
+    def detect_sliced(self, source, tile_size=TILE_SIZE, overlap=TILE_OVERLAP, batch_size=TILE_BATCH_SIZE):
+        return sliced_predict(self.backend, source, tile_size, overlap, batch_size, self.backend.iou)
+
+    # Detect objects in image files batch by batch, yields (path, image, detections) in the order of paths.
+    # Files are decoded on a thread pool while the model works on the previous batch,
+    # files that cannot be decoded are yielded with image and detections set to None.
+    def detect_files(self, paths, batch_size=BATCH_SIZE, decode_workers=DECODE_WORKERS, cache=None):
+        for results, _ in self.detect_file_batches(paths, batch_size, decode_workers, cache):
+            for result in results:
+                yield result.path, result.image, result.detections
+
+    # Like detect_files, but yields one list of FileDetection per batch together with the seconds the model call
+    # of that batch took. With a DetectionCache, images that were detected before are answered from it and new
+    # detections are added to it. The decode thread pool can be given as decode_executor, it is not shut down.
+    def detect_file_batches(self, paths, batch_size=BATCH_SIZE, decode_workers=DECODE_WORKERS, cache=None,
+                            decode_executor=None):
+        batches = [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
+        if not batches:
+            return
+        if decode_executor is None:
+            with ThreadPoolExecutor(max_workers=decode_workers) as decode_executor:
+                yield from self.detect_file_batches(paths, batch_size, cache=cache, decode_executor=decode_executor)
+            return
+        next_images = decode_executor.map(read_image, batches[0])
+        for index, batch_paths in enumerate(batches):
+            images = list(next_images)
+            if index + 1 < len(batches):
+                next_images = decode_executor.map(read_image, batches[index + 1])
+
+            results = []
+            # entries of the cache that have no Detections, their annotated image is kept when they are replaced
+            stale_entries = {}
+            for position, (path, image) in enumerate(zip(batch_paths, images)):
+                cache_key = cached = None
+                if image is not None and cache is not None:
+                    cache_key = cache.make_key(image, self.model_name, self.backend.confidence, self.backend.iou)
+                    cached = cache.get(cache_key)
+                    if cached is not None and cached.detections is None:
+                        stale_entries[position], cached = cached, None
+                results.append(FileDetection(path, image, cached.detections if cached else None, cache_key, cached))
+
+            # one model call for all readable images that are not in the cache
+            pending = [position for position, result in enumerate(results)
+                       if result.image is not None and result.cached is None]
+            start_time = time.perf_counter()
+            detections = self.detect([results[position].image for position in pending]) if pending else []
+            seconds = time.perf_counter() - start_time
+            for position, image_detections in zip(pending, detections):
+                results[position] = results[position]._replace(detections=image_detections)
+                if cache is not None:
+                    stale_entry = stale_entries.get(position)
+                    cache.put(results[position].cache_key,
+                              CachedDetection(stale_entry.annotated_rgb if stale_entry is not None else None,
+                                              summarize_detections(image_detections, self.names), image_detections))
+            yield results, seconds
@@ -0,0 +1,167 @@
+# Enemy movement of the side-scrolling game for large hordes.
+# The state of all enemies (position, size, speed, direction, health and behaviour as an integer code) is
+# kept in NumPy arrays, struct-of-arrays style, and one vectorized pass per frame moves every enemy with
+# its patrol, follow or boss behaviour. The sprites stay for collisions and drawing, but only the sprites
+# near the camera view get their rect updated; the others keep their last rect until they come close.
+#
+#   system = EnemySystem(patrol_max_x=SCREEN_WIDTH - 50)
+#   system.add(enemy, FOLLOW, speed=2, health=150)
+#   system.update(player.rect.x, camera_view)
+import numpy as np
+import pygame
+
+# behaviour codes
+PATROL = 0
+FOLLOW = 1
+BOSS = 2
+BEHAVIOURS = {"patrol": PATROL, "follow": FOLLOW, "boss": BOSS}
+
+# followers start walking towards the player when it is closer than this
+FOLLOW_RANGE = 200
+# sprites this far outside the camera view are still synced, so no sprite is seen at an old position
+SYNC_MARGIN = 64
+# initial number of slots, the arrays double when they are full
+ENEMY_CAPACITY = 256
+
+# A sprite whose position and health live in an EnemySystem
+class EnemySprite(pygame.sprite.Sprite):
+    system = None
+    index = None
+    # health when the sprite is no longer in the system
+    detached_health = 0
+
+    @property
+    def health(self):
+        if self.index is None:
+            return self.detached_health
+        return int(self.system.health[self.index])
+
+    @health.setter
+    def health(self, value):
+        if self.index is None:
+            self.detached_health = value
+        else:
+            self.system.health[self.index] = value
+
+    # a killed enemy also leaves the system
+    def kill(self):
+        if self.system is not None:
+            self.system.remove(self)
+        super().kill()
+
+class EnemySystem:
+    def __init__(self, patrol_max_x, capacity=ENEMY_CAPACITY):
+        # patrolling enemies turn around at x = 0 and at patrol_max_x
+        self.patrol_max_x = patrol_max_x
+        self.count = 0
+        self.sprites = []
+        # the sprites whose rect was updated by the last update(), the only ones that moved
+        self.synced = []
+        # x and speed keep sub-pixel precision, the rects get the rounded x
+        self.x = np.zeros(capacity, dtype=np.float64)
+        self.y = np.zeros(capacity, dtype=np.int32)
+        self.width = np.zeros(capacity, dtype=np.int32)
+        self.height = np.zeros(capacity, dtype=np.int32)
+        self.speed = np.zeros(capacity, dtype=np.float64)
+        self.direction = np.ones(capacity, dtype=np.int32)
+        self.health = np.zeros(capacity, dtype=np.int32)
+        self.behaviour = np.zeros(capacity, dtype=np.int8)
+        # x range of every patrolling enemy
+        self.patrol_left = np.zeros(capacity, dtype=np.int32)
+        self.patrol_right = np.zeros(capacity, dtype=np.int32)
+
+    def arrays(self):
+        return (self.x, self.y, self.width, self.height, self.speed, self.direction, self.health, self.behaviour,
+                self.patrol_left, self.patrol_right)
+
+    def __len__(self):
+        return self.count
+
+    def grow(self):
+        for name in ("x", "y", "width", "height", "speed", "direction", "health", "behaviour", "patrol_left",
+                     "patrol_right"):
+            old = getattr(self, name)
+            new = np.zeros(len(old) * 2, dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    # Add a sprite at the position of its rect, returns its index. A patrolling enemy turns around at the
+    # ends of patrol_range (left x, right x), by default 0 and patrol_max_x.
+    def add(self, sprite, behaviour, speed, health, direction=1, patrol_range=None):
+        if self.count == len(self.x):
+            self.grow()
+        index = self.count
+        rect = sprite.rect
+        patrol_left, patrol_right = patrol_range or (0, self.patrol_max_x)
+        for array, value in zip(self.arrays(), (rect.x, rect.y, rect.width, rect.height, speed, direction, health,
+                                                behaviour, patrol_left, patrol_right)):
+            array[index] = value
+        self.sprites.append(sprite)
+        sprite.system = self
+        sprite.index = index
+        self.count += 1
+        return index
+
+    # Remove a sprite, the last enemy moves into its slot so the arrays stay packed
+    def remove(self, sprite):
+        index = sprite.index
+        if index is None or sprite.system is not self:
+            return
+        sprite.detached_health = int(self.health[index])
+        last = self.count - 1
+        if index != last:
+            for array in self.arrays():
+                array[index] = array[last]
+            moved = self.sprites[last]
+            self.sprites[index] = moved
+            moved.index = index
+        self.sprites.pop()
+        self.count -= 1
+        sprite.index = None
+
+    def clear(self):
+        for sprite in self.sprites:
+            sprite.detached_health = int(self.health[sprite.index])
+            sprite.index = None
+        self.sprites = []
+        self.synced = []
+        self.count = 0
+
+    # the current position of a sprite, its rect is only up to date near the camera view
+    def position(self, sprite):
+        return round(float(self.x[sprite.index])), int(self.y[sprite.index])
+
+    # Move all enemies one frame towards or around target_x (the player), then copy the positions to the
+    # sprites that overlap sync_rect (the camera view) grown by SYNC_MARGIN
+    def update(self, target_x, sync_rect):
+        count = self.count
+        if count == 0:
+            self.synced = []
+            return
+        x, speed, direction = self.x[:count], self.speed[:count], self.direction[:count]
+        behaviour = self.behaviour[:count]
+
+        # patrol: walk and turn around at the ends of the patrol range
+        patrol = behaviour == PATROL
+        x += np.where(patrol, speed * direction, 0)
+        direction[patrol & ((x >= self.patrol_right[:count]) | (x <= self.patrol_left[:count]))] *= -1
+
+        # follow: walk towards the target when it is close
+        follow = (behaviour == FOLLOW) & (np.abs(x - target_x) < FOLLOW_RANGE)
+        x += np.where(follow, np.sign(target_x - x) * speed, 0)
+
+        # boss: always walks towards the target
+        x += np.where(behaviour == BOSS, np.where(x < target_x, speed, -speed), 0)
+
+        self.sync_sprites(sync_rect.inflate(2 * SYNC_MARGIN, 2 * SYNC_MARGIN))
+
+    # copy the array positions to the rects of the sprites overlapping area
+    def sync_sprites(self, area):
+        count = self.count
+        x, y = self.x[:count], self.y[:count]
+        visible = np.flatnonzero((x + self.width[:count] > area.left) & (x < area.right)
+                                 & (y + self.height[:count] > area.top) & (y < area.bottom))
+        sprites = self.sprites
+        self.synced = [sprites[index] for index in visible.tolist()]
+        for sprite, left, top in zip(self.synced, np.rint(x[visible]).astype(np.int32).tolist(), y[visible].tolist()):
+            sprite.rect.topleft = (left, top)
@@ -0,0 +1,192 @@
+# Frame profiler of the side-scrolling game: an overlay and a trace export.
+# While the profiler is on, every frame collects the seconds of its phases (the simulation phases of
+# simulate_tick, the draw phases of draw_frame and the display update) and the counts of entities and
+# surfaces. The overlay shows the FPS, a graph of the last frame times against the 60 FPS budget, the
+# milliseconds per phase and the counts; it is drawn again only every few frames. The trace mode keeps
+# every frame and writes them to a Chrome trace-event JSON (open it in chrome://tracing or Perfetto) or a
+# CSV file. While both are off, begin_frame returns None and the game skips all timing.
+#
+#   profiler = FrameProfiler(small_font)
+#   phase_times = profiler.begin_frame()       # None while the profiler is off
+#   simulate_tick(keys, phase_times)
+#   profiler.end_frame(counts)
+#   rect = profiler.draw(screen)               # when profiler.overlay is True
+#   profiler.toggle_trace("frames.json")       # start, and write the file when toggled again (.json or .csv)
+import csv
+import json
+import time
+from collections import deque
+
+import pygame
+
+from hud import TextCache
+
+WHITE = (255, 255, 255)
+GREEN = (0, 255, 0)
+YELLOW = (255, 215, 0)
+RED = (255, 0, 0)
+# frames shown in the graph and averaged for the phase times
+HISTORY_FRAMES = 120
+# the overlay is drawn again after this many frames
+OVERLAY_REFRESH_FRAMES = 10
+FRAME_BUDGET_MS = 1000 / 60
+GRAPH_HEIGHT = 60
+PANEL_COLOR = (0, 0, 0, 170)
+PANEL_PADDING = 6
+TRACE_PATH = "frame_trace.json"
+
+class FrameProfiler:
+    def __init__(self, font, position=(10, 60)):
+        self.text = TextCache(font)
+        self.line_height = font.get_linesize()
+        self.position = position
+        self.overlay = False
+        # the trace is written to this file, None while no trace is recorded
+        self.trace_path = None
+        # (start seconds, seconds of work, {phase: seconds}, {name: count}) of every traced frame
+        self.frames = []
+        self.frame_history = deque(maxlen=HISTORY_FRAMES)
+        self.phase_history = deque(maxlen=HISTORY_FRAMES)
+        self.counts = {}
+        # phase times of the current frame, None while the profiler is off
+        self.phase_times = None
+        self.frame_start = None
+        self.previous_start = None
+        self.surface = None
+        self.frames_to_refresh = 0
+        self.start_time = time.perf_counter()
+
+    @property
+    def active(self):
+        return self.overlay or self.trace_path is not None
+
+    def toggle_overlay(self):
+        self.overlay = not self.overlay
+        self.frames_to_refresh = 0
+
+    # Start recording a trace to path, or stop and write the recorded trace. Returns the path written or None.
+    def toggle_trace(self, path=None):
+        if self.trace_path is None:
+            self.trace_path = path or TRACE_PATH
+            self.frames = []
+            return None
+        path, self.trace_path = self.trace_path, None
+        write_trace(path, self.frames)
+        print(f"Frame trace with {len(self.frames)} frames written to {path}")
+        self.frames = []
+        return path
+
+    # the next frame does not count the time since the last one, e.g. after a scene was shown in between
+    def skip_interval(self):
+        self.previous_start = None
+
+    # Start a frame, returns the dict its phases add their seconds to, or None if the profiler is off
+    def begin_frame(self):
+        if not self.active:
+            self.phase_times = None
+            return None
+        self.frame_start = time.perf_counter()
+        self.phase_times = {}
+        return self.phase_times
+
+    # End the frame started by begin_frame, counts are the entity and surface counts to show and trace
+    def end_frame(self, counts):
+        if self.phase_times is None:
+            return
+        start = self.frame_start
+        # a frame lasts from its start to the start of the next one, the first one only as long as its phases
+        if self.previous_start is not None:
+            self.frame_history.append(start - self.previous_start)
+        self.previous_start = start
+        self.phase_history.append(self.phase_times)
+        self.counts = counts
+        if self.trace_path is not None:
+            work_seconds = time.perf_counter() - start
+            self.frames.append((start - self.start_time, work_seconds, self.phase_times, counts))
+        self.phase_times = None
+
+    # Draw the overlay on screen, returns its rect
+    def draw(self, screen):
+        start = time.perf_counter()
+        if self.surface is None or self.frames_to_refresh <= 0:
+            self.surface = self.render()
+            self.frames_to_refresh = OVERLAY_REFRESH_FRAMES
+        self.frames_to_refresh -= 1
+        rect = screen.blit(self.surface, self.position)
+        if self.phase_times is not None:
+            self.phase_times["profiler"] = self.phase_times.get("profiler", 0.0) + time.perf_counter() - start
+        return rect
+
+    # averages of the history: (fps, frame ms, {phase: ms})
+    def averages(self):
+        frame_ms = sum(self.frame_history) * 1000 / len(self.frame_history) if self.frame_history else 0.0
+        phases = {}
+        for phase_times in self.phase_history:
+            for name, seconds in phase_times.items():
+                phases[name] = phases.get(name, 0.0) + seconds
+        count = max(len(self.phase_history), 1)
+        return (1000 / frame_ms if frame_ms else 0.0), frame_ms, {name: seconds * 1000 / count
+                                                                  for name, seconds in phases.items()}
+
+    def render(self):
+        fps, frame_ms, phases = self.averages()
+        lines = [f"FPS {fps:5.1f}  frame {frame_ms:5.2f} ms  work {sum(phases.values()):5.2f} ms"]
+        lines.extend(f"{name:<11} {ms:6.3f} ms" for name, ms in phases.items())
+        lines.append("  ".join(f"{name} {count}" for name, count in self.counts.items()))
+        if self.trace_path is not None:
+            lines.append(f"tracing {len(self.frames)} frames")
+        width = max(HISTORY_FRAMES * 2, max(sum(self.text.glyph(character, WHITE).get_width() for character in line)
+                                            for line in lines))
+        height = GRAPH_HEIGHT + len(lines) * self.line_height
+        surface = pygame.Surface((width + 2 * PANEL_PADDING, height + 3 * PANEL_PADDING), pygame.SRCALPHA)
+        surface.fill(PANEL_COLOR)
+
+        # frame times, the line is the 60 FPS budget at the middle of the graph
+        graph_bottom = PANEL_PADDING + GRAPH_HEIGHT
+        scale = GRAPH_HEIGHT / (2 * FRAME_BUDGET_MS)
+        for index, seconds in enumerate(self.frame_history):
+            ms = seconds * 1000
+            color = GREEN if ms <= FRAME_BUDGET_MS else YELLOW if ms <= 2 * FRAME_BUDGET_MS else RED
+            bar_height = min(GRAPH_HEIGHT, max(1, int(ms * scale)))
+            surface.fill(color, (PANEL_PADDING + index * 2, graph_bottom - bar_height, 2, bar_height))
+        budget_y = graph_bottom - int(FRAME_BUDGET_MS * scale)
+        pygame.draw.line(surface, WHITE, (PANEL_PADDING, budget_y), (PANEL_PADDING + width, budget_y))
+
+        # the text changes every refresh, it is put together from cached glyphs
+        y = graph_bottom + PANEL_PADDING
+        for line in lines:
+            self.text.draw_glyphs(surface, line, (PANEL_PADDING, y), WHITE)
+            y += self.line_height
+        return surface
+
+# Write traced frames to path: a CSV file if it ends with .csv, otherwise a Chrome trace-event JSON where
+# the phases of a frame follow each other from the start of the frame
+def write_trace(path, frames):
+    phases = []
+    count_names = []
+    for _, _, phase_times, counts in frames:
+        phases.extend(name for name in phase_times if name not in phases)
+        count_names.extend(name for name in counts if name not in count_names)
+    if path.endswith(".csv"):
+        with open(path, "w", newline="") as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(["frame", "start_ms", "work_ms"] + [f"{phase}_ms" for phase in phases] + count_names)
+            for index, (start, seconds, phase_times, counts) in enumerate(frames):
+                writer.writerow([index, f"{start * 1000:.3f}", f"{seconds * 1000:.4f}"]
+                                + [f"{phase_times.get(phase, 0.0) * 1000:.4f}" for phase in phases]
+                                + [counts.get(name, "") for name in count_names])
+        return
+    events = []
+    for index, (start, seconds, phase_times, counts) in enumerate(frames):
+        start_us = start * 1e6
+        events.append({"name": "frame", "ph": "X", "ts": start_us, "dur": seconds * 1e6, "pid": 1, "tid": 1,
+                       "args": {"frame": index}})
+        phase_start = start_us
+        for name, phase_seconds in phase_times.items():
+            events.append({"name": name, "ph": "X", "ts": phase_start, "dur": phase_seconds * 1e6, "pid": 1,
+                           "tid": 2})
+            phase_start += phase_seconds * 1e6
+        if counts:
+            events.append({"name": "counts", "ph": "C", "ts": start_us, "pid": 1, "args": counts})
+    with open(path, "w") as trace_file:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, trace_file)
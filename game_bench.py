@@ -0,0 +1,153 @@
+# Headless benchmark of the side-scrolling game (PygameQ2_02.py).
+# The game runs with the SDL dummy video and audio drivers, no window, sound card or keyboard needed:
+# the player is moved by a scripted input and the simulation runs with fixed steps as fast as possible.
+# The report shows ticks/sec and the time per tick of every phase (input, player, enemies,
+# collisions, level, draw) for scenes with 10, 1,000 and 10,000 enemies.
+# With --level the player instead runs through a level file (e.g. a long level made with levels.py), which
+# shows that the streaming keeps the number of active entities and the time per tick flat.
+#
+#   python game_bench.py --entities 10 1000 10000 --ticks 300
+#   python game_bench.py --level long.level --ticks 5000 --scroll-speed 40
+import argparse
+import json
+import time
+
+import numpy as np
+import pygame
+
+import PygameQ2_02 as game
+
+BENCH_SEED = 2024
+PHASES = ("input", "player", "streaming", "enemies", "collisions", "level", "draw")
+
+# the player walks right and back while shooting, and jumps now and then
+BENCH_SCRIPT = [
+    (100, [pygame.K_RIGHT, pygame.K_SPACE]),
+    (20, [pygame.K_RIGHT, pygame.K_SPACE, pygame.K_UP]),
+    (100, [pygame.K_LEFT, pygame.K_SPACE]),
+    (20, [pygame.K_LEFT, pygame.K_SPACE, pygame.K_UP]),
+]
+
+# the player runs right through a level while shooting
+LEVEL_SCRIPT = [(1, [pygame.K_RIGHT, pygame.K_SPACE])]
+
+# add enemies spread over the first level_width pixels of the level until there are `count` of them
+def spawn_enemies(count, level_width=None):
+    level_width = level_width or game.background_width
+    while len(game.enemies) < count:
+        game.add_enemy(game.Enemy(game.rng.randint(0, level_width - 50), game.SCREEN_HEIGHT - 150))
+
+# A new game on level 1 with `entities` enemies
+def setup_scene(entities, seed, level_width=None):
+    game.new_game(seed=seed)
+    game.enemies.empty()
+    game.all_sprites.empty()
+    game.enemy_system.clear()
+    game.all_sprites.add(game.player)
+    spawn_enemies(entities, level_width)
+
+# extra bullets at random heights across the camera view, to measure thousands of live projectiles
+def spawn_bullets(count, rng):
+    view_left = -game.camera.camera.x
+    game.bullets.spawn(rng.uniform(view_left, view_left + game.SCREEN_WIDTH, count),
+                       rng.uniform(0, game.SCREEN_HEIGHT, count), 10)
+
+# Run `ticks` simulation steps (and draw every frame unless draw is False), returns the result dict.
+# bullets is the number of extra bullets spawned every tick besides the ones the player fires,
+# level_width the width over which the enemies are spread (default: the background).
+def run_scene(entities, ticks, draw=True, seed=BENCH_SEED, bullets=0, level_width=None):
+    setup_scene(entities, seed, level_width)
+    script = game.ScriptedInput(BENCH_SCRIPT)
+    rng = np.random.default_rng(seed)
+    phase_times = dict.fromkeys(PHASES, 0.0)
+    start_time = time.perf_counter()
+    for tick in range(ticks):
+        if bullets:
+            spawn_bullets(bullets, rng)
+        game.simulate_tick(script.keys_for_tick(tick), phase_times)
+        if draw:
+            draw_start = time.perf_counter()
+            game.draw_frame()
+            game.renderer.present()
+            phase_times["draw"] += time.perf_counter() - draw_start
+        # enemies killed by the player come back, so every tick sees the same number of entities
+        spawn_enemies(entities, level_width)
+    elapsed = sum(phase_times.values())
+    wall_time = time.perf_counter() - start_time
+    result = {"entities": entities, "ticks": ticks, "ticks_per_sec": ticks / elapsed,
+              "wall_seconds": wall_time, "live_bullets": game.bullets.live, "pooled_bullets": game.bullets.pooled}
+    result.update({f"{phase}_ms": phase_times[phase] * 1000 / ticks for phase in PHASES})
+    return result
+
+# Run through the level file at path for `ticks` steps, the player moves scroll_speed pixels per tick
+def run_level(path, ticks, draw=True, seed=BENCH_SEED, scroll_speed=None):
+    game.LEVEL_FILES = [path]
+    game.new_game(seed=seed)
+    if scroll_speed:
+        game.player.speed = scroll_speed
+    script = game.ScriptedInput(LEVEL_SCRIPT)
+    phase_times = dict.fromkeys(PHASES, 0.0)
+    max_active = 0
+    worst_tick = 0.0
+    start_time = time.perf_counter()
+    for tick in range(ticks):
+        tick_start = time.perf_counter()
+        game.simulate_tick(script.keys_for_tick(tick), phase_times)
+        if draw:
+            draw_start = time.perf_counter()
+            game.draw_frame()
+            game.renderer.present()
+            phase_times["draw"] += time.perf_counter() - draw_start
+        worst_tick = max(worst_tick, time.perf_counter() - tick_start)
+        max_active = max(max_active, len(game.level_stream.active))
+    elapsed = sum(phase_times.values())
+    stream = game.level_stream
+    result = {"level": path, "ticks": ticks, "ticks_per_sec": ticks / elapsed,
+              "wall_seconds": time.perf_counter() - start_time, "worst_tick_ms": worst_tick * 1000,
+              "player_x": game.player.rect.x, "max_active": max_active, "dormant_enemies": stream.dormant_enemies,
+              "stream_bytes": stream.memory_bytes()}
+    result.update(stream.stats)
+    result.update({f"{phase}_ms": phase_times[phase] * 1000 / ticks for phase in PHASES})
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless benchmark of the side-scrolling game")
+    parser.add_argument("--entities", type=int, nargs="+", default=[10, 1000, 10000])
+    parser.add_argument("--ticks", type=int, default=300, help="simulation steps per scene")
+    parser.add_argument("--bullets", type=int, default=0, help="extra bullets spawned every tick")
+    parser.add_argument("--level-width", type=int, default=None,
+                        help="spread the enemies over this many pixels (default: the width of the background)")
+    parser.add_argument("--level", default=None, help="run through this level file instead of the scenes")
+    parser.add_argument("--scroll-speed", type=int, default=None,
+                        help="with --level: pixels the player moves per tick (default: the player speed)")
+    parser.add_argument("--no-draw", action="store_true", help="only run the simulation, no drawing")
+    parser.add_argument("--seed", type=int, default=BENCH_SEED)
+    parser.add_argument("--json", default=None, help="also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    game.init_game(headless=True)
+    if args.level:
+        result = run_level(args.level, args.ticks, not args.no_draw, args.seed, args.scroll_speed)
+        print("\n".join(f"{name:>16}: {value:.3f}" if isinstance(value, float) else f"{name:>16}: {value}"
+                        for name, value in result.items()))
+        if args.json:
+            with open(args.json, "w") as json_file:
+                json.dump(result, json_file, indent=2)
+        pygame.quit()
+        return
+    print(f"{'entities':>9}{'ticks/sec':>11}" + "".join(f"{phase + ' ms':>15}" for phase in PHASES)
+          + f"{'bullets':>9}")
+    results = []
+    for entities in args.entities:
+        result = run_scene(entities, args.ticks, not args.no_draw, args.seed, args.bullets, args.level_width)
+        print(f"{entities:>9}{result['ticks_per_sec']:>11.1f}"
+              + "".join(f"{result[phase + '_ms']:>15.3f}" for phase in PHASES) + f"{result['live_bullets']:>9}")
+        results.append(result)
+    print(game.assets.report())
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump(results, json_file, indent=2)
+    pygame.quit()
+
+if __name__ == "__main__":
+    main()
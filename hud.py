@@ -0,0 +1,127 @@
+# HUD and text rendering of the side-scrolling game with cached surfaces.
+# TextCache renders every (text, color) once and keeps the surfaces of the most recently used strings,
+# numbers are put together from cached glyphs so changing counters never call font.render. Health bars are
+# cached by (width, filled width) and all bars of a frame are drawn with one blits call. The HUD panel
+# (background and labels) is baked into one overlay when it is created; only the values are drawn on a
+# copy of it, and only when one of them changed. A frame then costs one blit for the HUD, whatever the
+# number of enemies.
+#
+#   hud = Hud(screen, font)
+#   rects = hud.draw_health_bars(visible_sprites, offset)   # sprites with a health_bar() method
+#   rect = hud.draw(score=player.score, lives=player.lives, level=current_level)
+#   text = hud.text.render("Paused", True, WHITE)           # a drop-in for font.render
+from collections import OrderedDict
+
+import pygame
+
+WHITE = (255, 255, 255)
+RED = (255, 0, 0)
+GREEN = (0, 255, 0)
+# text surfaces kept by TextCache, the least recently used ones are dropped first
+TEXT_CACHE_SIZE = 256
+HEALTH_BAR_HEIGHT = 10
+# the HUD fields in the order they are shown and the number of digits there is room for
+HUD_FIELDS = (("Score", 7), ("Lives", 2), ("Level", 2))
+PANEL_COLOR = (0, 0, 0, 140)
+PANEL_PADDING = 8
+
+class TextCache:
+    def __init__(self, font, size=TEXT_CACHE_SIZE):
+        self.font = font
+        self.size = size
+        self.texts = OrderedDict()
+        self.glyphs = {}
+        self.stats = {"hits": 0, "renders": 0}
+
+    # The surface of a text, like font.render; the surface is shared, callers must not draw on it
+    def render(self, text, antialias, color):
+        key = (text, antialias, tuple(color))
+        surface = self.texts.get(key)
+        if surface is not None:
+            self.stats["hits"] += 1
+            self.texts.move_to_end(key)
+            return surface
+        self.stats["renders"] += 1
+        surface = self.texts[key] = self.font.render(text, antialias, color)
+        if len(self.texts) > self.size:
+            self.texts.popitem(last=False)
+        return surface
+
+    # one character, kept for good: the glyphs of the counters are a small set
+    def glyph(self, character, color):
+        key = (character, tuple(color))
+        surface = self.glyphs.get(key)
+        if surface is None:
+            self.stats["renders"] += 1
+            surface = self.glyphs[key] = self.font.render(character, True, color)
+        return surface
+
+    # Draw text on surface at position from cached glyphs, returns the rect covered
+    def draw_glyphs(self, surface, text, position, color):
+        x, y = position
+        batch = []
+        for character in text:
+            glyph = self.glyph(character, color)
+            batch.append((glyph, (x, y)))
+            x += glyph.get_width()
+        rects = surface.blits(batch)
+        return rects[0].unionall(rects[1:]) if rects else pygame.Rect(position, (0, 0))
+
+class Hud:
+    def __init__(self, screen, font, position=(10, 10)):
+        self.screen = screen
+        self.text = TextCache(font)
+        self.position = position
+        self.bars = {}
+        # pre-baked panel: background and labels, and the x of every value
+        digit_width = max(self.text.glyph(digit, WHITE).get_width() for digit in "0123456789")
+        labels = [self.text.render(f"{name}:", True, WHITE) for name, _ in HUD_FIELDS]
+        self.value_x = []
+        x = PANEL_PADDING
+        for label, (_, digits) in zip(labels, HUD_FIELDS):
+            x += label.get_width() + PANEL_PADDING // 2
+            self.value_x.append(x)
+            x += digit_width * digits + PANEL_PADDING * 2
+        height = font.get_linesize() + PANEL_PADDING
+        self.overlay = pygame.Surface((x - PANEL_PADDING, height), pygame.SRCALPHA)
+        self.overlay.fill(PANEL_COLOR)
+        for label, value_x in zip(labels, self.value_x):
+            self.overlay.blit(label, (value_x - PANEL_PADDING // 2 - label.get_width(), PANEL_PADDING // 2))
+        self.surface = self.overlay
+        self.values = None
+        self.stats = {"hud_renders": 0}
+
+    # Draw the panel with the values in the order of HUD_FIELDS, they are drawn again only when they changed.
+    # Returns the screen rect of the panel.
+    def draw(self, **values):
+        values = tuple(values[name.lower()] for name, _ in HUD_FIELDS)
+        if values != self.values:
+            self.values = values
+            self.surface = self.overlay.copy()
+            for value, value_x in zip(values, self.value_x):
+                self.text.draw_glyphs(self.surface, str(value), (value_x, PANEL_PADDING // 2), WHITE)
+            self.stats["hud_renders"] += 1
+        return self.screen.blit(self.surface, self.position)
+
+    # a health bar: red background `width` pixels wide with `filled` pixels of green over it
+    def health_bar(self, width, filled):
+        key = (width, filled)
+        surface = self.bars.get(key)
+        if surface is None:
+            # red and green cover the whole bar, so it needs no alpha
+            surface = self.bars[key] = pygame.Surface((max(width, filled, 1), HEALTH_BAR_HEIGHT))
+            surface.fill(RED, (0, 0, width, HEALTH_BAR_HEIGHT))
+            surface.fill(GREEN, (0, 0, filled, HEALTH_BAR_HEIGHT))
+        return surface
+
+    # Draw the health bars of sprites above them at the camera offset with one blits call, every sprite
+    # has a health_bar() method that returns (width, filled width). rects maps sprites to the world rect
+    # they are drawn at instead of their rect. Returns the screen rects.
+    def draw_health_bars(self, sprites, offset=(0, 0), rects=None):
+        batch = []
+        for sprite in sprites:
+            width, filled = sprite.health_bar()
+            rect = rects.get(sprite, sprite.rect) if rects else sprite.rect
+            batch.append((self.health_bar(width, max(0, filled)),
+                          (rect.x + offset[0], rect.y + offset[1] - HEALTH_BAR_HEIGHT)))
+        return self.screen.blits(batch) if batch else []
@@ -0,0 +1,407 @@
+# Interchangeable inference backends for the YOLOv8 detector.
+# Every backend is an AIModelBase, so process_image works the same way for all of them,
+# and predict() returns Detections that are drawn by the shared draw_detections.
+#
+# Backends:
+#   pytorch      ultralytics YOLO on PyTorch (yolov8n.pt)
+#   onnx         exported ONNX model on onnxruntime (yolov8n.onnx)
+#   openvino     exported OpenVINO IR model (yolov8n_openvino_model/)
+#   torchscript  exported TorchScript model (yolov8n.torchscript)
+#   remote       a running detection_server.py, the weights are its URL (http://127.0.0.1:8000)
+# onnx, openvino and torchscript share letterbox preprocessing, decoding of the raw output and NMS.
+#
+# Export a model for one of the exported backends once with
+#   python inference_backends.py export --format onnx --weights yolov8n.pt
+import argparse
+import ast
+import json
+import os
+import urllib.request
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from metrics import span, timed
+
+# Default settings of every backend
+DEFAULT_WEIGHTS = 'yolov8n.pt'
+CONFIDENCE_THRESHOLD = 0.25
+IOU_THRESHOLD = 0.7
+IMAGE_SIZE = 640
+MAX_DETECTIONS = 300
+# address of detection_server.py used by the remote backend
+DEFAULT_SERVER_URL = 'http://127.0.0.1:8000'
+
+# class names of the COCO dataset used by yolov8n, used when an exported model has no names in its metadata
+COCO_NAMES = [
+    "person", "bicycle", "car", "motorcycle", "airplane", "bus", "train", "truck", "boat", "traffic light",
+    "fire hydrant", "stop sign", "parking meter", "bench", "bird", "cat", "dog", "horse", "sheep", "cow",
+    "elephant", "bear", "zebra", "giraffe", "backpack", "umbrella", "handbag", "tie", "suitcase", "frisbee",
+    "skis", "snowboard", "sports ball", "kite", "baseball bat", "baseball glove", "skateboard", "surfboard",
+    "tennis racket", "bottle", "wine glass", "cup", "fork", "knife", "spoon", "bowl", "banana", "apple",
+    "sandwich", "orange", "broccoli", "carrot", "hot dog", "pizza", "donut", "cake", "chair", "couch",
+    "potted plant", "bed", "dining table", "toilet", "tv", "laptop", "mouse", "remote", "keyboard", "cell phone",
+    "microwave", "oven", "toaster", "sink", "refrigerator", "book", "clock", "vase", "scissors", "teddy bear",
+    "hair drier", "toothbrush",
+]
+
+# Detections of one image: boxes is an (N, 4) float array of x1, y1, x2, y2 in pixels of the original image,
+# scores is (N,) float and class_ids is (N,) int
+Detections = namedtuple("Detections", ["boxes", "scores", "class_ids"])
+
+def empty_detections():
+    return Detections(np.zeros((0, 4), np.float32), np.zeros(0, np.float32), np.zeros(0, np.int64))
+
+# Base class to implement polymorphism
+class AIModelBase:
+    def process_image(self, image):
+        raise NotImplementedError("Subclasses should implement this!")
+
+
+# Shared preprocessing
+
+# Resize image to fit a size x size square keeping its aspect ratio and pad the rest with grey, like ultralytics.
+# Returns the padded image, the scale ratio and the (left, top) padding needed to map boxes back.
+def letterbox(image, size=IMAGE_SIZE):
+    height, width = image.shape[:2]
+    ratio = min(size / height, size / width)
+    new_width, new_height = round(width * ratio), round(height * ratio)
+    if (new_width, new_height) != (width, height):
+        image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+    pad_x, pad_y = (size - new_width) / 2, (size - new_height) / 2
+    top, bottom = round(pad_y - 0.1), round(pad_y + 0.1)
+    left, right = round(pad_x - 0.1), round(pad_x + 0.1)
+    image = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+    return image, ratio, (left, top)
+
+# Turn a list of BGR images into one float32 NCHW RGB batch scaled to 0..1,
+# also returns the (ratio, padding) of every image for postprocess
+@timed("preprocess")
+def preprocess(images, size=IMAGE_SIZE):
+    batch = np.empty((len(images), 3, size, size), dtype=np.float32)
+    transforms = []
+    for index, image in enumerate(images):
+        padded, ratio, padding = letterbox(image, size)
+        # BGR -> RGB and HWC -> CHW in one step
+        np.multiply(padded[:, :, ::-1].transpose(2, 0, 1), 1 / 255.0, out=batch[index], casting="unsafe")
+        transforms.append((ratio, padding, image.shape[:2]))
+    return batch, transforms
+
+
+# Shared postprocessing
+
+# Greedy non-maximum suppression on (N, 4) xyxy boxes, returns the indices of the kept boxes
+# sorted by descending score
+def non_max_suppression(boxes, scores, iou_threshold=IOU_THRESHOLD):
+    order = scores.argsort()[::-1]
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    keep = []
+    while order.size > 0:
+        best = order[0]
+        keep.append(best)
+        rest = order[1:]
+        x1 = np.maximum(boxes[best, 0], boxes[rest, 0])
+        y1 = np.maximum(boxes[best, 1], boxes[rest, 1])
+        x2 = np.minimum(boxes[best, 2], boxes[rest, 2])
+        y2 = np.minimum(boxes[best, 3], boxes[rest, 3])
+        intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+        iou = intersection / (areas[best] + areas[rest] - intersection + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+# NMS that only suppresses boxes of the same class: every class is moved to its own region of the plane
+def batched_non_max_suppression(boxes, scores, class_ids, iou_threshold=IOU_THRESHOLD):
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=np.int64)
+    offsets = class_ids[:, None].astype(np.float32) * (boxes.max() + 1)
+    return non_max_suppression(boxes + offsets, scores, iou_threshold)
+
+# Decode the raw YOLOv8 output of shape (batch, 4 + classes, anchors) into Detections of every image,
+# the boxes are mapped back from the letterboxed input to the original image
+@timed("nms")
+def postprocess(output, transforms, confidence=CONFIDENCE_THRESHOLD, iou=IOU_THRESHOLD,
+                max_detections=MAX_DETECTIONS):
+    all_detections = []
+    for prediction, (ratio, (left, top), (height, width)) in zip(output, transforms):
+        prediction = prediction.T
+        class_scores = prediction[:, 4:]
+        class_ids = class_scores.argmax(axis=1)
+        scores = class_scores[np.arange(len(class_ids)), class_ids]
+        keep = scores > confidence
+        if not keep.any():
+            all_detections.append(empty_detections())
+            continue
+        centers, sizes = prediction[keep, 0:2], prediction[keep, 2:4]
+        boxes = np.concatenate([centers - sizes / 2, centers + sizes / 2], axis=1)
+        scores, class_ids = scores[keep], class_ids[keep]
+
+        kept = batched_non_max_suppression(boxes, scores, class_ids, iou)[:max_detections]
+        boxes = (boxes[kept] - [left, top, left, top]) / ratio
+        boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, width)
+        boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, height)
+        all_detections.append(Detections(boxes.astype(np.float32), scores[kept].astype(np.float32),
+                                         class_ids[kept].astype(np.int64)))
+    return all_detections
+
+# colour of every class, the same class always gets the same colour
+def class_color(class_id):
+    hue = (class_id * 37) % 180
+    color = cv2.cvtColor(np.uint8([[[hue, 200, 255]]]), cv2.COLOR_HSV2BGR)[0, 0]
+    return tuple(int(channel) for channel in color)
+
+# Draw bounding boxes, labels and confidence on a copy of the BGR image
+@timed("plot")
+def draw_detections(image, detections, names):
+    annotated = image.copy()
+    line_width = max(round(sum(image.shape[:2]) / 2 * 0.003), 2)
+    font_scale = line_width / 3
+    for box, score, class_id in zip(detections.boxes, detections.scores, detections.class_ids):
+        x1, y1, x2, y2 = (int(value) for value in box)
+        color = class_color(int(class_id))
+        cv2.rectangle(annotated, (x1, y1), (x2, y2), color, line_width, cv2.LINE_AA)
+        label = f"{names[int(class_id)]} {score:.2f}"
+        (text_width, text_height), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, font_scale, 1)
+        label_top = y1 - text_height - 4 if y1 - text_height - 4 >= 0 else y1
+        cv2.rectangle(annotated, (x1, label_top), (x1 + text_width, label_top + text_height + 4), color, -1)
+        cv2.putText(annotated, label, (x1, label_top + text_height + 2), cv2.FONT_HERSHEY_SIMPLEX,
+                    font_scale, (255, 255, 255), 1, cv2.LINE_AA)
+    return annotated
+
+# read the class names stored by ultralytics in the metadata of an exported model (a dict literal as text)
+def parse_names(text):
+    if not text:
+        return COCO_NAMES
+    names = ast.literal_eval(text) if isinstance(text, str) else text
+    if isinstance(names, dict):
+        return [names[index] for index in sorted(names)]
+    return list(names)
+
+
+# Backends
+
+# Common part of all backends: settings, batching and drawing
+class InferenceBackend(AIModelBase):
+    name = None
+    # ultralytics file name of the weights for this backend, made from the .pt file name
+    weights_suffix = ".pt"
+
+    # threads is the number of CPU threads of the runtime (and of OpenCV preprocessing), None keeps the default
+    def __init__(self, weights, confidence=CONFIDENCE_THRESHOLD, iou=IOU_THRESHOLD, image_size=IMAGE_SIZE,
+                 threads=None):
+        self.weights = weights
+        self.confidence = confidence
+        self.iou = iou
+        self.image_size = image_size
+        self.threads = threads
+        self.names = COCO_NAMES
+        if threads:
+            cv2.setNumThreads(threads)
+
+    # detect objects in a list of BGR images, returns one Detections per image
+    def predict(self, images):
+        raise NotImplementedError("Subclasses should implement this!")
+
+    # Method overriding: detect objects in one BGR image and return the annotated image
+    def process_image(self, image):
+        return draw_detections(image, self.predict([image])[0], self.names)
+
+    # one inference on a blank image, so that the first real image does not pay for lazy initialisation
+    def warmup(self):
+        self.predict([np.zeros((self.image_size, self.image_size, 3), dtype=np.uint8)])
+
+
+# PyTorch backend, ultralytics does its own pre- and postprocessing
+class PyTorchBackend(InferenceBackend):
+    name = "pytorch"
+
+    def __init__(self, weights, **settings):
+        super().__init__(weights, **settings)
+        from ultralytics import YOLO
+        if self.threads:
+            import torch
+            torch.set_num_threads(self.threads)
+        self.model = YOLO(weights)
+        self.names = parse_names(self.model.names)
+
+    def predict(self, images):
+        # ultralytics preprocessing and NMS are part of this call, they are measured as inference
+        with span("inference"):
+            results = self.model(list(images), conf=self.confidence, iou=self.iou, imgsz=self.image_size,
+                                 verbose=False)
+        return [Detections(result.boxes.xyxy.cpu().numpy(), result.boxes.conf.cpu().numpy(),
+                           result.boxes.cls.cpu().numpy().astype(np.int64)) for result in results]
+
+
+# Backends that run an exported graph: shared preprocess and postprocess, forward() is the runtime call
+class ExportedModelBackend(InferenceBackend):
+    # number of images the exported graph accepts in one call, None means any number
+    max_batch = 1
+
+    def forward(self, batch):
+        raise NotImplementedError("Subclasses should implement this!")
+
+    def predict(self, images):
+        images = list(images)
+        batch, transforms = preprocess(images, self.image_size)
+        step = self.max_batch or len(images)
+        with span("inference"):
+            outputs = [self.forward(batch[start:start + step]) for start in range(0, len(images), step)]
+        return postprocess(np.concatenate(outputs), transforms, self.confidence, self.iou)
+
+
+class OnnxBackend(ExportedModelBackend):
+    name = "onnx"
+    weights_suffix = ".onnx"
+
+    def __init__(self, weights, **settings):
+        super().__init__(weights, **settings)
+        try:
+            import onnxruntime
+        except ImportError as error:
+            raise ImportError("The onnx backend needs onnxruntime: pip install onnxruntime") from error
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.threads:
+            options.intra_op_num_threads = self.threads
+        self.session = onnxruntime.InferenceSession(weights, options, providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # a model exported with dynamic=True has a symbolic batch dimension
+        self.max_batch = None if not isinstance(model_input.shape[0], int) else model_input.shape[0]
+        if isinstance(model_input.shape[2], int):
+            self.image_size = model_input.shape[2]
+        self.names = parse_names(self.session.get_modelmeta().custom_metadata_map.get("names"))
+
+    def forward(self, batch):
+        return self.session.run(None, {self.input_name: batch})[0]
+
+
+class OpenVinoBackend(ExportedModelBackend):
+    name = "openvino"
+    weights_suffix = "_openvino_model"
+
+    def __init__(self, weights, **settings):
+        super().__init__(weights, **settings)
+        try:
+            import openvino
+        except ImportError as error:
+            raise ImportError("The openvino backend needs openvino: pip install openvino") from error
+        # ultralytics exports a folder with the .xml graph and a metadata.yaml
+        model_path = weights
+        if os.path.isdir(weights):
+            model_path = next(os.path.join(weights, name) for name in os.listdir(weights) if name.endswith(".xml"))
+        core = openvino.Core()
+        model = core.read_model(model_path)
+        config = {"PERFORMANCE_HINT": "THROUGHPUT"}
+        if self.threads:
+            config["INFERENCE_NUM_THREADS"] = self.threads
+        self.compiled_model = core.compile_model(model, "CPU", config)
+        self.output = self.compiled_model.output(0)
+        self.max_batch = None if model.input(0).get_partial_shape()[0].is_dynamic else 1
+        metadata_path = os.path.join(os.path.dirname(model_path), "metadata.yaml")
+        if os.path.exists(metadata_path):
+            import yaml
+            with open(metadata_path) as metadata_file:
+                self.names = parse_names(yaml.safe_load(metadata_file).get("names"))
+
+    def forward(self, batch):
+        return self.compiled_model(batch)[self.output]
+
+
+class TorchScriptBackend(ExportedModelBackend):
+    name = "torchscript"
+    weights_suffix = ".torchscript"
+
+    def __init__(self, weights, **settings):
+        super().__init__(weights, **settings)
+        import torch
+        self.torch = torch
+        if self.threads:
+            torch.set_num_threads(self.threads)
+        # ultralytics stores its metadata as json in the config.txt extra file
+        extra_files = {"config.txt": ""}
+        self.model = torch.jit.load(weights, _extra_files=extra_files, map_location="cpu").eval()
+        if extra_files["config.txt"]:
+            self.names = parse_names(json.loads(extra_files["config.txt"]).get("names"))
+
+    def forward(self, batch):
+        with self.torch.inference_mode():
+            output = self.model(self.torch.from_numpy(batch))
+        if isinstance(output, (list, tuple)):
+            output = output[0]
+        return output.cpu().numpy()
+
+
+# Client of detection_server.py: the images are sent to the server, which batches them with the requests
+# of other clients. The model, confidence and iou thresholds are the ones the server was started with.
+class RemoteBackend(InferenceBackend):
+    name = "remote"
+    # images of one predict call are sent in parallel, so that the server can put them into one batch
+    max_parallel_requests = 8
+    jpeg_quality = 95
+
+    def __init__(self, weights, **settings):
+        super().__init__(weights, **settings)
+        self.url = weights.rstrip("/")
+        with urllib.request.urlopen(self.url + "/health", timeout=10) as response:
+            self.names = parse_names(json.load(response).get("names"))
+        self.executor = ThreadPoolExecutor(max_workers=self.max_parallel_requests)
+
+    def detect_one(self, image):
+        ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ok:
+            raise ValueError("Cannot encode image for the detection server")
+        request = urllib.request.Request(self.url + "/detect", data=encoded.tobytes(), method="POST",
+                                         headers={"Content-Type": "image/jpeg"})
+        with urllib.request.urlopen(request, timeout=60) as response:
+            records = json.load(response)["detections"]
+        if not records:
+            return empty_detections()
+        return Detections(np.array([record["box"] for record in records], dtype=np.float32),
+                          np.array([record["score"] for record in records], dtype=np.float32),
+                          np.array([record["class_id"] for record in records], dtype=np.int64))
+
+    def predict(self, images):
+        with span("inference"):
+            return list(self.executor.map(self.detect_one, images))
+
+
+# backend name -> backend class, used to select a backend at startup
+BACKENDS = {backend.name: backend for backend in (PyTorchBackend, OnnxBackend, OpenVinoBackend, TorchScriptBackend,
+                                                  RemoteBackend)}
+
+# file name of the weights of a backend, e.g. yolov8n.pt -> yolov8n.onnx for the onnx backend,
+# for the remote backend it is the address of the server
+def default_weights(backend_name, weights=DEFAULT_WEIGHTS):
+    if backend_name == "remote":
+        return DEFAULT_SERVER_URL
+    stem = os.path.splitext(weights)[0]
+    return stem + BACKENDS[backend_name].weights_suffix
+
+# Create the backend called backend_name, weights defaults to the exported version of DEFAULT_WEIGHTS
+def create_backend(backend_name, weights=None, **settings):
+    if backend_name not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend_name!r}, choose one of {', '.join(BACKENDS)}")
+    return BACKENDS[backend_name](weights or default_weights(backend_name), **settings)
+
+# Export PyTorch weights for one of the exported backends, returns the path of the exported model
+def export_model(export_format, weights=DEFAULT_WEIGHTS, image_size=IMAGE_SIZE):
+    from ultralytics import YOLO
+    # only ONNX is exported with a dynamic batch dimension, so folder batches run in one call
+    return YOLO(weights).export(format=export_format, imgsz=image_size, dynamic=(export_format == "onnx"))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export YOLOv8 weights for the inference backends")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    export_parser = subcommands.add_parser("export", help="convert .pt weights for the onnx, openvino or torchscript backend")
+    export_parser.add_argument("--format", choices=[name for name in BACKENDS if name not in ("pytorch", "remote")], default="onnx")
+    export_parser.add_argument("--weights", default=DEFAULT_WEIGHTS)
+    export_parser.add_argument("--image-size", type=int, default=IMAGE_SIZE)
+    args = parser.parse_args(argv)
+    if args.command == "export":
+        print(f"Exported model: {export_model(args.format, args.weights, args.image_size)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# Compact binary input logs of the side-scrolling game.
+# A log holds the seed of the game's random generator, its simulation tick rate, the keys that were pressed in every simulation tick
+# and the state at the end of the session, which is all a headless replay needs to reproduce the session
+# tick by tick (see replay.py). The keys of a tick are one bit each in a mask, and ticks with the same mask
+# are stored as runs, so a minute of play is usually a few hundred bytes.
+#
+# Layout (little endian):
+#   header  magic "SSIL", version u8, seed u64, ticks u32, number of keys u8, tick rate u16
+#   final   score i32, lives i32, level u16, completed u8, player x i32
+#   keys    one u32 key code per bit of the mask
+#   runs    ticks u16, mask u8 until the end of the file
+#
+#   log = InputLog(seed, INPUT_KEYS, TICK_RATE)
+#   log.record(pygame.key.get_pressed())       # every tick
+#   log.finish(game_state())
+#   log.save("session.ssil")
+#   for pressed_keys in load_log("session.ssil").key_sets(): ...
+import struct
+
+MAGIC = b"SSIL"
+# version 3: sub-pixel positions, sessions of version 2 do not replay to the same state any more
+LOG_VERSION = 3
+HEADER = struct.Struct("<4sBQIBH")
+FINAL_STATE = struct.Struct("<iiHBi")
+KEY_CODE = struct.Struct("<I")
+RUN = struct.Struct("<HB")
+# the longest run a u16 can count
+MAX_RUN = 0xFFFF
+# the fields of the final state, in the order of FINAL_STATE
+STATE_FIELDS = ("score", "lives", "level", "completed", "player_x")
+
+class InputLog:
+    def __init__(self, seed, keys, tick_rate=60):
+        if len(keys) > 8:
+            raise ValueError("an input log records at most 8 keys")
+        self.seed = seed
+        self.tick_rate = tick_rate
+        self.keys = tuple(keys)
+        # [ticks, mask] of every run of ticks with the same keys
+        self.runs = []
+        self.ticks = 0
+        # the state at the end of the session, see STATE_FIELDS
+        self.final = None
+
+    # Add one tick, pressed is indexed like pygame.key.get_pressed()
+    def record(self, pressed):
+        mask = 0
+        for bit, key in enumerate(self.keys):
+            if pressed[key]:
+                mask |= 1 << bit
+        runs = self.runs
+        if runs and runs[-1][1] == mask and runs[-1][0] < MAX_RUN:
+            runs[-1][0] += 1
+        else:
+            runs.append([1, mask])
+        self.ticks += 1
+
+    def finish(self, state):
+        self.final = {field: state[field] for field in STATE_FIELDS}
+
+    # the pressed keys of every tick, as a frozenset of key codes
+    def key_sets(self):
+        sets = {}
+        for ticks, mask in self.runs:
+            pressed = sets.get(mask)
+            if pressed is None:
+                pressed = sets[mask] = frozenset(key for bit, key in enumerate(self.keys) if mask >> bit & 1)
+            for _ in range(ticks):
+                yield pressed
+
+    def to_bytes(self):
+        final = self.final or dict.fromkeys(STATE_FIELDS, 0)
+        parts = [HEADER.pack(MAGIC, LOG_VERSION, self.seed, self.ticks, len(self.keys), self.tick_rate),
+                 FINAL_STATE.pack(*(int(final[field]) for field in STATE_FIELDS))]
+        parts.extend(KEY_CODE.pack(key) for key in self.keys)
+        parts.extend(RUN.pack(ticks, mask) for ticks, mask in self.runs)
+        return b"".join(parts)
+
+    def save(self, path):
+        with open(path, "wb") as log_file:
+            log_file.write(self.to_bytes())
+
+def parse_log(data):
+    if len(data) < HEADER.size + FINAL_STATE.size:
+        raise ValueError("input log is truncated")
+    magic, version, seed, ticks, key_count, tick_rate = HEADER.unpack_from(data)
+    if magic != MAGIC or version != LOG_VERSION:
+        raise ValueError(f"not an input log of version {LOG_VERSION}")
+    offset = HEADER.size
+    final = dict(zip(STATE_FIELDS, FINAL_STATE.unpack_from(data, offset)))
+    final["completed"] = bool(final["completed"])
+    offset += FINAL_STATE.size
+    keys = [KEY_CODE.unpack_from(data, offset + index * KEY_CODE.size)[0] for index in range(key_count)]
+    offset += key_count * KEY_CODE.size
+    if (len(data) - offset) % RUN.size:
+        raise ValueError("input log is truncated")
+    log = InputLog(seed, keys, tick_rate)
+    log.runs = [list(run) for run in RUN.iter_unpack(data[offset:])]
+    log.ticks = sum(run_ticks for run_ticks, _ in log.runs)
+    if log.ticks != ticks:
+        raise ValueError(f"input log has {log.ticks} ticks, the header says {ticks}")
+    log.final = final
+    return log
+
+def load_log(path):
+    with open(path, "rb") as log_file:
+        return parse_log(log_file.read())
@@ -0,0 +1,243 @@
+# Level files of the side-scrolling game and the chunk streaming of long levels.
+# A level file is JSON lines: the first line is the header, every following line holds the entities of one
+# chunk (a vertical strip of chunk_width pixels) as a list of records [kind, x, y, ...]:
+#
+#   {"version": 1, "name": "Level 1", "width": 1920, "chunk_width": 800, "goal": "enemies", "enemies": 3,
+#    "background": [[0, "background.png"], [8000, [40, 40, 80]]], "triggers": [[1200, ["boss", 1600, 450]]]}
+#   [["enemy", [400, 800], 450], ["enemy", 500, 450, "patrol"], ["collectible", 500, 500, "health"]]
+#   []
+#
+# Records: ["enemy", x, y, movement type, health], ["collectible", x, y, type] and ["boss", x, y]; the
+# fields after y are optional (a random movement type, full health). x may be a range [low, high] for a
+# random position, the record belongs to the chunk of the low end. goal is "enemies" (defeat every enemy
+# of the level) or "boss" (defeat the boss). background lists segments [start x, image name or RGB color],
+# every image repeats until the next segment starts. A trigger [x, record] spawns its record once the right
+# edge of the camera view passes x. "enemies" is the number of enemy records, write_level counts them.
+#
+# LevelStream keeps only the chunks around the camera view active. A chunk entering the window is read from
+# the file (only the byte offsets of the chunk lines stay in memory) and its records are spawned; entities
+# leaving the window are despawned and kept as compact JSON with their current state until their chunk is
+# active again. Memory and per-frame cost depend on the size of the window, not on the length of the level.
+#
+#   stream = LevelStream("levels/level1.level", spawn_entity, entity_record, despawn_entity)
+#   for _ in stream.load(camera_view): pass     # a generator, so a transition scene can spread it over frames
+#   stream.update(camera_view)                  # every tick
+#
+# Very long test levels are made with the generator:
+#
+#   python levels.py long.level --width 2000000 --seed 1
+import argparse
+import json
+import os
+import random
+import shutil
+from array import array
+
+LEVEL_VERSION = 1
+CHUNK_WIDTH = 800
+# chunks within this many pixels of the camera view are active
+STREAM_MARGIN = 800
+# the file is scanned for chunk offsets in steps of this many lines
+SCAN_STEP = 1000
+# heights of the entities on the ground of the 600 px high game screen
+GROUND_Y = 450
+COLLECTIBLE_Y = 500
+ENEMY_WIDTH = 50
+
+# compact JSON for chunk lines and dormant chunks
+def dump_records(records):
+    return json.dumps(records, separators=(",", ":"))
+
+# the x a record is placed by: its position, or the low end of a random range
+def record_x(record):
+    x = record[1]
+    return x[0] if isinstance(x, list) else x
+
+# Write a level file. chunks is an iterable of record lists, one per chunk, so a generator can write
+# levels of any length without keeping them in memory. The enemies are counted for the header.
+def write_level(path, header, chunks):
+    header = dict({"version": LEVEL_VERSION}, **header)
+    body_path = path + ".chunks"
+    enemies = 0
+    with open(body_path, "w") as body_file:
+        for records in chunks:
+            enemies += sum(1 for record in records if record[0] == "enemy")
+            body_file.write(dump_records(records) + "\n")
+    header["enemies"] = enemies
+    with open(path, "w") as level_file, open(body_path) as body_file:
+        level_file.write(json.dumps(header) + "\n")
+        shutil.copyfileobj(body_file, level_file)
+    os.remove(body_path)
+    return header
+
+# The records of a long test level: enemies and collectibles in every chunk, background segments that
+# alternate between the image and plain colors, and a boss that is spawned near the end of the level
+def generate_level(path, width, seed=0, chunk_width=CHUNK_WIDTH, max_enemies=4, collectible_chance=0.3,
+                   segment_width=8000, image="background.png"):
+    rng = random.Random(seed)
+
+    def chunks():
+        # the first screen stays empty, the player starts there
+        for left in range(0, width, chunk_width):
+            right = min(left + chunk_width, width)
+            records = []
+            if left >= chunk_width:
+                for _ in range(rng.randint(0, max_enemies)):
+                    records.append(["enemy", rng.randint(left, right - ENEMY_WIDTH), GROUND_Y,
+                                    rng.choice(["patrol", "follow"])])
+                if rng.random() < collectible_chance:
+                    records.append(["collectible", rng.randint(left, right - 30), COLLECTIBLE_Y,
+                                    rng.choice(["health", "life"])])
+            yield records
+
+    colors = [[40, 40, 80], [60, 30, 30], [30, 60, 40]]
+    background = [[x, image if index % 2 == 0 else colors[index // 2 % len(colors)]]
+                  for index, x in enumerate(range(0, width, segment_width))]
+    header = {"name": os.path.splitext(os.path.basename(path))[0], "width": width, "chunk_width": chunk_width,
+              "goal": "boss", "background": background,
+              "triggers": [[width - 1200, ["boss", width - 400, GROUND_Y]]]}
+    return write_level(path, header, chunks())
+
+# The chunks of a level around the camera view. spawn(record, patrol_range) creates an entity from a
+# record and returns its sprite, record(sprite) returns the record of its current state (None keeps it
+# active, e.g. the boss) and despawn(sprite) removes it from the game.
+class LevelStream:
+    def __init__(self, path, spawn, record, despawn, margin=STREAM_MARGIN):
+        self.path = path
+        self.spawn = spawn
+        self.record = record
+        self.despawn = despawn
+        self.margin = margin
+        self.level_file = open(path, "rb")
+        self.header = json.loads(self.level_file.readline())
+        if self.header.get("version") != LEVEL_VERSION:
+            raise ValueError(f"{path}: unsupported level version {self.header.get('version')}")
+        self.width = self.header["width"]
+        self.chunk_width = self.header.get("chunk_width", CHUNK_WIDTH)
+        self.chunk_count = -(-self.width // self.chunk_width)
+        self.goal = self.header.get("goal", "enemies")
+        self.background = self.header.get("background", [])
+        # triggers that did not fire yet, ordered by x
+        self.triggers = sorted(self.header.get("triggers", []), key=lambda trigger: trigger[0])
+        # enemies that are not spawned yet or were despawned
+        self.dormant_enemies = self.header.get("enemies", 0)
+        # byte offset of every chunk line, filled by load()
+        self.offsets = array("q")
+        # 1 for the chunks that were read from the file
+        self.read = bytearray(self.chunk_count)
+        # chunk -> JSON of the despawned entities of that chunk
+        self.dormant = {}
+        # the active entities, in the order they were spawned
+        self.active = {}
+        # first and last active chunk
+        self.window = None
+        self.stats = {"chunks_loaded": 0, "chunks_unloaded": 0, "spawned": 0, "despawned": 0}
+
+    def close(self):
+        self.level_file.close()
+
+    # Find the chunk lines and spawn the chunks around view, yields after every scan step and every entity
+    def load(self, view):
+        offset = self.level_file.tell()
+        for line in self.level_file:
+            self.offsets.append(offset)
+            offset += len(line)
+            if len(self.offsets) % SCAN_STEP == 0:
+                yield
+        yield from self.stream(view)
+
+    def chunk_of(self, x):
+        return min(max(int(x) // self.chunk_width, 0), self.chunk_count - 1)
+
+    # first and last chunk overlapping view grown by the margin
+    def chunk_window(self, view):
+        return self.chunk_of(view.left - self.margin), self.chunk_of(view.right - 1 + self.margin)
+
+    # the records of a chunk that becomes active: from the file the first time, then the despawned ones
+    def take_chunk(self, chunk):
+        records = []
+        if not self.read[chunk]:
+            self.read[chunk] = 1
+            if chunk < len(self.offsets):
+                self.level_file.seek(self.offsets[chunk])
+                records = json.loads(self.level_file.readline())
+        dormant = self.dormant.pop(chunk, None)
+        if dormant is not None:
+            records.extend(json.loads(dormant))
+        return records
+
+    def spawn_record(self, record):
+        chunk_left = self.chunk_of(record_x(record)) * self.chunk_width
+        sprite = self.spawn(record, (chunk_left, min(chunk_left + self.chunk_width, self.width)))
+        self.active[sprite] = None
+        self.stats["spawned"] += 1
+        return sprite
+
+    # One tick: fire the triggers the view reached and move the window when the view entered another chunk
+    def update(self, view):
+        while self.triggers and view.right >= self.triggers[0][0]:
+            self.spawn_record(self.triggers.pop(0)[1])
+        if self.chunk_window(view) != self.window:
+            for _ in self.stream(view):
+                pass
+
+    # Move the window to view: despawn the entities outside it, then spawn the chunks that entered it.
+    # Yields after every spawned entity.
+    def stream(self, view):
+        first, last = self.chunk_window(view)
+        leaving = {}
+        for sprite in list(self.active):
+            if not sprite.alive():
+                # killed or picked up by the player
+                del self.active[sprite]
+                continue
+            record = self.record(sprite)
+            if record is None:
+                continue
+            chunk = self.chunk_of(record_x(record))
+            if not first <= chunk <= last:
+                leaving.setdefault(chunk, []).append(record)
+                del self.active[sprite]
+                self.despawn(sprite)
+                self.stats["despawned"] += 1
+        for chunk, records in leaving.items():
+            self.dormant_enemies += sum(1 for record in records if record[0] == "enemy")
+            if chunk in self.dormant:
+                records = json.loads(self.dormant[chunk]) + records
+            self.dormant[chunk] = dump_records(records)
+            self.stats["chunks_unloaded"] += 1
+
+        old_first, old_last = self.window or (0, -1)
+        self.window = (first, last)
+        for chunk in range(first, last + 1):
+            if old_first <= chunk <= old_last:
+                continue
+            records = self.take_chunk(chunk)
+            self.stats["chunks_loaded"] += 1
+            self.dormant_enemies -= sum(1 for record in records if record[0] == "enemy")
+            for record in records:
+                self.spawn_record(record)
+                yield
+
+    # True when no enemy is left outside the window and no trigger is waiting
+    def cleared(self):
+        return self.dormant_enemies == 0 and not self.triggers
+
+    # bytes held by the despawned chunks and the chunk offsets
+    def memory_bytes(self):
+        return sum(len(records) for records in self.dormant.values()) + self.offsets.itemsize * len(self.offsets)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a long test level for the side-scrolling game")
+    parser.add_argument("path", help="level file to write")
+    parser.add_argument("--width", type=int, default=200000, help="level width in pixels")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk-width", type=int, default=CHUNK_WIDTH)
+    parser.add_argument("--max-enemies", type=int, default=4, help="at most this many enemies per chunk")
+    args = parser.parse_args(argv)
+    header = generate_level(args.path, args.width, args.seed, args.chunk_width, args.max_enemies)
+    print(f"{args.path}: {header['width']} px, {-(-header['width'] // header['chunk_width'])} chunks, "
+          f"{header['enemies']} enemies")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# Load generator for detection_server.py: many concurrent clients send synthetic images,
+# the report shows throughput, latency percentiles and rejected (503) requests.
+#
+# Against a running server:
+#   python load_generator.py --url http://127.0.0.1:8000 --clients 16 --duration 20
+#
+# Throughput scaling with the number of workers (starts one server per worker count):
+#   python load_generator.py --spawn-workers 1 2 4 --backend onnx --clients 16 --duration 20
+import argparse
+import json
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import cv2
+import numpy as np
+
+from detect_cli import synthetic_images
+from inference_backends import BACKENDS
+
+PERCENTILES = (50, 95, 99)
+SPAWN_PORT = 8100
+# seconds to wait for a spawned server to load its models
+SPAWN_TIMEOUT = 300
+
+# encoded synthetic images, every client cycles through them
+def encoded_images(count, quality=90):
+    return [cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+            for image in synthetic_images(count)]
+
+# one client: send requests one after the other until stop_time, results go into the shared lists
+def client_loop(url, payloads, offset, stop_time, latencies, errors, lock):
+    index = offset
+    while time.perf_counter() < stop_time:
+        request = urllib.request.Request(url + "/detect", data=payloads[index % len(payloads)], method="POST",
+                                         headers={"Content-Type": "image/jpeg"})
+        start_time = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                response.read()
+            with lock:
+                latencies.append(time.perf_counter() - start_time)
+        except urllib.error.HTTPError as error:
+            with lock:
+                errors[error.code] = errors.get(error.code, 0) + 1
+            if error.code == 503:
+                # back off like a well-behaved client would after Retry-After
+                time.sleep(0.05)
+        except OSError:
+            with lock:
+                errors["connection"] = errors.get("connection", 0) + 1
+        index += 1
+
+# Run `clients` concurrent clients for `duration` seconds, returns a result dict
+def run_load(url, clients, duration, payloads):
+    latencies, errors, lock = [], {}, threading.Lock()
+    start_time = time.perf_counter()
+    stop_time = start_time + duration
+    threads = [threading.Thread(target=client_loop, args=(url, payloads, client, stop_time, latencies, errors, lock))
+               for client in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start_time
+    percentiles = np.percentile(np.array(latencies) * 1000, PERCENTILES) if latencies else [0.0] * len(PERCENTILES)
+    result = {"clients": clients, "completed": len(latencies), "images_per_sec": len(latencies) / elapsed,
+              "errors": errors}
+    result.update({f"p{p}_ms": float(value) for p, value in zip(PERCENTILES, percentiles)})
+    return result
+
+def print_result(label, result):
+    print(f"{label:<12}{result['clients']:>8}{result['completed']:>10}{result['images_per_sec']:>12.1f}"
+          + "".join(f"{result[f'p{p}_ms']:>10.1f}" for p in PERCENTILES) + f"   {result['errors'] or ''}")
+
+# Start detection_server.py with `workers` processes and wait until /health answers
+def spawn_server(workers, port, server_args):
+    process = subprocess.Popen([sys.executable, "detection_server.py", "--workers", str(workers),
+                                "--port", str(port), *server_args])
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.perf_counter() + SPAWN_TIMEOUT
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"detection_server.py exited with code {process.returncode}")
+        try:
+            with urllib.request.urlopen(url + "/health", timeout=1):
+                return process, url
+        except OSError:
+            time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError("detection_server.py did not start in time")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load generator for detection_server.py")
+    parser.add_argument("--url", default=None, help="address of a running server")
+    parser.add_argument("--spawn-workers", type=int, nargs="+", default=None,
+                        help="start a server for each of these worker counts and compare them")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of load per run")
+    parser.add_argument("--warmup", type=float, default=2.0, help="seconds of untimed load before every run")
+    parser.add_argument("--images", type=int, default=16, help="number of different synthetic images")
+    parser.add_argument("--json", default=None, help="also write the results to this JSON file")
+    # options passed to the spawned servers
+    parser.add_argument("--backend", choices=[name for name in BACKENDS if name != "remote"], default=None)
+    parser.add_argument("--weights", default=None)
+    parser.add_argument("--max-batch", type=int, default=None)
+    parser.add_argument("--max-wait-ms", type=float, default=None)
+    args = parser.parse_args(argv)
+    if (args.url is None) == (args.spawn_workers is None):
+        parser.error("use either --url or --spawn-workers")
+
+    payloads = encoded_images(args.images)
+    print(f"{'server':<12}{'clients':>8}{'requests':>10}{'images/sec':>12}"
+          + "".join(f"{f'p{p} ms':>10}" for p in PERCENTILES) + "   errors")
+    results = []
+    if args.url:
+        run_load(args.url.rstrip("/"), args.clients, args.warmup, payloads)
+        result = run_load(args.url.rstrip("/"), args.clients, args.duration, payloads)
+        print_result(args.url, result)
+        results.append(result)
+    else:
+        server_args = []
+        for option in ("backend", "weights", "max_batch", "max_wait_ms"):
+            value = getattr(args, option)
+            if value is not None:
+                server_args += ["--" + option.replace("_", "-"), str(value)]
+        for workers in args.spawn_workers:
+            process, url = spawn_server(workers, SPAWN_PORT, server_args)
+            try:
+                run_load(url, args.clients, args.warmup, payloads)
+                result = run_load(url, args.clients, args.duration, payloads)
+            finally:
+                process.terminate()
+                process.wait()
+            result["workers"] = workers
+            print_result(f"{workers} workers", result)
+            results.append(result)
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump(results, json_file, indent=2)
+
+if __name__ == "__main__":
+    main()
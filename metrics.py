@@ -0,0 +1,219 @@
+# Instrumentation of the detector: per-stage timing spans, rolling histograms and exporters.
+#
+#   with span("decode"):
+#       image = cv2.imread(path)
+#
+#   @timed()                 # records every call of the function as a stage with its name
+#   def load_preview(path): ...
+#
+# Stages used by the detector: decode, color convert, preprocess, inference, nms, plot,
+# pil convert, pyramid, resize, tk upload. All timings use the monotonic perf_counter_ns clock.
+# METRICS.export_json(path) writes a snapshot, METRICS.serve(port) starts a local
+# Prometheus text endpoint on http://127.0.0.1:<port>/metrics.
+# ProfileCapture is an opt-in cProfile / tracemalloc capture around a whole session.
+import bisect
+import cProfile
+import functools
+import json
+import pstats
+import threading
+import time
+import tracemalloc
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# upper bounds of the histogram buckets in seconds, from 0.1 ms to 10 s
+BUCKET_BOUNDS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# number of most recent samples kept per stage for percentiles
+ROLLING_WINDOW = 1024
+PERCENTILES = (50, 95, 99)
+
+# Histogram of the durations of one stage: cumulative bucket counts since the start
+# (for Prometheus) plus a rolling window of recent samples (for percentiles)
+class Histogram:
+    def __init__(self, window=ROLLING_WINDOW):
+        self.lock = threading.Lock()
+        self.bucket_counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, seconds):
+        with self.lock:
+            self.bucket_counts[bisect.bisect_left(BUCKET_BOUNDS, seconds)] += 1
+            self.count += 1
+            self.total += seconds
+            self.recent.append(seconds)
+
+    # percentiles (in seconds) of the rolling window
+    def percentiles(self, percentiles=PERCENTILES):
+        with self.lock:
+            samples = sorted(self.recent)
+        if not samples:
+            return {p: 0.0 for p in percentiles}
+        return {p: samples[min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))] for p in percentiles}
+
+    def snapshot(self):
+        percentiles = self.percentiles()
+        with self.lock:
+            return {"count": self.count,
+                    "total_ms": self.total * 1000,
+                    "mean_ms": self.total / self.count * 1000 if self.count else 0.0,
+                    **{f"p{p}_ms": value * 1000 for p, value in percentiles.items()},
+                    "buckets": {str(bound): count for bound, count in zip(BUCKET_BOUNDS + ("+Inf",),
+                                                                             self.bucket_counts)}}
+
+# Time one stage: `with registry.span("inference"):`
+class Span:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe((time.perf_counter_ns() - self.start) / 1e9)
+        return False
+
+# All histograms of a process, one per stage name
+class MetricsRegistry:
+    def __init__(self, prefix="yolo"):
+        self.prefix = prefix
+        self.histograms = {}
+        self.lock = threading.Lock()
+        self.server = None
+
+    def histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(name, Histogram())
+        return histogram
+
+    def span(self, name):
+        return Span(self.histogram(name))
+
+    def observe(self, name, seconds):
+        self.histogram(name).observe(seconds)
+
+    # decorator that records every call of a function as the stage `name` (default: the function name)
+    def timed(self, name=None):
+        def decorator(func):
+            histogram_name = name or func.__name__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(histogram_name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def snapshot(self):
+        with self.lock:
+            histograms = dict(self.histograms)
+        return {name: histogram.snapshot() for name, histogram in sorted(histograms.items())}
+
+    def export_json(self, path):
+        with open(path, "w") as json_file:
+            json.dump({"time": time.time(), "stages": self.snapshot()}, json_file, indent=2)
+
+    # Prometheus text exposition format, one histogram metric with a stage label
+    def prometheus_text(self):
+        metric = f"{self.prefix}_stage_seconds"
+        lines = [f"# HELP {metric} Duration of the detector stages in seconds.", f"# TYPE {metric} histogram"]
+        with self.lock:
+            histograms = dict(self.histograms)
+        for name, histogram in sorted(histograms.items()):
+            with histogram.lock:
+                cumulative = 0
+                for bound, count in zip(BUCKET_BOUNDS + ("+Inf",), histogram.bucket_counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_sum{{stage="{name}"}} {histogram.total}')
+                lines.append(f'{metric}_count{{stage="{name}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+    # Serve /metrics (Prometheus text) and /metrics.json on 127.0.0.1:port from a daemon thread
+    def serve(self, port):
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body, content_type = registry.prometheus_text().encode(), "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body, content_type = json.dumps(registry.snapshot()).encode(), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            # keep the console quiet, every scrape would print a line otherwise
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.server
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+
+# the registry used by the detector, TkinterApp.py and detect_cli.py
+METRICS = MetricsRegistry()
+span = METRICS.span
+timed = METRICS.timed
+
+# Opt-in profiling of a whole session: cProfile for CPU time and/or tracemalloc for memory.
+# stop() writes <prefix>.prof (open with `python -m pstats` or snakeviz) and <prefix>.memory.txt.
+class ProfileCapture:
+    def __init__(self, output_prefix, cpu=True, memory=False, top=30):
+        self.output_prefix = output_prefix
+        self.cpu = cpu
+        self.memory = memory
+        self.top = top
+        self.profiler = None
+
+    def start(self):
+        if self.cpu:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        if self.memory:
+            tracemalloc.start(25)
+        return self
+
+    def stop(self):
+        written = []
+        if self.profiler is not None:
+            self.profiler.disable()
+            path = self.output_prefix + ".prof"
+            pstats.Stats(self.profiler).dump_stats(path)
+            written.append(path)
+            self.profiler = None
+        if self.memory and tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            path = self.output_prefix + ".memory.txt"
+            with open(path, "w") as memory_file:
+                memory_file.write(f"current {current / 2**20:.1f} MiB, peak {peak / 2**20:.1f} MiB\n")
+                for statistic in snapshot.statistics("lineno")[:self.top]:
+                    memory_file.write(f"{statistic}\n")
+            written.append(path)
+        return written
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+        return False
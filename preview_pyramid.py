@@ -0,0 +1,73 @@
+# Preview pyramids for the canvases of TkinterApp.py.
+# A pyramid keeps an image at a few resolutions, every level half the size of the one before, down to
+# PYRAMID_MIN_SIDE. It is built once per image; a redraw takes the smallest level that still covers the
+# canvas and only resizes that one, so resizing the window never touches the full-resolution pixels.
+# load_preview builds the pyramid of an image file from the reduced-resolution decode of OpenCV (or the
+# strided view of a memory-mapped file, see tiling.py), so a large photo is on the canvas long before it
+# has been decoded at full resolution. It is meant to run on a worker thread: the levels are PIL images,
+# only the ImageTk.PhotoImage has to be made on the Tk thread.
+#
+#   source, preview, pyramid = load_preview("photo.jpg")     # on a worker thread
+#   image_pil = pyramid.level_for(canvas_width, canvas_height)
+import cv2
+from PIL import Image
+
+from metrics import span, timed
+from tiling import PREVIEW_MAX_SIDE, fit_to_side, open_image_source
+
+# the largest level is at most this long, the smallest one at least PYRAMID_MIN_SIDE
+PYRAMID_MAX_SIDE = PREVIEW_MAX_SIDE
+PYRAMID_MIN_SIDE = 200
+
+class PreviewPyramid:
+    def __init__(self, levels, full_size=None):
+        # PIL images, the largest first
+        self.levels = levels
+        # (width, height) of the full-resolution image the levels were made from
+        self.full_size = full_size or levels[0].size
+
+    # The smallest level at least as large as the image fitted into width x height. Like thumbnail the
+    # image is never enlarged; when the canvas is larger than the largest level, that level is returned.
+    def level_for(self, width, height):
+        full_width, full_height = self.full_size
+        scale = min(width / full_width, height / full_height, 1.0)
+        target_width, target_height = round(full_width * scale), round(full_height * scale)
+        for level in reversed(self.levels):
+            if level.width >= target_width and level.height >= target_height:
+                return level
+        return self.levels[0]
+
+# The pyramid of an RGB array, full_size is the size of the image the array is a preview of
+def build_pyramid(image_rgb, full_size=None, max_side=PYRAMID_MAX_SIDE, min_side=PYRAMID_MIN_SIDE):
+    with span("pyramid"):
+        level = fit_to_side(image_rgb, max_side)
+        levels = [Image.fromarray(level)]
+        while max(level.shape[:2]) // 2 >= min_side:
+            size = (max(1, level.shape[1] // 2), max(1, level.shape[0] // 2))
+            level = cv2.resize(level, size, interpolation=cv2.INTER_AREA)
+            levels.append(Image.fromarray(level))
+    return PreviewPyramid(levels, full_size or (image_rgb.shape[1], image_rgb.shape[0]))
+
+# Decode the preview of an image file and build its pyramid. Returns (source, preview, pyramid): the image
+# source (see tiling.py, None if only OpenCV can read the file), the BGR preview and its pyramid.
+# The preview is the full image when the image is not larger than max_side or has no image source.
+@timed()
+def load_preview(path, max_side=PYRAMID_MAX_SIDE):
+    try:
+        source = open_image_source(path)
+    except (OSError, ValueError):
+        source = None
+    if source is not None:
+        preview = source.read_preview(max_side)
+        full_size = (source.width, source.height)
+    else:
+        # without an image source the file is decoded at full resolution, that decode is the preview,
+        # so the caller does not have to decode it again
+        with span("decode"):
+            preview = cv2.imread(path)
+        if preview is None:
+            raise IOError(f"Cannot read image {path}")
+        full_size = (preview.shape[1], preview.shape[0])
+    with span("color convert"):
+        preview_rgb = cv2.cvtColor(fit_to_side(preview, max_side), cv2.COLOR_BGR2RGB)
+    return source, preview, build_pyramid(preview_rgb, full_size, max_side)
@@ -0,0 +1,171 @@
+# Projectiles of the side-scrolling game stored in preallocated NumPy arrays instead of one sprite each.
+# A bullet is a slot in the arrays (position, velocity, damage), the live bullets are always the first
+# `live` slots. Firing takes a slot from the pool, bullets that leave the camera view or the level go back
+# to it. All bullets share one cached surface, and moving, culling and collision checks are vectorized.
+#
+#   bullets = ProjectileManager(cooldown=5)
+#   bullets.fire(x, y, damage)                        # ignored while the fire cooldown runs
+#   bullets.update(view_left, view_right, world_width)
+#   for target, damage in bullets.collide(enemies_near_bullets).items(): ...
+import numpy as np
+import pygame
+
+BULLET_WIDTH = 10
+BULLET_HEIGHT = 5
+BULLET_SPEED = 10
+BULLET_COLOR = (255, 0, 0)
+# initial number of slots, the arrays double when they are full
+PROJECTILE_CAPACITY = 1024
+# ticks between two shots while SPACE is held
+FIRE_COOLDOWN_TICKS = 5
+# bullets this far outside the camera view are removed
+CULL_MARGIN = 50
+
+# one surface per bullet color, shared by all bullets
+surface_cache = {}
+
+def projectile_surface(color=BULLET_COLOR):
+    surface = surface_cache.get(color)
+    if surface is None:
+        surface = surface_cache[color] = pygame.Surface((BULLET_WIDTH, BULLET_HEIGHT))
+        surface.fill(color)
+    return surface
+
+class ProjectileManager:
+    def __init__(self, capacity=PROJECTILE_CAPACITY, cooldown=FIRE_COOLDOWN_TICKS, speed=BULLET_SPEED,
+                 color=BULLET_COLOR):
+        self.cooldown = cooldown
+        self.speed = speed
+        self.surface = projectile_surface(color)
+        self.x = np.zeros(capacity, dtype=np.float32)
+        self.y = np.zeros(capacity, dtype=np.float32)
+        self.velocity_x = np.zeros(capacity, dtype=np.float32)
+        self.damage = np.zeros(capacity, dtype=np.int32)
+        self.live = 0
+        # ticks until the next shot is allowed, the cooldown may be a fraction of ticks (see fire)
+        self.cooldown_left = 0
+
+    @property
+    def capacity(self):
+        return len(self.x)
+
+    # free slots in the pool
+    @property
+    def pooled(self):
+        return self.capacity - self.live
+
+    def __len__(self):
+        return self.live
+
+    def grow(self, needed):
+        capacity = self.capacity
+        while capacity < needed:
+            capacity *= 2
+        for name in ("x", "y", "velocity_x", "damage"):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self.live] = old[:self.live]
+            setattr(self, name, new)
+
+    # Add bullets without looking at the cooldown, x, y and damage may be scalars or arrays
+    def spawn(self, x, y, damage, velocity_x=None):
+        x = np.atleast_1d(np.asarray(x, dtype=np.float32))
+        count = len(x)
+        if self.live + count > self.capacity:
+            self.grow(self.live + count)
+        slots = slice(self.live, self.live + count)
+        self.x[slots] = x
+        self.y[slots] = y
+        self.velocity_x[slots] = self.speed if velocity_x is None else velocity_x
+        self.damage[slots] = damage
+        self.live += count
+
+    # Fire one bullet if the cooldown allows it, returns True if a bullet was fired
+    def fire(self, x, y, damage):
+        if self.cooldown_left > 0:
+            return False
+        self.spawn(x, y, damage)
+        # a cooldown that ran out during the last tick keeps the part of the tick it was overdue,
+        # so a fractional cooldown fires at its exact average rate
+        self.cooldown_left += self.cooldown
+        return True
+
+    # keep only the live bullets where keep is True, they move to the front of the arrays
+    def compact(self, keep):
+        live = int(np.count_nonzero(keep))
+        for array in (self.x, self.y, self.velocity_x, self.damage):
+            array[:live] = array[:self.live][keep]
+        self.live = live
+
+    def clear(self):
+        self.live = 0
+        self.cooldown_left = 0
+
+    # Move all bullets one tick and remove the ones outside the camera view (world x from view_left
+    # to view_right) or outside the level
+    def update(self, view_left, view_right, world_width):
+        if self.cooldown_left > 0:
+            self.cooldown_left -= 1
+        else:
+            # nothing was fired when the cooldown allowed it, the next shot starts a fresh cooldown
+            self.cooldown_left = 0
+        if self.live == 0:
+            return
+        x = self.x[:self.live]
+        x += self.velocity_x[:self.live]
+        keep = (x + BULLET_WIDTH > max(0, view_left - CULL_MARGIN)) & (x < min(world_width, view_right + CULL_MARGIN))
+        if not keep.all():
+            self.compact(keep)
+
+    # rect around all live bullets, used to find the sprites that can be hit
+    def bounding_rect(self):
+        if self.live == 0:
+            return pygame.Rect(0, 0, 0, 0)
+        x, y = self.x[:self.live], self.y[:self.live]
+        left, top = int(x.min()), int(y.min())
+        return pygame.Rect(left, top, int(x.max()) + BULLET_WIDTH - left, int(y.max()) + BULLET_HEIGHT - top)
+
+    # Bullets against the rects of the target sprites: returns {sprite: total damage} and removes every
+    # bullet that hit something. The bullets are sorted by x, so the bullets overlapping a target in x
+    # are found with searchsorted and only those pairs are checked in y.
+    def collide(self, targets):
+        if self.live == 0 or not targets:
+            return {}
+        rects = np.array([(sprite.rect.x, sprite.rect.y, sprite.rect.right, sprite.rect.bottom)
+                          for sprite in targets], dtype=np.float32)
+        order = np.argsort(self.x[:self.live], kind="stable")
+        sorted_x = self.x[:self.live][order]
+        # bullet x range overlapping the target: left - BULLET_WIDTH < x < right
+        first = np.searchsorted(sorted_x, rects[:, 0] - BULLET_WIDTH, side="right")
+        last = np.searchsorted(sorted_x, rects[:, 2], side="left")
+        counts = np.maximum(last - first, 0)
+        total = int(counts.sum())
+        if total == 0:
+            return {}
+        # one entry per (target, bullet) pair that overlaps in x
+        pair_targets = np.repeat(np.arange(len(targets)), counts)
+        pair_bullets = order[np.arange(total) + np.repeat(first - (np.cumsum(counts) - counts), counts)]
+        bullet_y = self.y[pair_bullets]
+        hits = (bullet_y + BULLET_HEIGHT > rects[pair_targets, 1]) & (bullet_y < rects[pair_targets, 3])
+        if not hits.any():
+            return {}
+        hit_targets, hit_bullets = pair_targets[hits], pair_bullets[hits]
+        damage = np.bincount(hit_targets, weights=self.damage[hit_bullets], minlength=len(targets))
+        keep = np.ones(self.live, dtype=bool)
+        keep[hit_bullets] = False
+        self.compact(keep)
+        return {targets[index]: int(damage[index]) for index in np.unique(hit_targets)}
+
+    # Draw all bullets with one blits call, offset is added to the world positions. With lag > 0 the bullets
+    # are drawn that part of a tick behind their position (render interpolation, bullets fly straight).
+    # Returns the screen rects of the bullets for dirty-rect updates.
+    def draw(self, screen, offset=(0, 0), lag=0.0):
+        if self.live == 0:
+            return []
+        x = self.x[:self.live]
+        if lag:
+            x = x - self.velocity_x[:self.live] * lag
+        xs = (x + offset[0]).astype(np.int32).tolist()
+        ys = (self.y[:self.live] + offset[1]).astype(np.int32).tolist()
+        surface = self.surface
+        return screen.blits([(surface, position) for position in zip(xs, ys)])
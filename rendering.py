@@ -0,0 +1,120 @@
+# Camera-aware renderer of the side-scrolling game.
+# Sprites are drawn at their world position plus the camera offset and only the sprites inside the viewport
+# are drawn (the game finds them with a spatial hash query, so the cost depends on what is visible, not on
+# the size of the level). Every group of sprites is drawn with one Surface.blits call.
+# While the camera does not move, only the areas that changed are redrawn: the rects drawn in the last
+# frame are covered with background again, and pygame.display.update gets the old and new rects instead of
+# flipping the whole screen. When the camera moves, the whole frame is redrawn and flipped.
+# The background is one image repeating over the whole level, or a list of segments (start x, image) where
+# every image repeats until the next segment starts.
+#
+#   offset = renderer.begin_frame(camera)
+#   renderer.draw_sprites(visible_sprites)
+#   renderer.add_rects(other_rects_drawn_on_the_screen)
+#   renderer.present()
+from bisect import bisect_right
+
+import pygame
+
+# with more changed rects than this, one flip is cheaper than updating every rect
+DIRTY_RECT_LIMIT = 200
+
+class Renderer:
+    def __init__(self, screen, background, dirty_rect_limit=DIRTY_RECT_LIMIT):
+        self.screen = screen
+        self.set_background(background)
+        self.screen_rect = screen.get_rect()
+        self.dirty_rect_limit = dirty_rect_limit
+        # camera offset of the last frame, None until the first frame
+        self.offset = None
+        self.full_redraw = True
+        self.full_frame = True
+        # screen rects drawn in this frame and in the previous one
+        self.drawn_rects = []
+        self.previous_rects = []
+        self.stats = {"frames": 0, "full_frames": 0, "dirty_frames": 0, "sprites_drawn": 0}
+
+    # background is a surface or a list of (world x, surface) segments ordered by x
+    def set_background(self, background):
+        self.segments = [(0, background)] if isinstance(background, pygame.Surface) else list(background)
+        self.segment_starts = [start_x for start_x, _ in self.segments]
+        self.full_redraw = True
+
+    # the next frame is drawn completely, e.g. after a message covered the screen
+    def invalidate(self):
+        self.full_redraw = True
+
+    # the part of the world that is visible with the current camera offset
+    @property
+    def view(self):
+        return self.screen_rect.move(-self.offset[0], -self.offset[1])
+
+    # Cover a screen rect with the background, which repeats horizontally and scrolls with the camera.
+    # The first segment also covers the world left of it, the last one everything right of it.
+    def blit_background(self, rect):
+        offset_x = self.offset[0]
+        segments = self.segments
+        index = max(bisect_right(self.segment_starts, rect.left - offset_x) - 1, 0)
+        while index < len(segments):
+            start_x, image = segments[index]
+            left = rect.left if index == 0 else max(rect.left, start_x + offset_x)
+            right = rect.right if index == len(segments) - 1 else min(rect.right, segments[index + 1][0] + offset_x)
+            if left >= rect.right:
+                break
+            part = pygame.Rect(left, rect.top, right - left, rect.height)
+            width, height = image.get_size()
+            # the tiles of the segment start at its start x
+            tile_x = left - (left - start_x - offset_x) % width
+            while tile_x < right:
+                area = part.clip(pygame.Rect(tile_x, 0, width, height))
+                if area:
+                    self.screen.blit(image, area.topleft, area.move(-tile_x, 0))
+                tile_x += width
+            index += 1
+
+    # Start a frame with the offset of the camera (or offset, e.g. interpolated between two ticks): a full
+    # background if the camera moved or the last frame changed too many rects, otherwise only the rects of
+    # the last frame are covered. Returns the offset.
+    def begin_frame(self, camera, offset=None):
+        offset = offset or camera.camera.topleft
+        self.full_frame = (self.full_redraw or offset != self.offset
+                           or len(self.previous_rects) > self.dirty_rect_limit)
+        self.offset = offset
+        self.full_redraw = False
+        if self.full_frame:
+            self.blit_background(self.screen_rect)
+        else:
+            for rect in self.previous_rects:
+                self.blit_background(rect)
+        self.drawn_rects = []
+        return offset
+
+    # Draw sprites at their camera position with one blits call, sprites outside the viewport are skipped.
+    # rects maps sprites to the world rect they are drawn at instead of their rect (render interpolation).
+    def draw_sprites(self, sprites, rects=None):
+        offset_x, offset_y = self.offset
+        screen_rect = self.screen_rect
+        batch = []
+        for sprite in sprites:
+            rect = (rects.get(sprite, sprite.rect) if rects else sprite.rect).move(offset_x, offset_y)
+            if screen_rect.colliderect(rect):
+                batch.append((sprite.image, rect))
+        if batch:
+            self.drawn_rects.extend(self.screen.blits(batch))
+            self.stats["sprites_drawn"] += len(batch)
+
+    # rects drawn on the screen without draw_sprites (health bars, bullets, text)
+    def add_rects(self, rects):
+        self.drawn_rects.extend(rects)
+
+    # Show the frame: flip after a full redraw, otherwise update only the old and new rects
+    def present(self):
+        self.stats["frames"] += 1
+        dirty = self.previous_rects + self.drawn_rects
+        if self.full_frame or len(dirty) > self.dirty_rect_limit:
+            pygame.display.flip()
+            self.stats["full_frames"] += 1
+        else:
+            pygame.display.update(dirty)
+            self.stats["dirty_frames"] += 1
+        self.previous_rects = self.drawn_rects
@@ -0,0 +1,105 @@
+# Headless replay of recorded sessions of the side-scrolling game (PygameQ2_02.py).
+# A session recorded with `python PygameQ2_02.py --record session.ssil` is played back tick by tick with
+# the SDL dummy drivers and as fast as possible: the game gets the recorded seed, tick rate and keys of
+# every tick, so it goes through the same states as the session. At the end the state (score, lives,
+# level, completion, player position) must match the state of the recording, otherwise the replay fails.
+# The time of every tick and of its phases is measured, so a frame spike of a recorded session can be
+# reproduced and a set of recordings works as a performance regression test (--budget-ms).
+#
+#   python replay.py session.ssil --draw --timings ticks.csv
+#   python replay.py sessions/*.ssil --budget-ms 4
+import argparse
+import csv
+import sys
+import time
+
+import pygame
+
+import PygameQ2_02 as game
+from input_log import STATE_FIELDS, load_log
+
+PHASES = ("input", "player", "streaming", "enemies", "collisions", "level", "draw")
+# the slowest ticks shown in the report
+WORST_TICKS = 5
+
+# Play an input log back in a new headless game. Returns the final state and one row per tick:
+# (tick, total seconds, {phase: seconds}). With draw=True every tick is also drawn, like in the game.
+def replay(log, draw=False):
+    game.init_game(headless=True)
+    # levels change at once, as in the game without the transition messages
+    game.scene_manager = None
+    game.set_tick_rate(log.tick_rate)
+    game.new_game(seed=log.seed)
+    rows = []
+    for tick, pressed in enumerate(log.key_sets()):
+        phase_times = {}
+        start_time = time.perf_counter()
+        game.simulate_tick(game.KeyState(pressed), phase_times)
+        if draw:
+            draw_start = time.perf_counter()
+            game.draw_frame()
+            game.renderer.present()
+            phase_times["draw"] = time.perf_counter() - draw_start
+        rows.append((tick, time.perf_counter() - start_time, phase_times))
+    return game.game_state(), rows
+
+# the fields where state differs from the expected state, as "field: expected != got" lines
+def state_differences(expected, state):
+    return [f"{field}: expected {expected[field]}, got {state[field]}" for field in STATE_FIELDS
+            if expected[field] != state[field]]
+
+def write_timings(path, rows):
+    with open(path, "w", newline="") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(["tick", "total_ms"] + [f"{phase}_ms" for phase in PHASES])
+        for tick, seconds, phase_times in rows:
+            writer.writerow([tick, f"{seconds * 1000:.4f}"]
+                            + [f"{phase_times.get(phase, 0.0) * 1000:.4f}" for phase in PHASES])
+
+# the tick time below which `percent` percent of the ticks are, in milliseconds
+def percentile_ms(sorted_seconds, percent):
+    if not sorted_seconds:
+        return 0.0
+    index = min(len(sorted_seconds) - 1, int(len(sorted_seconds) * percent / 100))
+    return sorted_seconds[index] * 1000
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded sessions of the side-scrolling game headless")
+    parser.add_argument("logs", nargs="+", help="input logs recorded with PygameQ2_02.py --record")
+    parser.add_argument("--draw", action="store_true", help="also draw every tick")
+    parser.add_argument("--timings", default=None, help="write the time of every tick to this CSV file")
+    parser.add_argument("--budget-ms", type=float, default=None,
+                        help="fail if the 99th percentile tick time is above this many milliseconds")
+    args = parser.parse_args(argv)
+
+    failed = False
+    for path in args.logs:
+        log = load_log(path)
+        start_time = time.perf_counter()
+        state, rows = replay(log, args.draw)
+        wall_time = time.perf_counter() - start_time
+        tick_seconds = sorted(seconds for _, seconds, _ in rows)
+        p99 = percentile_ms(tick_seconds, 99)
+        print(f"{path}: {log.ticks} ticks in {wall_time:.2f} s ({log.ticks / max(wall_time, 1e-9):.0f} ticks/sec), "
+              f"tick p50 {percentile_ms(tick_seconds, 50):.3f} ms, p99 {p99:.3f} ms, "
+              f"max {percentile_ms(tick_seconds, 100):.3f} ms")
+        for tick, seconds, phase_times in sorted(rows, key=lambda row: row[1], reverse=True)[:WORST_TICKS]:
+            phases = ", ".join(f"{phase} {phase_times[phase] * 1000:.2f}" for phase in PHASES if phase in phase_times)
+            print(f"  tick {tick}: {seconds * 1000:.3f} ms ({phases})")
+        differences = state_differences(log.final, state)
+        if differences:
+            failed = True
+            print(f"  FAILED, the final state differs from the recording: {'; '.join(differences)}")
+        else:
+            print(f"  final state matches: {', '.join(f'{field} {state[field]}' for field in STATE_FIELDS)}")
+        if args.budget_ms is not None and p99 > args.budget_ms:
+            failed = True
+            print(f"  FAILED, p99 tick time {p99:.3f} ms is above the budget of {args.budget_ms} ms")
+        if args.timings:
+            timings_path = args.timings if len(args.logs) == 1 else f"{path}.ticks.csv"
+            write_timings(timings_path, rows)
+    pygame.quit()
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
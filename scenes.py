@@ -0,0 +1,167 @@
+# Scenes of the side-scrolling game and the loop that drives them.
+# Exactly one scene is active; every frame the scene manager passes the events to it, updates it once
+# and draws it. Scenes switch by handing the manager the next scene, so replaying never recurses into the
+# game loop and nothing blocks the loop: a transition screen adds up the measured frame times instead of
+# waiting with pygame.time.delay, and builds the next level a few milliseconds per frame while its message is shown.
+#
+#   manager = SceneManager()
+#   manager.switch(TransitionScene(screen, font, [("Level 1 Start", 2000)], build_level(1), on_done=play))
+#   manager.run(clock, FPS)
+#
+# font is a pygame font or anything with the same render method, e.g. the text cache of hud.py, so the
+# messages are rendered once and not again for every transition.
+import time
+
+import pygame
+
+WHITE = (255, 255, 255)
+BLACK = (0, 0, 0)
+# milliseconds a transition message takes to fade in
+FADE_IN_MS = 300
+# milliseconds per frame a transition may spend building the next level
+BUILD_BUDGET_MS = 4
+# a longer frame counts as this long in a transition, so a stall does not skip a message
+MAX_TRANSITION_STEP_MS = 100
+
+class Scene:
+    manager = None
+
+    # called when the scene becomes the active one
+    def enter(self):
+        pass
+
+    def handle_event(self, event):
+        pass
+
+    # one frame of the scene's logic
+    def update(self):
+        pass
+
+    def draw(self):
+        pass
+
+    # show the drawn frame
+    def present(self):
+        pygame.display.flip()
+
+class SceneManager:
+    def __init__(self):
+        self.scene = None
+        self.running = True
+        # milliseconds the last frame took, scenes with a fixed timestep run the simulation for this long
+        self.frame_ms = 1000 / 60
+
+    def switch(self, scene):
+        scene.manager = self
+        self.scene = scene
+        scene.enter()
+
+    def quit(self):
+        self.running = False
+
+    # The game loop: events, one update and one frame per tick until a scene quits or the window is closed
+    def run(self, clock, fps):
+        while self.running:
+            self.frame_ms = clock.tick(fps)
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    self.quit()
+                else:
+                    self.scene.handle_event(event)
+            scene = self.scene
+            scene.update()
+            # update() may have switched to another scene, which draws from the next frame on
+            if scene is self.scene:
+                scene.draw()
+                scene.present()
+
+# draw text centered on the screen, dy moves it down from the center
+def draw_centered(screen, text_surface, dy=0):
+    screen.blit(text_surface, (screen.get_width() // 2 - text_surface.get_width() // 2,
+                               screen.get_height() // 2 - text_surface.get_height() // 2 + dy))
+
+# A message screen between levels. pages is a list of (message, milliseconds) shown one after the other.
+# builder is an iterator (e.g. a generator that builds the next level); it is advanced for at most
+# BUILD_BUDGET_MS per frame, and the scene ends when all pages were shown and the builder is exhausted.
+class TransitionScene(Scene):
+    def __init__(self, screen, font, pages, builder=None, on_done=None):
+        self.screen = screen
+        self.pages = [(font.render(message, True, WHITE), duration) for message, duration in pages]
+        self.builder = builder
+        self.on_done = on_done
+        self.elapsed_ms = 0.0
+
+    def build_step(self):
+        deadline = time.perf_counter() + BUILD_BUDGET_MS / 1000
+        while self.builder is not None and time.perf_counter() < deadline:
+            try:
+                next(self.builder)
+            except StopIteration:
+                self.builder = None
+
+    def update(self):
+        self.build_step()
+        # the real length of the frame as measured by the scene manager, so the pages last as long at any FPS
+        self.elapsed_ms += min(self.manager.frame_ms, MAX_TRANSITION_STEP_MS)
+        if self.elapsed_ms >= sum(duration for _, duration in self.pages):
+            # the messages are over: finish the level if the budget was too small (only on very slow machines)
+            if self.builder is not None:
+                for _ in self.builder:
+                    pass
+                self.builder = None
+            if self.on_done is not None:
+                self.on_done()
+
+    def draw(self):
+        self.screen.fill(BLACK)
+        start_ms = 0.0
+        for text, duration in self.pages:
+            if self.elapsed_ms < start_ms + duration:
+                text.set_alpha(min(255, int(255 * (self.elapsed_ms - start_ms) / FADE_IN_MS)))
+                draw_centered(self.screen, text)
+                # the text surface may be shared by a text cache
+                text.set_alpha(255)
+                return
+            start_ms += duration
+
+# A screen of text lines with key bindings, e.g. {pygame.K_r: replay, pygame.K_q: quit}
+class MenuScene(Scene):
+    def __init__(self, screen, font, lines, actions):
+        self.screen = screen
+        self.texts = [font.render(line, True, WHITE) for line in lines]
+        self.actions = actions
+
+    def handle_event(self, event):
+        if event.type == pygame.KEYDOWN and event.key in self.actions:
+            self.actions[event.key]()
+
+    def draw(self):
+        self.screen.fill(BLACK)
+        for index, text in enumerate(self.texts):
+            draw_centered(self.screen, text, (index - len(self.texts) / 2) * 60 + 30)
+
+# Pause over another scene: the last frame of the paused scene stays below a dark overlay and the scene
+# is not updated, one of resume_keys goes back to it
+class PauseScene(Scene):
+    def __init__(self, screen, font, paused_scene, resume_keys=(pygame.K_p, pygame.K_ESCAPE)):
+        self.screen = screen
+        self.paused_scene = paused_scene
+        self.resume_keys = resume_keys
+        self.text = font.render("Paused - press P to continue", True, WHITE)
+        self.overlay = pygame.Surface(screen.get_size())
+        self.overlay.fill(BLACK)
+        self.overlay.set_alpha(160)
+        self.frozen_frame = None
+
+    def enter(self):
+        # the paused frame does not change, it is copied once instead of being drawn again every frame
+        self.frozen_frame = self.screen.copy()
+
+    def handle_event(self, event):
+        if event.type == pygame.KEYDOWN and event.key in self.resume_keys:
+            self.manager.switch(self.paused_scene)
+
+    def draw(self):
+        self.screen.blit(self.frozen_frame, (0, 0))
+        self.screen.blit(self.overlay, (0, 0))
+        draw_centered(self.screen, self.text)
@@ -0,0 +1,194 @@
+# Sliced (tiled) inference for very large images.
+# A large image is split into overlapping tiles of the model input size, the tiles go through the model
+# in batches and the boxes of all tiles are merged with one cross-tile NMS. Small objects keep their
+# size in pixels instead of vanishing when the whole image is scaled down to 640 px.
+#
+# Images are read through an image source that only touches the pixels of the requested tile where the
+# format allows it: .npy arrays and uncompressed 24-bit BMP files are memory-mapped, other formats are
+# decoded once. Previews for the canvas come from a strided view of the memory map or from the
+# reduced-resolution decode of OpenCV, never from the full-resolution image.
+import os
+import struct
+import threading
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from inference_backends import IOU_THRESHOLD, Detections, batched_non_max_suppression, empty_detections
+from metrics import span
+
+# images with a side longer than this are detected tile by tile
+SLICE_MIN_SIDE = 4000
+TILE_SIZE = 640
+# fraction of a tile that overlaps with its neighbour, objects cut by one tile are whole in the next
+TILE_OVERLAP = 0.2
+TILE_BATCH_SIZE = 8
+# longest side of the preview shown on the canvas
+PREVIEW_MAX_SIDE = 1600
+
+# Image.MAX_IMAGE_PIXELS is global to PIL, sources are opened on several decode threads at once, so the
+# pixel limit is only lifted and put back while this lock is held, see DecodedFileSource
+PIXEL_LIMIT_LOCK = threading.Lock()
+
+# EXIF orientation tag and the cv2 operations that turn stored pixels upright, see orient
+EXIF_ORIENTATION = 0x0112
+ORIENTATIONS = {
+    2: lambda image: cv2.flip(image, 1),
+    3: lambda image: cv2.rotate(image, cv2.ROTATE_180),
+    4: lambda image: cv2.flip(image, 0),
+    5: lambda image: cv2.transpose(image),
+    6: lambda image: cv2.rotate(image, cv2.ROTATE_90_CLOCKWISE),
+    7: lambda image: cv2.flip(cv2.transpose(image), -1),
+    8: lambda image: cv2.rotate(image, cv2.ROTATE_90_COUNTERCLOCKWISE),
+}
+
+# the stored pixels of an image turned upright according to its EXIF orientation (1 is already upright)
+def orient(image, orientation):
+    transform = ORIENTATIONS.get(orientation)
+    return image if transform is None else transform(image)
+
+# Top-left corners and sizes (x, y, width, height) of overlapping tiles covering the whole image,
+# the last row and column are moved back so that they end exactly at the image border
+def tile_grid(width, height, tile_size=TILE_SIZE, overlap=TILE_OVERLAP):
+    step = max(1, int(tile_size * (1 - overlap)))
+
+    def starts(length):
+        positions = list(range(0, max(length - tile_size, 0) + 1, step))
+        if positions[-1] + tile_size < length:
+            positions.append(length - tile_size)
+        return positions
+
+    return [(x, y, min(tile_size, width - x), min(tile_size, height - y))
+            for y in starts(height) for x in starts(width)]
+
+# resize an image so that its longest side is at most max_side
+def fit_to_side(image, max_side):
+    scale = max_side / max(image.shape[:2])
+    if scale >= 1:
+        return image
+    size = (max(1, round(image.shape[1] * scale)), max(1, round(image.shape[0] * scale)))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+# Image source backed by an (H, W, 3) BGR array, in memory or memory-mapped
+class ArraySource:
+    def __init__(self, array, path=None):
+        self.array = array
+        self.path = path
+        self.height, self.width = array.shape[:2]
+
+    def read_tile(self, x, y, width, height):
+        with span("decode"):
+            return np.ascontiguousarray(self.array[y:y + height, x:x + width])
+
+    # every step-th pixel is read, so a memory-mapped file is only touched on the rows of the preview
+    def read_preview(self, max_side=PREVIEW_MAX_SIDE):
+        with span("decode"):
+            step = max(1, max(self.width, self.height) // (2 * max_side))
+            preview = np.ascontiguousarray(self.array[::step, ::step])
+        return fit_to_side(preview, max_side)
+
+# Image source for formats without random access (JPEG, PNG, compressed TIFF, ...).
+# The size and EXIF orientation come from the header, the full image is decoded once on the first tile
+# and the preview uses the reduced-resolution decode of OpenCV. Both are decoded without the automatic
+# rotation of OpenCV and turned upright here, so width and height always match the pixels of the tiles.
+class DecodedFileSource:
+    REDUCED_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                     (2, cv2.IMREAD_REDUCED_COLOR_2), (1, cv2.IMREAD_COLOR))
+
+    def __init__(self, path):
+        self.path = path
+        # the inspection images are far above the pixel limit PIL uses to protect against decompression
+        # bombs, the limit is lifted only while the header is read, PIL never decodes these pixels
+        with PIXEL_LIMIT_LOCK:
+            pixel_limit, Image.MAX_IMAGE_PIXELS = Image.MAX_IMAGE_PIXELS, None
+            try:
+                with Image.open(path) as image:
+                    width, height = image.size
+                    self.orientation = image.getexif().get(EXIF_ORIENTATION, 1)
+            finally:
+                Image.MAX_IMAGE_PIXELS = pixel_limit
+        # orientations 5 to 8 turn the image by 90 degrees
+        self.width, self.height = (height, width) if self.orientation in (5, 6, 7, 8) else (width, height)
+        self.array = None
+
+    def imread(self, flag):
+        with span("decode"):
+            image = cv2.imread(self.path, flag | cv2.IMREAD_IGNORE_ORIENTATION)
+        if image is None:
+            raise IOError(f"Cannot read image {self.path}")
+        return orient(image, self.orientation)
+
+    def read_tile(self, x, y, width, height):
+        if self.array is None:
+            self.array = self.imread(cv2.IMREAD_COLOR)
+        return np.ascontiguousarray(self.array[y:y + height, x:x + width])
+
+    def read_preview(self, max_side=PREVIEW_MAX_SIDE):
+        if self.array is not None:
+            return fit_to_side(self.array, max_side)
+        # the largest reduction that still gives at least max_side pixels
+        longest_side = max(self.width, self.height)
+        flag = next(flag for factor, flag in self.REDUCED_FLAGS if longest_side / factor >= max_side or factor == 1)
+        return fit_to_side(self.imread(flag), max_side)
+
+# Memory map an uncompressed 24-bit BMP file as an (H, W, 3) BGR array, None if the file is another kind of BMP
+def memory_map_bmp(path):
+    with open(path, "rb") as bmp_file:
+        header = bmp_file.read(34)
+    if len(header) < 34 or header[:2] != b"BM":
+        return None
+    data_offset = struct.unpack_from("<I", header, 10)[0]
+    width, height = struct.unpack_from("<ii", header, 18)
+    bits_per_pixel, compression = struct.unpack_from("<HI", header, 28)
+    if bits_per_pixel != 24 or compression != 0:
+        return None
+    # every row is padded to a multiple of 4 bytes, rows are stored bottom-up unless the height is negative
+    row_bytes = (width * 3 + 3) // 4 * 4
+    rows = np.memmap(path, dtype=np.uint8, mode="r", offset=data_offset, shape=(abs(height), row_bytes))
+    pixels = rows[:, :width * 3].reshape(abs(height), width, 3)
+    return pixels[::-1] if height > 0 else pixels
+
+# The image source of a file: memory-mapped where the format allows it, decoded otherwise
+def open_image_source(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".npy":
+        return ArraySource(np.load(path, mmap_mode="r"), path)
+    if extension == ".bmp":
+        pixels = memory_map_bmp(path)
+        if pixels is not None:
+            return ArraySource(pixels, path)
+    return DecodedFileSource(path)
+
+# should this image be detected tile by tile?
+def needs_slicing(source, min_side=SLICE_MIN_SIDE):
+    return max(source.width, source.height) > min_side
+
+# Detect objects tile by tile with an inference backend, returns Detections in full-resolution pixels
+def sliced_predict(backend, source, tile_size=TILE_SIZE, overlap=TILE_OVERLAP, batch_size=TILE_BATCH_SIZE,
+                   iou=IOU_THRESHOLD):
+    tiles = tile_grid(source.width, source.height, tile_size, overlap)
+    boxes, scores, class_ids = [], [], []
+    for start in range(0, len(tiles), batch_size):
+        batch_tiles = tiles[start:start + batch_size]
+        images = [source.read_tile(*tile) for tile in batch_tiles]
+        for (x, y, _, _), detections in zip(batch_tiles, backend.predict(images)):
+            if len(detections.boxes):
+                boxes.append(detections.boxes + np.array([x, y, x, y], dtype=np.float32))
+                scores.append(detections.scores)
+                class_ids.append(detections.class_ids)
+    if not boxes:
+        return empty_detections()
+    boxes, scores, class_ids = np.concatenate(boxes), np.concatenate(scores), np.concatenate(class_ids)
+    # objects in the overlap of two tiles were found twice, cross-tile NMS keeps the best box
+    with span("nms"):
+        keep = batched_non_max_suppression(boxes, scores, class_ids, iou)
+    return Detections(boxes[keep], scores[keep], class_ids[keep])
+
+# Detections with boxes scaled by factor, e.g. from full resolution to the preview
+def scale_detections(detections, factor):
+    return Detections(detections.boxes * factor, detections.scores, detections.class_ids)
+
+# ratio between the preview and the full-resolution image
+def preview_scale(source, preview):
+    return preview.shape[1] / source.width if source.width else 1.0